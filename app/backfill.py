@@ -0,0 +1,252 @@
+'''从JSON Lines或CSV文件批量导入用户和工会数据
+
+文件中每条数据的格式与update_user_data和update_clan_data的参数相同，包含account_id的为用户数据，包含clan_id的为工会数据:
+    JSON Lines: 每行一条数据
+    CSV: 第一行为表头，列名为数据中的字段路径，例如region_id, account_id, basic.nickname, info.is_active, clan.id，
+         可用的列见app/utils/payload_utils.py中的COLUMNS，空值视为None，某一部分的列全部为空时该部分为None，
+         每条数据需要在同一行内
+
+文件按行读取，每chunk_size条数据为一块，由多个线程并行写入，等待写入的块数有上限，内存占用与文件大小无关
+
+已经写入的位置保存在检查点文件中(默认为输入文件加.checkpoint后缀)，中断后重新运行会从检查点继续，
+检查点只会推进到连续写入完成的块，重新运行时可能会重复写入少量数据
+
+在项目根目录运行:
+    python -m app.backfill users.jsonl --chunk-size 1000 --workers 4
+'''
+import os
+import csv
+import json
+import time
+import queue
+import argparse
+import threading
+
+from app.db import DatabaseConnection, bulk_update_data, RecordIsolator
+from app.utils.payload_utils import COLUMNS, CURRENT_VERSION
+
+# CSV中按字符串读取的列，其余列按JSON解析(数字、true/false)
+CSV_STRING_COLUMNS = {'basic.nickname', 'basic.tag', 'clan.tag'}
+
+
+def get_data_type(data: dict) -> str:
+    if 'account_id' in data:
+        return 'user'
+    if 'clan_id' in data:
+        return 'clan'
+    raise ValueError(f'Unknown record: {data}')
+
+def parse_csv_value(column: str, value: str):
+    if value == '':
+        return None
+    if column in CSV_STRING_COLUMNS:
+        return value
+    return json.loads(value)
+
+def parse_csv_row(header: list, row: list) -> dict:
+    "将CSV的一行转换为与任务参数相同格式的数据"
+    values = {column: parse_csv_value(column, value) for column, value in zip(header, row)}
+    data_type = 'user' if 'account_id' in values and values['account_id'] is not None else 'clan'
+    data = {}
+    for path in COLUMNS[CURRENT_VERSION][data_type]:
+        column = '.'.join(path)
+        if len(path) == 1:
+            data[path[0]] = values.get(column)
+            continue
+        section = data.setdefault(path[0], {})
+        section[path[1]] = values.get(column)
+    for section in [key for key, value in data.items() if isinstance(value, dict)]:
+        if all(value is None for value in data[section].values()):
+            data[section] = None
+    return data
+
+
+class Checkpoint:
+    '''检查点文件，记录已经写入完成的字节位置
+
+    格式为{'path': 输入文件, 'offset': 字节位置, 'records': 已写入的数据条数}，通过临时文件替换保证写入是原子的
+    '''
+    def __init__(self, path: str, input_path: str):
+        self.path = path
+        self.input_path = os.path.abspath(input_path)
+
+    def load(self) -> tuple:
+        "返回(offset, records)，没有检查点时返回(0, 0)"
+        if not os.path.exists(self.path):
+            return 0, 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state['path'] != self.input_path:
+            raise ValueError(f"Checkpoint {self.path} belongs to {state['path']}")
+        return state['offset'], state['records']
+
+    def save(self, offset: int, records: int):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'path': self.input_path, 'offset': offset, 'records': records}, f)
+        os.replace(temp_path, self.path)
+
+
+class BackfillLoader:
+    '''读取文件并分块写入
+
+    一个读取线程按行读取并分块放入有界队列，workers个写入线程从队列取出后调用bulk_update_data写入，
+    批量写入失败时和WriteBatcher一样逐条写入，失败的数据转入死信存储；逐条写入也失败时(例如数据库不可用)停止导入
+
+    每块写入完成后，将检查点推进到最后一个连续完成的块的结束位置
+    '''
+    def __init__(self, input_path: str, checkpoint_path: str = None, chunk_size: int = 1000, workers: int = 4):
+        self.input_path = input_path
+        self.checkpoint = Checkpoint(checkpoint_path or input_path + '.checkpoint', input_path)
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.is_csv = input_path.lower().endswith('.csv')
+        self.__queue = queue.Queue(maxsize=workers * 2)
+        self.__stop = threading.Event()
+        self.__lock = threading.Lock()
+        self.__pending = {}     # 已经读取但还没有写入完成的块，{index: 结束位置}
+        self.__finished = {}    # 已经写入完成但之前还有未完成的块，{index: 数据条数}
+        self.__next_index = 0   # 下一个需要推进检查点的块
+        self.__offset = 0
+        self.__records = 0
+        self.__error = None
+        self.__stats = {
+            'chunks': 0,
+            'records': 0,
+            'isolated': 0,
+            'dead_letters': 0
+        }
+
+    def run(self) -> dict:
+        self.__offset, self.__records = self.checkpoint.load()
+        start_offset = self.__offset
+        start_time = time.perf_counter()
+        writers = [threading.Thread(target=self.__write_loop, daemon=True) for _ in range(self.workers)]
+        for writer in writers:
+            writer.start()
+        try:
+            self.__read(start_offset)
+        finally:
+            for _ in writers:
+                self.__queue.put(None)
+            for writer in writers:
+                writer.join()
+        if self.__error:
+            raise self.__error
+        return {
+            **self.__stats,
+            'start_offset': start_offset,
+            'offset': self.__offset,
+            'total_records': self.__records,
+            'seconds': round(time.perf_counter() - start_time, 3)
+        }
+
+    def __read(self, start_offset: int):
+        with open(self.input_path, 'rb') as f:
+            header = None
+            if self.is_csv:
+                header = next(csv.reader([f.readline().decode('utf-8-sig')]))
+                start_offset = max(start_offset, f.tell())
+            f.seek(start_offset)
+            self.__offset = start_offset
+            index = 0
+            user_datas = []
+            clan_datas = []
+            while not self.__stop.is_set():
+                line = f.readline()
+                if line.strip():
+                    text = line.decode('utf-8')
+                    if self.is_csv:
+                        data = parse_csv_row(header, next(csv.reader([text])))
+                    else:
+                        data = json.loads(text)
+                    if get_data_type(data) == 'user':
+                        user_datas.append(data)
+                    else:
+                        clan_datas.append(data)
+                if len(user_datas) + len(clan_datas) >= self.chunk_size or (not line and (user_datas or clan_datas)):
+                    with self.__lock:
+                        self.__pending[index] = f.tell()
+                    self.__put((index, user_datas, clan_datas))
+                    index += 1
+                    user_datas = []
+                    clan_datas = []
+                if not line:
+                    break
+
+    def __put(self, item: tuple):
+        "队列已满时等待，导入停止时放弃"
+        while not self.__stop.is_set():
+            try:
+                self.__queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def __write_loop(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            if self.__stop.is_set():
+                continue
+            index, user_datas, clan_datas = item
+            try:
+                self.__write(user_datas, clan_datas)
+            except Exception as e:
+                self.__error = e
+                self.__stop.set()
+                continue
+            self.__finish(index, len(user_datas) + len(clan_datas))
+
+    def __write(self, user_datas: list, clan_datas: list):
+        result = bulk_update_data(user_datas, clan_datas)
+        if result.get('code', None) != 1000:
+            result = RecordIsolator.write(user_datas, clan_datas)
+            if result.get('code', None) != 1000 and not RecordIsolator.is_partial(result):
+                raise RuntimeError(f'Backfill write failed: {result}')
+            with self.__lock:
+                self.__stats['isolated'] += 1
+                self.__stats['dead_letters'] += result['data']['dead_letters']
+
+    def __finish(self, index: int, records: int):
+        "记录完成的块，并将检查点推进到连续完成的位置"
+        with self.__lock:
+            self.__stats['chunks'] += 1
+            self.__stats['records'] += records
+            self.__finished[index] = records
+            advanced = False
+            while self.__next_index in self.__finished:
+                self.__records += self.__finished.pop(self.__next_index)
+                self.__offset = self.__pending.pop(self.__next_index)
+                self.__next_index += 1
+                advanced = True
+            if advanced:
+                self.checkpoint.save(self.__offset, self.__records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill user and clan records from a JSON Lines or CSV file')
+    parser.add_argument('input', help='JSON Lines file, or CSV file with a .csv suffix')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file, defaults to <input>.checkpoint')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start from the beginning')
+    args = parser.parse_args()
+
+    loader = BackfillLoader(args.input, args.checkpoint, args.chunk_size, args.workers)
+    if args.restart and os.path.exists(loader.checkpoint.path):
+        os.remove(loader.checkpoint.path)
+    DatabaseConnection.init_pool()
+    try:
+        result = loader.run()
+    finally:
+        DatabaseConnection.close_pool()
+    print(
+        f"records: {result['records']}  chunks: {result['chunks']}  dead letters: {result['dead_letters']}  "
+        f"offset: {result['start_offset']} -> {result['offset']}  seconds: {result['seconds']}"
+    )
+
+
+if __name__ == '__main__':
+    main()
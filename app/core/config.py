@@ -4,6 +4,13 @@ from pydantic_settings import BaseSettings
 
 class LoadConfig(BaseSettings):
     LOG_PATH: str
+    # 错误日志
+    LOG_QUEUE_SIZE: int = 10000           # 等待写入的日志数量上限，超过后丢弃
+    LOG_BATCH_SIZE: int = 200             # 每次最多写入的日志数量
+    LOG_FLUSH_INTERVAL: float = 1         # 后台线程检查队列的间隔(秒)
+    LOG_FILE_MAX_BYTES: int = 50 * 1024 * 1024
+    LOG_ARGS_MAX_LENGTH: int = 2000       # 记录的参数最大长度
+    LOG_INFO_MAX_LENGTH: int = 20000      # 记录的错误信息最大长度
 
     MYSQL_HOST: str
     MYSQL_PORT: int
@@ -18,6 +25,88 @@ class LoadConfig(BaseSettings):
     RABBITMQ_USERNAME: str
     RABBITMQ_PASSWORD: str
 
+    # prometheus指标，端口为0时不启动
+    METRICS_HOST: str = '127.0.0.1'
+    METRICS_PORT: int = 9108
+    METRICS_PORT_RANGE: int = 10  # 端口被占用时(同一台机器上的多个worker)依次尝试之后的端口，最多尝试的端口数量
+
+    # MySQL连接池
+    MYSQL_POOL_SIZE: int = 20         # 最大连接数
+    MYSQL_POOL_MIN_CACHED: int = 2    # 初始化时创建的空闲连接数
+    MYSQL_POOL_MAX_CACHED: int = 10   # 最多保留的空闲连接数
+    MYSQL_POOL_TIMEOUT: float = 30    # 等待连接的超时时间(秒)
+    MYSQL_POOL_PING: int = 1          # 连接可用性检查，0不检查，1每次取出时检查
+    MYSQL_POOL_MAX_USAGE: int = 10000 # 单个连接最多使用的次数，超过后重新建立连接，0为不限制
+
+    # 按数据库延迟自适应限制同时进行的事务数量，每DB_LIMIT_WINDOW个事务调整一次上限
+    DB_LIMIT_ENABLED: bool = True
+    DB_LIMIT_MIN: int = 2
+    DB_LIMIT_MAX: int = 0                   # 为0时等于MYSQL_POOL_SIZE
+    DB_LIMIT_TARGET_LATENCY: float = 1.0    # 从取出连接到提交的平均耗时(秒)超过该值时下调上限
+    DB_LIMIT_ERROR_RATE: float = 0.05       # OperationalError的比例超过该值时下调上限
+    DB_LIMIT_WINDOW: int = 50
+    DB_LIMIT_DECREASE: float = 0.7          # 下调时上限乘以该系数
+
+    # worker内用户快照缓存
+    USER_CACHE_SIZE: int = 100000
+    USER_CACHE_TTL: int = 600
+    # worker内工会缓存
+    CLAN_CACHE_SIZE: int = 20000
+    CLAN_CACHE_TTL: int = 3600
+    # 数据没有变化时，刷新user_info和user_clan中updated_at的最小间隔(秒)，为0时每次都会刷新
+    USER_TOUCH_INTERVAL: int = 3600
+
+    # 跨任务合并写入，达到WRITE_BATCH_SIZE条数据或等待WRITE_BATCH_WAIT_MS毫秒后写入，为0时不合并
+    WRITE_BATCH_SIZE: int = 1000
+    WRITE_BATCH_WAIT_MS: int = 50
+
+    # 任务队列，TASK_SHARDS大于0时用户和工会的更新任务按哈希发送到{TASK_QUEUE}.{shard}队列
+    TASK_QUEUE: str = 'task_queue'
+    TASK_SHARDS: int = 0
+    WORKER_SHARDS: str = ''           # worker订阅的分片，逗号分隔，为空时订阅所有分片
+
+    # 优先级通道，开启后用户和工会的更新任务按数据条数发送到{queue}.high或{queue}.low队列
+    TASK_LANES: bool = False
+    HIGH_LANE_MAX_RECORDS: int = 10   # 数据条数不超过该值的任务发送到high通道
+    WORKER_LANE: str = ''             # worker订阅的通道(high/low)，为空时订阅两个通道
+    HIGH_LANE_PREFETCH: int = 1       # 只订阅一个通道的worker使用的worker_prefetch_multiplier
+    LOW_LANE_PREFETCH: int = 4
+    HIGH_LANE_CONCURRENCY: int = 0    # worker内每个通道同时执行的任务数量，为0时不限制
+    LOW_LANE_CONCURRENCY: int = 0
+    HIGH_LANE_RESERVED_CONNECTIONS: int = 4   # 为每个通道保留的事务名额，按DB_LIMIT_MAX计算，限流下调上限时按比例缩小
+    LOW_LANE_RESERVED_CONNECTIONS: int = 2
+    HIGH_LANE_BATCH_WAIT_MS: int = 0  # high通道的任务合并写入的等待时间(毫秒)，为0时不合并
+
+    # 单个任务的数据按TASK_CHUNK_SIZE条分块，每块单独提交，失败时任务从失败的块开始重试
+    TASK_CHUNK_SIZE: int = 1000
+    TASK_MAX_RETRIES: int = 3
+    TASK_RETRY_DELAY: int = 5         # 重试的等待时间(秒)
+
+    # 死锁和锁等待超时时重新执行整个事务，第n次重试前随机等待0到DEADLOCK_RETRY_DELAY * 2^n秒
+    DEADLOCK_MAX_RETRIES: int = 5
+    DEADLOCK_RETRY_DELAY: float = 0.05
+
+    # 批次写入失败后逐条写入，遇到临时错误时按RECORD_RETRY_DELAY * 2^n秒退避重试，仍然失败的数据写入LOG_PATH下的死信文件
+    RECORD_MAX_RETRIES: int = 3
+    RECORD_RETRY_DELAY: float = 0.5
+    DEAD_LETTER_FILE: str = 'dead_letter.jsonl'
+
+    # 定时按时间重新计算active_level，间隔为0时不添加定时任务
+    ACTIVE_LEVEL_DECAY_INTERVAL: int = 6 * 60 * 60
+    ACTIVE_LEVEL_DECAY_CHUNK_SIZE: int = 5000   # 每次UPDATE处理的user_info行数
+    ACTIVE_LEVEL_DECAY_SLEEP: float = 0.2       # 每块之间的等待时间(秒)
+
+    # 变更事件，CDC_SINK为file时写入LOG_PATH下的CDC_FILE，为celery时发送CDC_TASK任务到CDC_QUEUE，为空时不生成
+    CDC_SINK: str = ''
+    CDC_FILE: str = 'changes.jsonl'
+    CDC_QUEUE: str = 'change_events'
+    CDC_TASK: str = 'change_events'
+
+    # SQL语句耗时统计，开启后在worker关闭时输出耗时最多的SQL_PROFILE_TOP条语句
+    SQL_PROFILE: bool = False
+    SQL_PROFILE_TOP: int = 20
+    SQL_PROFILE_SQL_LENGTH: int = 300  # 报告中语句模板的最大长度
+
     class Config:
         env_file = ".env"
         extra = "allow"
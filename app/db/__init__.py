@@ -1,12 +1,52 @@
-from .db import DatabaseConnection
+from .db import DatabaseConnection, PoolTimeoutError
 from .task import (
     test_db,
     update_user_data,
     update_clan_data
 )
+from .bulk import (
+    bulk_update_user_data,
+    bulk_update_clan_data,
+    bulk_update_data
+)
+from .decay import decay_active_level
+from .read import read_user_datas, read_clan_datas
+from .members import sync_clan_members
+from .retry import DeadlockRetry
+from .freshness import FreshnessGuard
+from .changes import ChangeStream
+from .recovery import RecordIsolator, replay_dead_letters
+from .dead_letter import DeadLetterStore
+from .batcher import write_batcher, high_lane_batcher
+from .merge import UpdateMerger
+from .profiler import SQLProfiler
+from .limiter import AdaptiveLimiter, db_limiter
+from .lanes import LaneGate, lane_gate
 __all__ = [
     'DatabaseConnection',
+    'PoolTimeoutError',
     'test_db',
     'update_user_data',
-    'update_clan_data'
+    'update_clan_data',
+    'bulk_update_user_data',
+    'bulk_update_clan_data',
+    'bulk_update_data',
+    'decay_active_level',
+    'read_user_datas',
+    'read_clan_datas',
+    'sync_clan_members',
+    'DeadlockRetry',
+    'FreshnessGuard',
+    'ChangeStream',
+    'RecordIsolator',
+    'replay_dead_letters',
+    'DeadLetterStore',
+    'write_batcher',
+    'high_lane_batcher',
+    'UpdateMerger',
+    'SQLProfiler',
+    'AdaptiveLimiter',
+    'db_limiter',
+    'LaneGate',
+    'lane_gate'
 ]
\ No newline at end of file
@@ -0,0 +1,165 @@
+import threading
+
+from app.response import JSONResponse
+from app.core import EnvConfig
+
+from .bulk import bulk_update_data, load_cached_users, is_cached_noop
+from .recovery import RecordIsolator, get_error_code
+
+config = EnvConfig.get_config()
+
+
+class _Batch:
+    def __init__(self):
+        self.user_datas = []
+        self.clan_datas = []
+        # 每个任务提交的数据，用于部分数据转入死信时区分每个任务的结果
+        self.tasks = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+
+
+class WriteBatcher:
+    '''跨任务合并用户和工会数据的写入
+
+    同一个worker内并发执行的任务会把数据放入同一个批次，当批次内的数据达到max_items条，
+    或者距离批次内第一条数据到达超过max_wait_ms毫秒时，由第一个加入批次的任务在同一个事务中写入，
+    其余任务等待写入完成后返回同样的结果；逐条写入时只有数据转入死信的任务会收到部分写入的返回值，
+    其余任务返回成功
+
+    任务配置了acks_late，只有在批次提交完成、任务返回后消息才会被确认
+
+    eventlet会将threading替换为协程实现，因此等待时不会阻塞其他任务
+    '''
+    def __init__(self, max_items: int, max_wait_ms: int):
+        self.max_items = max_items
+        self.max_wait = max_wait_ms / 1000
+        self.__lock = threading.Lock()
+        self.__batch = None
+        self.__stats = {
+            'tasks': 0,
+            'batches': 0,
+            'items': 0,
+            'skipped': 0,
+            'isolated': 0
+        }
+
+    def submit(self, user_datas: dict | list = None, clan_datas: dict | list = None):
+        "提交数据并等待所在批次写入完成，返回写入结果"
+        if type(user_datas) == dict:
+            user_datas = [user_datas]
+        if type(clan_datas) == dict:
+            clan_datas = [clan_datas]
+        user_datas = user_datas or []
+        clan_datas = clan_datas or []
+        # 所有用户都命中缓存且没有变化，不需要加入批次
+        if clan_datas == [] and is_cached_noop(user_datas, load_cached_users(user_datas)):
+            self.__stats['skipped'] += 1
+            return JSONResponse.API_1000_Success
+        if self.max_wait <= 0:
+            return self.__flush(user_datas, clan_datas, [(user_datas, clan_datas)])[0]
+        with self.__lock:
+            leader = self.__batch is None
+            if leader:
+                self.__batch = _Batch()
+            batch = self.__batch
+            index = len(batch.tasks)
+            batch.user_datas.extend(user_datas)
+            batch.clan_datas.extend(clan_datas)
+            batch.tasks.append((user_datas, clan_datas))
+            if len(batch.user_datas) + len(batch.clan_datas) >= self.max_items:
+                self.__batch = None
+                batch.full.set()
+        if not leader:
+            batch.done.wait()
+            return batch.results[index]
+        batch.full.wait(self.max_wait)
+        with self.__lock:
+            if self.__batch is batch:
+                self.__batch = None
+        try:
+            batch.results = self.__flush(batch.user_datas, batch.clan_datas, batch.tasks)
+        finally:
+            batch.done.set()
+        return batch.results[index]
+
+    def submit_chunks(
+        self,
+        user_datas: dict | list = None,
+        clan_datas: dict | list = None,
+        chunk_size: int = None,
+        start_chunk: int = 0
+    ) -> tuple:
+        '''将数据按chunk_size条分块，每块分别提交并等待写入完成
+
+        每块在各自的事务中提交，某一块写入失败时停止，之后的块不会写入；
+        某一块只有部分数据转入死信时(见RecordIsolator.is_partial)其余数据已经提交，继续写入之后的块
+
+        参数:
+            chunk_size: 每块的数据条数，默认为TASK_CHUNK_SIZE
+            start_chunk: 从第几块开始，用于任务重试时跳过已经提交的块；
+                进度不会持久化，任务没有正常返回(崩溃、acks_late重新投递)时已经提交的块会重新写入
+
+        返回:
+            (result, failed_chunk)，没有失败的块时failed_chunk为None，
+            此时有数据转入死信的话result为最后一次部分写入的返回值
+        '''
+        if type(user_datas) == dict:
+            user_datas = [user_datas]
+        if type(clan_datas) == dict:
+            clan_datas = [clan_datas]
+        datas = [('user', data) for data in user_datas or []] + [('clan', data) for data in clan_datas or []]
+        chunk_size = chunk_size or config.TASK_CHUNK_SIZE
+        partial = None
+        for chunk_index in range(start_chunk, (len(datas) + chunk_size - 1) // chunk_size):
+            chunk = datas[chunk_index * chunk_size:(chunk_index + 1) * chunk_size]
+            result = self.submit(
+                user_datas=[data for data_type, data in chunk if data_type == 'user'],
+                clan_datas=[data for data_type, data in chunk if data_type == 'clan']
+            )
+            if RecordIsolator.is_partial(result):
+                partial = result
+            elif result.get('code', None) != 1000:
+                return result, chunk_index
+        return partial or JSONResponse.API_1000_Success, None
+
+    def __flush(self, user_datas: list, clan_datas: list, tasks: list) -> list:
+        "写入批次内的数据，按tasks的顺序返回每个任务的结果"
+        self.__stats['tasks'] += len(tasks)
+        self.__stats['batches'] += 1
+        self.__stats['items'] += len(user_datas) + len(clan_datas)
+        result = bulk_update_data(user_datas, clan_datas)
+        if result.get('code', None) == 1000:
+            return [result] * len(tasks)
+        # 批量写入失败时逐条写入，只有失败的数据会转入死信存储，
+        # 临时错误时整个批次的任务都会收到该返回值并重试
+        self.__stats['isolated'] += 1
+        failed_records = []
+        result = RecordIsolator.write(user_datas, clan_datas, failed_records=failed_records)
+        if not RecordIsolator.is_partial(result):
+            return [result] * len(tasks)
+        return [self.__get_task_result(result, task, failed_records) for task in tasks]
+
+    @staticmethod
+    def __get_task_result(result: dict, task: tuple, failed_records: list) -> dict:
+        "部分数据转入死信时单个任务的结果，只统计该任务提交的数据"
+        task_user_datas, task_clan_datas = task
+        task_records = {id(data) for data in task_user_datas + task_clan_datas}
+        failed = [e for _, data, e in failed_records if id(data) in task_records]
+        if failed == []:
+            return JSONResponse.API_1000_Success
+        task_result = JSONResponse.get_error_response(get_error_code(failed[0]), result['message'], result['data']['error_id'])
+        task_result['data'].update({
+            'records': len(task_records),
+            'dead_letters': len(failed)
+        })
+        return task_result
+
+    def get_stats(self) -> dict:
+        return dict(self.__stats)
+
+
+write_batcher = WriteBatcher(config.WRITE_BATCH_SIZE, config.WRITE_BATCH_WAIT_MS)
+# high通道的任务单独合并，避免等待low通道的大批次
+high_lane_batcher = WriteBatcher(config.WRITE_BATCH_SIZE, config.HIGH_LANE_BATCH_WAIT_MS)
@@ -0,0 +1,816 @@
+import pymysql
+
+from app.response import JSONResponse
+from app.log import ExceptionLogger
+from app.utils import CommonUtils, TimeFormat
+from app.core import EnvConfig
+from app.metrics import WorkerMetrics
+
+from .db import DatabaseConnection
+from .cache import user_cache, clan_cache
+from .merge import UpdateMerger
+from .retry import DeadlockRetry
+from .changes import ChangeStream, USER_CHANGE_FIELDS, CLAN_BASIC_CHANGE_FIELDS, CLAN_CHANGE_FIELDS
+from .freshness import FreshnessGuard
+
+config = EnvConfig.get_config()
+
+MAIN_DB = config.DB_NAME_MAIN
+
+# 单条多行语句携带的最大记录数，避免语句超过 max_allowed_packet
+PAGE_SIZE = 1000
+
+USER_INFO_FIELDS = ['is_active', 'active_level', 'is_public', 'total_battles', 'last_battle_time']
+# 不写入worker缓存的字段：user_clan中的clan_id还会由sync_clan_members按工会分片写入，
+# 其他worker缓存中的值可能已经过期
+USER_UNCACHED_FIELDS = ['clan_id', 'clan_update_time']
+CLAN_INFO_FIELDS = ['is_active', 'season', 'public_rating', 'league', 'division', 'division_rating', 'last_battle_at']
+
+
+def _pages(rows: list):
+    for i in range(0, len(rows), PAGE_SIZE):
+        yield rows[i:i + PAGE_SIZE]
+
+def execute_values(cur, sql_head: str, template: str, rows: list, sql_tail: str = ''):
+    '''将多条记录拼接成一条多行语句执行
+
+    语句格式为 sql_head + template, template, ... + sql_tail，每PAGE_SIZE条记录一次往返
+    '''
+    for page in _pages(rows):
+        params = []
+        for row in page:
+            params.extend(row)
+        cur.execute(sql_head + ', '.join([template] * len(page)) + sql_tail + ';', params)
+
+def fetch_values(cur, sql_head: str, template: str, rows: list, sql_tail: str = '') -> list:
+    '''同execute_values，返回所有分页的查询结果'''
+    result = []
+    for page in _pages(rows):
+        params = []
+        for row in page:
+            params.extend(row)
+        cur.execute(sql_head + ', '.join([template] * len(page)) + sql_tail + ';', params)
+        result.extend(cur.fetchall())
+    return result
+
+def update_values(cur, table: str, key: str, columns: list, rows: list, set_sql: str, where_sql: str = ''):
+    '''通过 UPDATE ... JOIN 派生表 批量更新多行
+
+    rows中每一行按照[key] + columns的顺序排列，set_sql和where_sql中用t表示目标表，v表示派生表，
+    where_sql不为空时只更新满足条件的行
+    '''
+    first = 'SELECT ' + ', '.join(f'%s AS {column}' for column in [key] + columns)
+    other = 'SELECT ' + ', '.join(['%s'] * (len(columns) + 1))
+    for page in _pages(rows):
+        params = []
+        for row in page:
+            params.extend(row)
+        derived = ' UNION ALL '.join([first] + [other] * (len(page) - 1))
+        where = f' WHERE {where_sql}' if where_sql else ''
+        cur.execute(
+            f"UPDATE {table} AS t JOIN ({derived}) AS v ON t.{key} = v.{key} SET {set_sql}{where};",
+            params
+        )
+
+
+def sort_rows(rows) -> list:
+    '''按第一列(主键)排序
+
+    所有事务按相同的表顺序以及主键顺序加锁，避免并发写入重叠的数据时出现死锁
+    '''
+    return sorted(rows, key=lambda row: row[0])
+
+def _fetch_users(cur, keys: list) -> dict:
+    "一次查询批次内所有用户的现有数据"
+    if keys == []:
+        return {}
+    rows = fetch_values(
+        cur,
+        "SELECT b.region_id, b.account_id, b.username, UNIX_TIMESTAMP(b.updated_at) AS name_update_time, "
+        "i.is_active, i.active_level, i.is_public, i.total_battles, "
+        "UNIX_TIMESTAMP(i.last_battle_at) AS last_battle_time, UNIX_TIMESTAMP(i.updated_at) AS info_update_time, "
+        "c.clan_id, UNIX_TIMESTAMP(c.updated_at) AS clan_update_time "
+        f"FROM {MAIN_DB}.user_basic as b "
+        f"LEFT JOIN {MAIN_DB}.user_info as i ON b.account_id = i.account_id "
+        f"LEFT JOIN {MAIN_DB}.user_clan as c ON b.account_id = c.account_id "
+        "WHERE (b.region_id, b.account_id) IN (",
+        '(%s, %s)',
+        keys,
+        ')'
+    )
+    return {(row['region_id'], row['account_id']): row for row in rows}
+
+def _fetch_clans(cur, keys: list) -> dict:
+    "一次查询批次内所有工会的现有数据"
+    if keys == []:
+        return {}
+    rows = fetch_values(
+        cur,
+        "SELECT b.region_id, b.clan_id, b.tag, b.league AS league1, UNIX_TIMESTAMP(b.updated_at) AS basic_update_time, "
+        "i.is_active, i.season, i.public_rating, i.league, i.division, i.division_rating, "
+        "UNIX_TIMESTAMP(i.last_battle_at) AS last_battle_at "
+        f"FROM {MAIN_DB}.clan_basic AS b "
+        f"LEFT JOIN {MAIN_DB}.clan_info AS i ON b.clan_id = i.clan_id "
+        "WHERE (b.region_id, b.clan_id) IN (",
+        '(%s, %s)',
+        keys,
+        ')'
+    )
+    return {(row['region_id'], row['clan_id']): row for row in rows}
+
+
+def _fetch_filtered(cur, table: str, key: str, column: str, rows: list) -> set:
+    '''查询被last_battle_at不倒退的条件过滤、没有更新的行
+
+    rows为[key, 写入的时间戳]，写入后查询到的值与写入的值不同的行没有被更新：
+    其他事务在本事务读取之后写入了更新的数据，本事务读到的仍然是之前的快照
+    '''
+    if rows == []:
+        return set()
+    result = fetch_values(
+        cur,
+        f"SELECT {key}, UNIX_TIMESTAMP({column}) AS written FROM {table} WHERE {key} IN (",
+        '%s',
+        [[row[0]] for row in rows],
+        ')'
+    )
+    written = {row[key]: row['written'] for row in result}
+    return set(row[0] for row in rows if written.get(row[0]) != row[1])
+
+
+def _touch_expired(update_time: int | None, current_timestamp: int, touch_interval: int) -> bool:
+    "数据没有变化时，判断是否需要刷新updated_at"
+    return update_time is None or current_timestamp - update_time >= touch_interval
+
+def _get_active_levels(user_datas: list, current_timestamp: int) -> list:
+    "批量计算活跃用户的active_level，与user_datas一一对应，不需要计算的位置为None"
+    indexes = []
+    items = []
+    for index, user_data in enumerate(user_datas):
+        info = user_data['info']
+        if info != None and info != {} and info['is_active']:
+            indexes.append(index)
+            items.append((info['is_public'], info['total_battles'], info['last_battle_time']))
+    active_levels = [None] * len(user_datas)
+    for index, level in zip(indexes, CommonUtils.get_active_levels(items, current_timestamp)):
+        active_levels[index] = level
+    return active_levels
+
+def plan_user_writes(
+    user_datas: list,
+    users: dict,
+    clans: dict,
+    current_timestamp: int,
+    touch_interval: int = 0
+) -> dict:
+    '''根据数据库中的现有数据计算需要写入的内容
+
+    逻辑与逐条处理的update_user_data一致，同一批次内重复出现的用户会基于前一次的结果继续比较
+
+    数据没有变化时，user_info、user_clan和clan_basic的updated_at只会在距离上次刷新超过touch_interval秒后刷新，
+    touch_interval为0时与update_user_data一样每次都会刷新
+
+    同一个工会在批次内只会写入一次clan_basic
+
+    比数据库中的数据更旧的用户整条跳过，记录在stale中，见FreshnessGuard
+
+    参数:
+        user_datas: 用户数据列表
+        users: 现有用户数据，key为(region_id, account_id)，会被更新为写入后的状态
+        clans: 现有工会数据，key为(region_id, clan_id)，会被更新为写入后的状态
+        current_timestamp: 本批次使用的当前时间戳
+        touch_interval: 刷新updated_at的最小间隔
+    '''
+    plan = {
+        'user_basic': {},   # (region_id, account_id) -> [account_id, region_id, username]
+        'new_users': [],    # [account_id]
+        'user_info': {},    # account_id -> [account_id, is_active, active_level, is_public, total_battles, last_battle_time]
+        'user_history': [], # [account_id, username, start_time, end_time]
+        'clan_null': {},    # account_id -> None，需要清空工会的用户
+        'clan_basic': {},   # (region_id, clan_id) -> [clan_id, region_id, tag, league]
+        'new_clans': [],    # [clan_id]
+        'stale': []         # 比现有数据旧而跳过的用户，[(region_id, account_id)]
+    }
+    active_levels = _get_active_levels(user_datas, current_timestamp)
+    for index, user_data in enumerate(user_datas):
+        account_id = user_data['account_id']
+        region_id = user_data['region_id']
+        key = (region_id, account_id)
+        user = users.get(key)
+        values = {}
+        if user and FreshnessGuard.is_stale_user(user_data['info'], user):
+            plan['stale'].append(key)
+            continue
+        if not user:
+            user = {
+                'region_id': region_id,
+                'account_id': account_id,
+                'username': f'User_{account_id}',
+                'name_update_time': current_timestamp,
+                'info_update_time': current_timestamp,
+                'clan_id': None,
+                'clan_update_time': current_timestamp
+            }
+            for field in USER_INFO_FIELDS:
+                user[field] = None
+            users[key] = user
+            plan['new_users'].append(account_id)
+            plan['user_basic'][key] = [account_id, region_id, user['username']]
+            # 更新user_basic表
+            if user_data['basic'] != None and user_data['basic'] != {}:
+                user['username'] = user_data['basic']['nickname']
+                plan['user_basic'][key][2] = user['username']
+            # 更新user_info表
+            if user_data['info'] != None and user_data['info'] != {}:
+                if not user_data['info']['is_active']:
+                    values['is_active'] = user_data['info']['is_active']
+                else:
+                    values['is_active'] = user_data['info']['is_active']
+                    values['active_level'] = active_levels[index]
+                    for field in ['is_public', 'total_battles', 'last_battle_time']:
+                        values[field] = user_data['info'][field]
+        else:
+            # 更新user_basic表
+            if user_data['basic'] != None and user_data['basic'] != {}:
+                nickname = user_data['basic']['nickname']
+                # 根据数据库的数据判断用户是否更改名称
+                if user['username'] != nickname and user['name_update_time'] != None:
+                    plan['user_history'].append(
+                        [account_id, user['username'], user['name_update_time'], current_timestamp]
+                    )
+                    plan['user_basic'][key] = [account_id, region_id, nickname]
+                    user['username'] = nickname
+                    user['name_update_time'] = current_timestamp
+                elif user['name_update_time'] == None:
+                    plan['user_basic'][key] = [account_id, region_id, nickname]
+                    user['username'] = nickname
+                    # 写入时会同时刷新updated_at
+                    user['name_update_time'] = current_timestamp
+            # 更新user_info表
+            if user_data['info'] != None and user_data['info'] != {}:
+                info = dict(user_data['info'])
+                if info['is_active']:
+                    info['active_level'] = active_levels[index]
+                for field in USER_INFO_FIELDS:
+                    if (field in info) and (info[field] != None) and (info[field] != user[field]):
+                        if field != 'last_battle_time' or info[field] != 0:
+                            values[field] = info[field]
+                # 没有字段变化时按照touch_interval刷新updated_at
+                if _touch_expired(user['info_update_time'], current_timestamp, touch_interval):
+                    plan['user_info'].setdefault(account_id, [account_id] + [None] * len(USER_INFO_FIELDS))
+                    user['info_update_time'] = current_timestamp
+        if values != {}:
+            row = plan['user_info'].setdefault(account_id, [account_id] + [None] * len(USER_INFO_FIELDS))
+            for field, value in values.items():
+                row[USER_INFO_FIELDS.index(field) + 1] = value
+                user[field] = value
+            user['info_update_time'] = current_timestamp
+        # 更新user_clan和clan_basic表
+        if user_data['clan'] != None and user_data['clan'] != {}:
+            if not user_data['clan']['id']:
+                if (
+                    user['clan_id'] is not None or
+                    _touch_expired(user['clan_update_time'], current_timestamp, touch_interval)
+                ):
+                    plan['clan_null'][account_id] = None
+                    user['clan_id'] = None
+                    user['clan_update_time'] = current_timestamp
+            else:
+                clan_id = user_data['clan']['id']
+                clan_key = (region_id, clan_id)
+                clan = clans.get(clan_key)
+                if clan is None:
+                    # 工会不存在，插入新数据
+                    clan = {'region_id': region_id, 'clan_id': clan_id, 'basic_update_time': None}
+                    clans[clan_key] = clan
+                    plan['new_clans'].append(clan_id)
+                elif (
+                    clan['tag'] == user_data['clan']['tag'] and
+                    clan['league1'] == user_data['clan']['league'] and
+                    not _touch_expired(clan['basic_update_time'], current_timestamp, touch_interval)
+                ):
+                    continue
+                clan['tag'] = user_data['clan']['tag']
+                clan['league1'] = user_data['clan']['league']
+                clan['basic_update_time'] = current_timestamp
+                plan['clan_basic'][clan_key] = [clan_id, region_id, clan['tag'], clan['league1']]
+    return plan
+
+def write_user_plan(cur, plan: dict):
+    '''按固定的表顺序批量写入plan_user_writes的计算结果中用户的部分，表内按主键排序
+
+    每个表的语句连续执行，新用户先插入再与现有用户一起更新，
+    clan_basic和新增工会的数据由write_clan_plan与工会数据一起写入
+    '''
+    new_users = [[account_id] for account_id in sorted(plan['new_users'])]
+    if plan['user_basic'] != {}:
+        execute_values(
+            cur,
+            f"INSERT INTO {MAIN_DB}.user_basic (account_id, region_id, username) VALUES ",
+            '(%s, %s, %s)',
+            sort_rows(plan['user_basic'].values()),
+            ' ON DUPLICATE KEY UPDATE username = VALUES(username), updated_at = CURRENT_TIMESTAMP'
+        )
+    if new_users != []:
+        execute_values(cur, f"INSERT INTO {MAIN_DB}.user_info (account_id) VALUES ", '(%s)', new_users)
+    if plan['user_info'] != {}:
+        # None表示该字段不需要更新
+        update_values(
+            cur,
+            f"{MAIN_DB}.user_info",
+            'account_id',
+            USER_INFO_FIELDS,
+            sort_rows(plan['user_info'].values()),
+            "t.is_active = COALESCE(v.is_active, t.is_active), "
+            "t.active_level = COALESCE(v.active_level, t.active_level), "
+            "t.is_public = COALESCE(v.is_public, t.is_public), "
+            "t.total_battles = COALESCE(v.total_battles, t.total_battles), "
+            "t.last_battle_at = COALESCE(FROM_UNIXTIME(v.last_battle_time), t.last_battle_at), "
+            "t.updated_at = CURRENT_TIMESTAMP",
+            # 读取现有数据之后其他事务写入了较新的数据时，不覆盖较新的数据，见_fetch_filtered
+            "v.last_battle_time IS NULL OR t.last_battle_at IS NULL OR t.last_battle_at <= FROM_UNIXTIME(v.last_battle_time)"
+        )
+    if new_users != []:
+        for table in ['user_ships', 'user_clan']:
+            execute_values(cur, f"INSERT INTO {MAIN_DB}.{table} (account_id) VALUES ", '(%s)', new_users)
+    if plan['clan_null'] != {}:
+        execute_values(
+            cur,
+            f"UPDATE {MAIN_DB}.user_clan SET clan_id = NULL, updated_at = CURRENT_TIMESTAMP WHERE account_id IN (",
+            '%s',
+            [[account_id] for account_id in sorted(plan['clan_null'])],
+            ')'
+        )
+    if plan['user_history'] != []:
+        execute_values(
+            cur,
+            f"INSERT INTO {MAIN_DB}.user_history (account_id, username, start_time, end_time) VALUES ",
+            '(%s, %s, FROM_UNIXTIME(%s), FROM_UNIXTIME(%s))',
+            sort_rows(plan['user_history'])
+        )
+
+def is_empty_plan(plan: dict) -> bool:
+    "写入计划中是否没有任何需要写入的数据"
+    for name in ['user_basic', 'new_users', 'user_info', 'user_history', 'clan_null', 'clan_basic', 'new_clans']:
+        if plan[name]:
+            return False
+    return True
+
+def summarize_user_plan(plan: dict) -> list:
+    "统计写入计划中每个表插入、更新和跳过的行数，返回[(table, action, count)]"
+    new_users = len(plan['new_users'])
+    existing_users = len(plan['snapshots']) + len(plan['filtered']) - new_users
+    updated_info = len(set(plan['user_info']) - set(plan['new_users']))
+    new_clans = len(plan['new_clans'])
+    return [
+        ('user_basic', 'inserted', new_users),
+        ('user_basic', 'updated', len(plan['user_basic']) - new_users),
+        ('user_basic', 'skipped', existing_users - (len(plan['user_basic']) - new_users)),
+        ('user_info', 'inserted', new_users),
+        ('user_info', 'updated', updated_info),
+        ('user_info', 'skipped', existing_users - updated_info),
+        ('user_ships', 'inserted', new_users),
+        ('user_clan', 'inserted', new_users),
+        ('user_clan', 'updated', len(plan['clan_null'])),
+        ('user_history', 'inserted', len(plan['user_history'])),
+        ('clan_basic', 'inserted', new_clans),
+        ('clan_basic', 'updated', len(plan['clan_basic']) - new_clans),
+        ('clan_basic', 'skipped', len(plan['clan_snapshots']) - len(plan['clan_basic'])),
+        ('clan_info', 'inserted', new_clans),
+        ('clan_users', 'inserted', new_clans),
+        ('clan_season', 'inserted', new_clans)
+    ]
+
+def get_user_keys(user_datas: list) -> list:
+    return list(dict.fromkeys((user_data['region_id'], user_data['account_id']) for user_data in user_datas))
+
+def get_clan_keys(user_datas: list) -> list:
+    "用户数据中出现的所有工会"
+    clan_keys = {}
+    for user_data in user_datas:
+        if user_data['clan'] != None and user_data['clan'] != {} and user_data['clan']['id']:
+            clan_keys[(user_data['region_id'], user_data['clan']['id'])] = None
+    return list(clan_keys)
+
+def load_cached_users(user_datas: list) -> dict:
+    "从worker缓存中读取批次内用户的快照，只返回命中的部分"
+    return user_cache.get_many(get_user_keys(user_datas))
+
+def cache_users(snapshots: dict):
+    "将写入后的用户快照写入worker缓存，不包括USER_UNCACHED_FIELDS"
+    user_cache.set_many({
+        key: {field: value for field, value in user.items() if field not in USER_UNCACHED_FIELDS}
+        for key, user in snapshots.items()
+    })
+
+def is_cached_noop(user_datas: list, users: dict) -> bool:
+    '''批次内所有用户都命中缓存且数据没有变化时返回True，此时不需要访问数据库
+
+    缓存中没有clan_id，批次内有需要清空工会的用户时无法判断，返回False
+
+    users为load_cached_users的返回值，不会被修改
+    '''
+    if len(users) != len(get_user_keys(user_datas)):
+        return False
+    for user_data in user_datas:
+        if user_data['clan'] != None and user_data['clan'] != {} and not user_data['clan']['id']:
+            return False
+    clan_keys = get_clan_keys(user_datas)
+    clans = clan_cache.get_many(clan_keys)
+    if len(clans) != len(clan_keys):
+        return False
+    plan = plan_user_writes(
+        user_datas,
+        {key: user.copy() for key, user in users.items()},
+        clans,
+        TimeFormat.get_current_timestamp(),
+        config.USER_TOUCH_INTERVAL
+    )
+    if is_empty_plan(plan):
+        FreshnessGuard.count(users=len(plan['stale']))
+        return True
+    return False
+
+def write_user_datas(cur, user_datas: list) -> dict:
+    '''在当前事务内批量更新用户数据，返回写入计划，见write_datas'''
+    user_plan, _ = write_datas(cur, user_datas, [])
+    return user_plan
+
+
+def plan_clan_writes(clan_datas: list, clans: dict) -> dict:
+    '''根据数据库中的现有数据将工会分为新增、变化、未变化三类，并计算需要写入的内容
+
+    逻辑与逐条处理的update_clan_data一致，同一批次内重复出现的工会会基于前一次的结果继续比较
+
+    比数据库中的数据更旧的工会整条跳过，记录在stale中，见FreshnessGuard
+
+    参数:
+        clan_datas: 工会数据列表
+        clans: 现有工会数据，key为(region_id, clan_id)，会被更新为写入后的状态
+    '''
+    plan = {
+        'clan_basic': {},    # (region_id, clan_id) -> [clan_id, region_id, tag, league]
+        'new_clans': [],     # [clan_id]
+        'clan_info': {},     # clan_id -> [clan_id, is_active, season, public_rating, league, division, division_rating, last_battle_at]
+        'clan_inactive': {}, # clan_id -> [clan_id, is_active]
+        'changed': [],       # 数据有变化的现有工会
+        'unchanged': [],     # 数据没有变化的现有工会
+        'stale': []          # 比现有数据旧而跳过的工会
+    }
+    for clan_data in clan_datas:
+        clan_id = clan_data['clan_id']
+        region_id = clan_data['region_id']
+        key = (region_id, clan_id)
+        clan = clans.get(key)
+        basic = clan_data['basic'] if clan_data['basic'] != {} else None
+        info = clan_data['info'] if clan_data['info'] != {} else None
+        changed = False
+        if clan is None:
+            # 工会不存在，插入新数据
+            clan = {'region_id': region_id, 'clan_id': clan_id, 'tag': 'N/A', 'league1': 5}
+            for field in CLAN_INFO_FIELDS:
+                clan[field] = None
+            clans[key] = clan
+            plan['new_clans'].append(clan_id)
+            plan['clan_basic'][key] = [clan_id, region_id, 'N/A', 5]
+            if basic != None:
+                _plan_clan_basic(plan, clan, basic)
+            if info != None:
+                if not info['is_active']:
+                    _plan_clan_inactive(plan, clan, info)
+                else:
+                    _plan_clan_info(plan, clan, info)
+            continue
+        if FreshnessGuard.is_stale_clan(info, clan['last_battle_at'], clan['season']):
+            plan['stale'].append(clan_id)
+            continue
+        # 更新clan_basic表
+        if basic != None:
+            if basic['tag'] != clan['tag'] or basic['league'] != clan['league1']:
+                _plan_clan_basic(plan, clan, basic)
+                changed = True
+        # 更新clan_info表
+        if info != None:
+            if not info['is_active']:
+                _plan_clan_inactive(plan, clan, info)
+                changed = True
+            elif (
+                info['season_number'] != clan['season'] or
+                info['public_rating'] != clan['public_rating'] or
+                info['last_battle_at'] != clan['last_battle_at']
+            ):
+                _plan_clan_info(plan, clan, info)
+                changed = True
+        if changed:
+            plan['changed'].append(clan_id)
+        else:
+            plan['unchanged'].append(clan_id)
+    return plan
+
+def _plan_clan_basic(plan: dict, clan: dict, basic: dict):
+    "记录clan_basic表的更新"
+    clan['tag'] = basic['tag']
+    clan['league1'] = basic['league']
+    plan['clan_basic'][(clan['region_id'], clan['clan_id'])] = [clan['clan_id'], clan['region_id'], clan['tag'], clan['league1']]
+
+def _plan_clan_inactive(plan: dict, clan: dict, info: dict):
+    "记录clan_info表的is_active更新，该语句会刷新updated_at"
+    clan['is_active'] = info['is_active']
+    plan['clan_inactive'][clan['clan_id']] = [clan['clan_id'], info['is_active']]
+    # 同一工会的完整更新和is_active更新写入同一行，需要同步is_active
+    if clan['clan_id'] in plan['clan_info']:
+        plan['clan_info'][clan['clan_id']][1] = info['is_active']
+
+def _plan_clan_info(plan: dict, clan: dict, info: dict):
+    "记录clan_info表的完整更新"
+    row = [
+        clan['clan_id'], info['is_active'], info['season_number'], info['public_rating'],
+        info['league'], info['division'], info['division_rating'], info['last_battle_at']
+    ]
+    for field, value in zip(CLAN_INFO_FIELDS, row[1:]):
+        clan[field] = value
+    plan['clan_info'][clan['clan_id']] = row
+    plan['clan_inactive'].pop(clan['clan_id'], None)
+
+def write_clan_plan(cur, plan: dict, user_plan: dict = None):
+    '''按固定的表顺序批量写入plan_clan_writes的计算结果，表内按主键排序
+
+    user_plan为同一事务内plan_user_writes的计算结果，其中的clan_basic和新增工会与plan合并后写入，
+    每个表的语句连续执行，现有的行在每个表中只由一条按主键排序的语句更新，避免分多次加锁
+    '''
+    clan_basic = dict(user_plan['clan_basic']) if user_plan else {}
+    # 同一个工会以工会数据为准，与先写入用户数据再写入工会数据的结果一致
+    clan_basic.update(plan['clan_basic'])
+    new_clans = (user_plan['new_clans'] if user_plan else []) + plan['new_clans']
+    if clan_basic != {}:
+        execute_values(
+            cur,
+            f"INSERT INTO {MAIN_DB}.clan_basic (clan_id, region_id, tag, league) VALUES ",
+            '(%s, %s, %s, %s)',
+            sort_rows(clan_basic.values()),
+            ' ON DUPLICATE KEY UPDATE tag = VALUES(tag), league = VALUES(league), updated_at = CURRENT_TIMESTAMP'
+        )
+    new_clans = [[clan_id] for clan_id in sorted(set(new_clans))]
+    if new_clans != []:
+        execute_values(cur, f"INSERT INTO {MAIN_DB}.clan_info (clan_id) VALUES ", '(%s)', new_clans)
+    if plan['clan_info'] != {} or plan['clan_inactive'] != {}:
+        # 完整更新和is_active更新合并为一条语句，full为1时更新所有字段，touch为1时总是刷新updated_at
+        rows = []
+        for clan_id in set(plan['clan_info']) | set(plan['clan_inactive']):
+            touch = int(clan_id in plan['clan_inactive'])
+            if clan_id in plan['clan_info']:
+                rows.append(plan['clan_info'][clan_id] + [1, touch])
+            else:
+                rows.append(plan['clan_inactive'][clan_id] + [None] * (len(CLAN_INFO_FIELDS) - 1) + [0, touch])
+        update_values(
+            cur,
+            f"{MAIN_DB}.clan_info",
+            'clan_id',
+            CLAN_INFO_FIELDS + ['full', 'touch'],
+            sort_rows(rows),
+            # updated_at需要放在最前面，按更新前的数据判断是否有变化
+            "t.updated_at = IF(v.touch = 1 OR (v.full = 1 AND NOT ("
+            "t.is_active <=> v.is_active AND t.season <=> v.season AND t.public_rating <=> v.public_rating AND "
+            "t.league <=> v.league AND t.division <=> v.division AND t.division_rating <=> v.division_rating AND "
+            "t.last_battle_at <=> FROM_UNIXTIME(v.last_battle_at)"
+            ")), CURRENT_TIMESTAMP, t.updated_at), "
+            "t.is_active = v.is_active, t.season = IF(v.full = 1, v.season, t.season), "
+            "t.public_rating = IF(v.full = 1, v.public_rating, t.public_rating), "
+            "t.league = IF(v.full = 1, v.league, t.league), t.division = IF(v.full = 1, v.division, t.division), "
+            "t.division_rating = IF(v.full = 1, v.division_rating, t.division_rating), "
+            "t.last_battle_at = IF(v.full = 1, FROM_UNIXTIME(v.last_battle_at), t.last_battle_at)",
+            # 与FreshnessGuard.is_stale_clan的条件一致，只有is_active更新的行last_battle_at为NULL
+            "v.last_battle_at IS NULL OR v.last_battle_at = 0 OR t.last_battle_at IS NULL OR "
+            "t.season < v.season OR t.last_battle_at <= FROM_UNIXTIME(v.last_battle_at)"
+        )
+    if new_clans != []:
+        for table in ['clan_users', 'clan_season']:
+            execute_values(cur, f"INSERT INTO {MAIN_DB}.{table} (clan_id) VALUES ", '(%s)', new_clans)
+
+def summarize_clan_plan(plan: dict) -> list:
+    "统计写入计划中每个表插入、更新和跳过的行数，返回[(table, action, count)]"
+    new_clans = len(plan['new_clans'])
+    updated_info = set(plan['clan_info']) | set(plan['clan_inactive'])
+    return [
+        ('clan_basic', 'inserted', new_clans),
+        ('clan_basic', 'updated', len(plan['clan_basic']) - new_clans),
+        ('clan_info', 'inserted', new_clans),
+        ('clan_info', 'updated', len(updated_info - set(plan['new_clans']))),
+        ('clan_info', 'skipped', len(plan['unchanged'])),
+        ('clan_users', 'inserted', new_clans),
+        ('clan_season', 'inserted', new_clans)
+    ]
+
+def get_clan_data_keys(clan_datas: list) -> list:
+    return list(dict.fromkeys((clan_data['region_id'], clan_data['clan_id']) for clan_data in clan_datas))
+
+def write_clan_datas(cur, clan_datas: list) -> dict:
+    '''在当前事务内批量更新工会数据，返回写入计划，见write_datas'''
+    _, clan_plan = write_datas(cur, [], clan_datas)
+    return clan_plan
+
+def write_datas(cur, user_datas: list, clan_datas: list) -> tuple:
+    '''在当前事务内批量更新用户和工会数据
+
+    结果与先写入用户数据、再写入工会数据一致，但所有表按固定顺序各写入一次：
+    工会数据基于用户数据写入后的工会状态计算，用户数据中的clan_basic和新增工会与工会数据合并后写入
+
+    批次内的用户在事务内用一次查询重新读取，不使用worker缓存中的快照：
+    没有分片时同一个用户可能由多个worker写入，缓存中的快照可能已经过期，
+    按过期的名称判断是否改名会重复写入user_history
+
+    工会不会被删除，用户数据中的工会在worker缓存中已知存在时不再查询，
+    tag和league按缓存中最近一次写入的值判断是否需要更新，工会数据中的工会总是重新查询
+
+    同一用户或工会的多条数据会先合并为一条，见UpdateMerger
+
+    返回(user_plan, clan_plan)：
+        user_plan中snapshots和clan_snapshots为写入后的快照，需要在提交成功后写入缓存，
+        filtered为被user_info的条件过滤的用户，需要在提交后从缓存中删除
+        两者的changes为变更事件，需要在提交成功后通过ChangeStream.publish发送
+    '''
+    user_datas = UpdateMerger.merge_user_datas(user_datas)
+    clan_datas = UpdateMerger.merge_clan_datas(clan_datas)
+    user_keys = get_user_keys(user_datas)
+    user_clan_keys = get_clan_keys(user_datas)
+    clan_keys = get_clan_data_keys(clan_datas)
+    users = _fetch_users(cur, user_keys)
+    clans = clan_cache.get_many([key for key in user_clan_keys if key not in set(clan_keys)])
+    clans.update(_fetch_clans(cur, [key for key in dict.fromkeys(user_clan_keys + clan_keys) if key not in clans]))
+    if ChangeStream.enabled():
+        users_before = ChangeStream.snapshot(users, user_keys)
+        user_clans_before = ChangeStream.snapshot(clans, user_clan_keys)
+    current_timestamp = TimeFormat.get_current_timestamp()
+    user_plan = plan_user_writes(
+        user_datas,
+        users,
+        clans,
+        current_timestamp,
+        config.USER_TOUCH_INTERVAL
+    )
+    # 用户数据中新增的工会，clan_info为插入时的默认值
+    for key in clan_keys:
+        if key[1] in user_plan['new_clans']:
+            for field in CLAN_INFO_FIELDS:
+                clans[key].setdefault(field, None)
+    user_plan['clan_snapshots'] = ChangeStream.snapshot(clans, user_clan_keys)
+    if ChangeStream.enabled():
+        clans_before = ChangeStream.snapshot(clans, clan_keys)
+    clan_plan = plan_clan_writes(clan_datas, clans)
+    write_user_plan(cur, user_plan)
+    write_clan_plan(cur, clan_plan, user_plan)
+    # 被user_info和clan_info的条件过滤的数据不写入缓存也不发送事件，计入stale
+    filtered_users = _fetch_filtered(
+        cur, f'{MAIN_DB}.user_info', 'account_id', 'last_battle_at',
+        [[row[0], row[5]] for row in user_plan['user_info'].values() if row[5] and row[0] not in user_plan['new_users']]
+    )
+    user_plan['filtered'] = [key for key in user_keys if key[1] in filtered_users]
+    user_plan['stale'].extend(user_plan['filtered'])
+    user_plan['snapshots'] = {key: users[key] for key in user_keys if key[1] not in filtered_users}
+    filtered_clans = _fetch_filtered(
+        cur, f'{MAIN_DB}.clan_info', 'clan_id', 'last_battle_at',
+        [[row[0], row[7]] for row in clan_plan['clan_info'].values() if row[7] and row[0] not in clan_plan['new_clans']]
+    )
+    clan_plan['stale'].extend(filtered_clans)
+    user_plan['changes'] = []
+    clan_plan['changes'] = []
+    if ChangeStream.enabled():
+        user_plan['changes'] = (
+            ChangeStream.diff('user', users_before, user_plan['snapshots'], USER_CHANGE_FIELDS, current_timestamp) +
+            ChangeStream.diff('clan', user_clans_before, user_plan['clan_snapshots'], CLAN_BASIC_CHANGE_FIELDS, current_timestamp)
+        )
+        clan_plan['changes'] = ChangeStream.diff(
+            'clan', clans_before, {key: clans[key] for key in clan_keys if key[1] not in filtered_clans},
+            CLAN_CHANGE_FIELDS, current_timestamp
+        )
+    return user_plan, clan_plan
+
+
+@ExceptionLogger.handle_database_exception_sync
+@DeadlockRetry.retry
+def bulk_update_user_data(user_datas: dict | list):
+    '''批量更新用户数据
+
+    与update_user_data结果一致，但整个批次只查询一次现有数据，并按表使用多行语句写入，
+    数据库往返次数不再随用户数量增长
+
+    所有用户都命中worker缓存且没有变化时直接返回，否则在事务内重新查询批次内所有用户的现有数据，
+    工会只查询缓存中没有的部分
+
+    参数:
+        user_datas [dict]
+    '''
+    if type(user_datas) == dict:
+        user_datas = [user_datas]
+    if is_cached_noop(user_datas, load_cached_users(user_datas)):
+        return JSONResponse.API_1000_Success
+    pool = DatabaseConnection.get_pool()
+    conn = pool.connection()
+    cur = None
+    try:
+        conn.begin()
+        cur = conn.cursor(pymysql.cursors.DictCursor)
+
+        plan = write_user_datas(cur, user_datas)
+
+        conn.commit()
+        cache_users(plan['snapshots'])
+        user_cache.invalidate(plan['filtered'])
+        clan_cache.set_many(plan['clan_snapshots'])
+        WorkerMetrics.count_rows(summarize_user_plan(plan))
+        FreshnessGuard.count(users=len(plan['stale']))
+        ChangeStream.publish(plan['changes'])
+        return JSONResponse.API_1000_Success
+    except Exception as e:
+        conn.rollback()
+        # 写入失败后缓存可能与数据库不一致
+        user_cache.invalidate(get_user_keys(user_datas))
+        clan_cache.invalidate(get_clan_keys(user_datas))
+        raise e
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+@ExceptionLogger.handle_database_exception_sync
+@DeadlockRetry.retry
+def bulk_update_clan_data(clan_datas: dict | list):
+    '''批量更新工会数据
+
+    与update_clan_data结果一致，整个批次只查询一次现有数据，
+    并将工会分为新增、变化、未变化三类后按表使用多行语句写入
+
+    参数:
+        clan_datas [dict]
+    '''
+    if type(clan_datas) == dict:
+        clan_datas = [clan_datas]
+    pool = DatabaseConnection.get_pool()
+    conn = pool.connection()
+    cur = None
+    try:
+        conn.begin()
+        cur = conn.cursor(pymysql.cursors.DictCursor)
+
+        plan = write_clan_datas(cur, clan_datas)
+
+        conn.commit()
+        # 工会数据可能发生变化，用户更新时重新查询
+        clan_cache.invalidate(get_clan_data_keys(clan_datas))
+        WorkerMetrics.count_rows(summarize_clan_plan(plan))
+        FreshnessGuard.count(clans=len(plan['stale']))
+        ChangeStream.publish(plan['changes'])
+        return JSONResponse.API_1000_Success
+    except Exception as e:
+        conn.rollback()
+        clan_cache.invalidate(get_clan_data_keys(clan_datas))
+        raise e
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+@ExceptionLogger.handle_database_exception_sync
+@DeadlockRetry.retry
+def bulk_update_data(user_datas: list, clan_datas: list):
+    '''在同一个事务中批量更新用户和工会数据
+
+    用于合并多个任务的写入，结果与先写入用户数据、再写入工会数据一致，
+    用户数据和工会数据中的工会合并后写入，所有表按固定顺序各写入一次，见write_datas
+
+    参数:
+        user_datas [dict]
+        clan_datas [dict]
+    '''
+    pool = DatabaseConnection.get_pool()
+    conn = pool.connection()
+    cur = None
+    try:
+        conn.begin()
+        cur = conn.cursor(pymysql.cursors.DictCursor)
+
+        user_plan, clan_plan = write_datas(cur, user_datas, clan_datas)
+
+        conn.commit()
+        if user_plan:
+            cache_users(user_plan['snapshots'])
+            user_cache.invalidate(user_plan['filtered'])
+            clan_cache.set_many(user_plan['clan_snapshots'])
+            WorkerMetrics.count_rows(summarize_user_plan(user_plan))
+            FreshnessGuard.count(users=len(user_plan['stale']))
+            ChangeStream.publish(user_plan['changes'])
+        if clan_plan:
+            clan_cache.invalidate(get_clan_data_keys(clan_datas))
+            WorkerMetrics.count_rows(summarize_clan_plan(clan_plan))
+            FreshnessGuard.count(clans=len(clan_plan['stale']))
+            ChangeStream.publish(clan_plan['changes'])
+        return JSONResponse.API_1000_Success
+    except Exception as e:
+        conn.rollback()
+        user_cache.invalidate(get_user_keys(user_datas))
+        clan_cache.invalidate(get_clan_keys(user_datas) + get_clan_data_keys(clan_datas))
+        raise e
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
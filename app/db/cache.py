@@ -0,0 +1,11 @@
+from app.utils import TTLCache
+from app.core import EnvConfig
+
+config = EnvConfig.get_config()
+
+# 最近一次写入成功的用户数据，key为(region_id, account_id)
+# 同一个worker内的所有协程共享
+user_cache = TTLCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL)
+
+# 已知存在的工会及最近一次写入的tag和league，key为(region_id, clan_id)
+clan_cache = TTLCache(config.CLAN_CACHE_SIZE, config.CLAN_CACHE_TTL)
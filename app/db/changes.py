@@ -0,0 +1,132 @@
+import os
+import json
+import threading
+
+from celery import current_app
+
+from app.core import EnvConfig
+
+config = EnvConfig.get_config()
+
+# 快照中的字段与数据表字段的对应关系，{表: {快照字段: 表字段}}
+USER_CHANGE_FIELDS = {
+    'user_basic': {'username': 'username'},
+    'user_info': {
+        'is_active': 'is_active',
+        'active_level': 'active_level',
+        'is_public': 'is_public',
+        'total_battles': 'total_battles',
+        'last_battle_time': 'last_battle_at'
+    },
+    'user_clan': {'clan_id': 'clan_id'}
+}
+CLAN_BASIC_CHANGE_FIELDS = {
+    'clan_basic': {'tag': 'tag', 'league1': 'league'}
+}
+CLAN_CHANGE_FIELDS = {
+    **CLAN_BASIC_CHANGE_FIELDS,
+    'clan_info': {
+        'is_active': 'is_active',
+        'season': 'season',
+        'public_rating': 'public_rating',
+        'league': 'league',
+        'division': 'division',
+        'division_rating': 'division_rating',
+        'last_battle_at': 'last_battle_at'
+    }
+}
+
+
+class ChangeStream:
+    '''写入数据的变更事件
+
+    每个发生变化的用户或工会生成一条事件，格式如下：
+    {
+        'entity': 'user' | 'clan',
+        'key': [region_id, account_id 或 clan_id],
+        'changes': {表: {字段: [旧值, 新值]}},
+        'time': 时间戳
+    }
+    新增的用户或工会旧值为None，只刷新updated_at的数据不会生成事件
+
+    事件在事务提交后按批次发送到CDC_SINK：
+        file: 追加写入LOG_PATH下的CDC_FILE文件(JSON Lines)
+        celery: 以列表作为参数发送CDC_TASK任务到CDC_QUEUE队列
+    CDC_SINK为空时不生成事件
+    '''
+    __lock = threading.Lock()
+    __stats = {
+        'events': 0,
+        'failed': 0
+    }
+
+    @staticmethod
+    def enabled() -> bool:
+        return config.CDC_SINK != ''
+
+    @staticmethod
+    def snapshot(items: dict, keys: list) -> dict:
+        "写入前复制现有数据，用于计算变化"
+        return {key: items[key].copy() for key in keys if key in items}
+
+    @staticmethod
+    def diff(entity: str, before: dict, after: dict, fields: dict, current_timestamp: int) -> list:
+        '''对比写入前后的快照，返回发生变化的实体的事件
+
+        参数:
+            entity: user或clan
+            before: 写入前的快照，不存在的key表示新增
+            after: 写入后的快照
+            fields: USER_CHANGE_FIELDS等字段对应关系
+        '''
+        events = []
+        for key, new in after.items():
+            old = before.get(key, {})
+            changes = {}
+            for table, columns in fields.items():
+                table_changes = {}
+                for field, column in columns.items():
+                    if field in new and old.get(field) != new[field]:
+                        table_changes[column] = [old.get(field), new[field]]
+                if table_changes != {}:
+                    changes[table] = table_changes
+            if changes != {}:
+                events.append({
+                    'entity': entity,
+                    'key': list(key),
+                    'changes': changes,
+                    'time': current_timestamp
+                })
+        return events
+
+    @classmethod
+    def publish(cls, events: list):
+        "发送事件，失败时只计数，不影响已经提交的写入"
+        if events == [] or not cls.enabled():
+            return
+        try:
+            if config.CDC_SINK == 'file':
+                cls.__write_file(events)
+            elif config.CDC_SINK == 'celery':
+                cls.__send_task(events)
+            else:
+                raise ValueError(f'Unknown CDC_SINK: {config.CDC_SINK}')
+            cls.__stats['events'] += len(events)
+        except Exception as e:
+            cls.__stats['failed'] += len(events)
+            print(e)
+
+    @classmethod
+    def __write_file(cls, events: list):
+        lines = ''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in events)
+        with cls.__lock:
+            with open(os.path.join(config.LOG_PATH, config.CDC_FILE), 'a', encoding='utf-8') as f:
+                f.write(lines)
+
+    @staticmethod
+    def __send_task(events: list):
+        current_app.send_task(name=config.CDC_TASK, args=[events], queue=config.CDC_QUEUE)
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        return dict(cls.__stats)
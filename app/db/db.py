@@ -1,23 +1,180 @@
+import sys
+import time
+import threading
+
 import pymysql
 from dbutils.pooled_db import PooledDB
 
 from app.core import EnvConfig
+from app.metrics import WorkerMetrics
+from .profiler import SQLProfiler
+from .limiter import db_limiter
+from .lanes import lane_gate
 
 config = EnvConfig.get_config()
 
+
+class PoolTimeoutError(pymysql.err.OperationalError):
+    "在等待时间内没有获取到连接池中的连接"
+    pass
+
+
+class PooledConnection:
+    '''从连接池中取出的连接
+
+    与PooledDB返回的连接用法相同，close时将连接归还连接池并释放占用的名额
+
+    开启SQL_PROFILE时cursor返回ProfilingCursor
+
+    记录从取出连接到提交的耗时，以及是否因为OperationalError回滚，归还连接时传给release
+    '''
+    def __init__(self, conn, release):
+        self.__conn = conn
+        self.__release = release
+        self.__closed = False
+        self.__start_time = time.perf_counter()
+        self.__latency = None
+        self.__error = False
+
+    def __getattr__(self, name):
+        return getattr(self.__conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return SQLProfiler.wrap_cursor(self.__conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        self.__conn.commit()
+        self.__latency = time.perf_counter() - self.__start_time
+
+    def rollback(self):
+        # 在except中回滚时，sys.exc_info()为导致回滚的异常
+        if isinstance(sys.exc_info()[1], pymysql.err.OperationalError):
+            self.__error = True
+        self.__conn.rollback()
+
+    def close(self):
+        if not self.__closed:
+            self.__closed = True
+            try:
+                self.__conn.close()
+            finally:
+                self.__release(self.__latency, self.__error)
+
+    def __del__(self):
+        self.close()
+
+
+class ConnectionPool:
+    '''带有超时和统计的连接池
+
+    在PooledDB外层使用信号量限制同时取出的连接数量，等待超过timeout秒后抛出PoolTimeoutError，
+    传入limiter时先通过AdaptiveLimiter占用名额，同时取出的连接数量不超过limiter当前的上限，
+    传入gate时按当前协程所在的优先级通道(LaneGate.get_lane)向limiter占用名额，保证每个通道都有保留的名额
+
+    eventlet会将threading替换为协程实现，等待连接时只会挂起当前协程
+    '''
+    def __init__(
+        self,
+        creator,
+        max_connections: int,
+        min_cached: int,
+        max_cached: int,
+        timeout: float,
+        ping: int = 1,
+        max_usage: int = 0,
+        limiter=None,
+        gate=None,
+        **kwargs
+    ):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.limiter = limiter
+        self.gate = gate
+        self.__pool = PooledDB(
+            creator=creator,
+            maxconnections=max_connections,  # 最大连接数
+            mincached=min_cached,            # 初始化时，连接池中至少创建的空闲的连接
+            maxcached=max_cached,            # 最大缓存的连接
+            blocking=True,                   # 连接池中如果没有可用连接后，是否阻塞
+            ping=ping,                       # 何时检查连接是否可用，1为每次从连接池中取出时
+            maxusage=max_usage,              # 单个连接最多使用的次数，超过后重新建立连接
+            **kwargs
+        )
+        self.__slots = threading.BoundedSemaphore(max_connections)
+        self.__active = 0
+        self.__stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0
+        }
+
+    def connection(self):
+        "从连接池中取出一个连接，需要调用close归还"
+        start_time = time.perf_counter()
+        lane = self.gate.get_lane() if self.gate else None
+        if self.limiter and not self.limiter.acquire(timeout=self.timeout, lane=lane):
+            self.__stats['timeouts'] += 1
+            raise PoolTimeoutError(0, f'Timed out after {self.timeout}s waiting for the concurrency limiter')
+        if not self.__slots.acquire(timeout=self.__remaining(start_time)):
+            self.__stats['timeouts'] += 1
+            if self.limiter:
+                self.limiter.release(lane=lane)
+            raise PoolTimeoutError(0, f'Timed out after {self.timeout}s waiting for a pooled connection')
+        try:
+            conn = self.__pool.connection()
+        except Exception as e:
+            self.__slots.release()
+            if self.limiter:
+                self.limiter.release(error=isinstance(e, pymysql.err.OperationalError), lane=lane)
+            raise
+        wait_time = time.perf_counter() - start_time
+        self.__active += 1
+        self.__stats['checkouts'] += 1
+        self.__stats['wait_seconds_total'] += wait_time
+        self.__stats['wait_seconds_max'] = max(self.__stats['wait_seconds_max'], wait_time)
+        WorkerMetrics.observe_pool_wait(wait_time, lane)
+        return PooledConnection(conn, lambda latency, error: self.__release(latency, error, lane))
+
+    def __remaining(self, start_time: float) -> float:
+        return max(self.timeout - (time.perf_counter() - start_time), 0)
+
+    def __release(self, latency: float = None, error: bool = False, lane: str = None):
+        self.__active -= 1
+        self.__slots.release()
+        if self.limiter:
+            self.limiter.release(latency, error, lane)
+
+    def close(self):
+        self.__pool.close()
+
+    def get_stats(self) -> dict:
+        stats = dict(self.__stats)
+        stats['active'] = self.__active
+        # PooledDB没有提供空闲连接数量的接口
+        stats['idle'] = len(getattr(self.__pool, '_idle_cache', []))
+        stats['max_connections'] = self.max_connections
+        return stats
+
+
 class DatabaseConnection:
     _pool = None
 
     @classmethod
     def init_pool(cls):
         try:
-            cls._pool = PooledDB(
+            cls._pool = ConnectionPool(
                 creator=pymysql,
-                maxconnections=2,  # 最大连接数
-                mincached=1,        # 初始化时，连接池中至少创建的空闲的连接
-                maxcached=2,        # 最大缓存的连接
-                blocking=True,      # 连接池中如果没有可用连接后，是否阻塞
+                max_connections=config.MYSQL_POOL_SIZE,
+                min_cached=config.MYSQL_POOL_MIN_CACHED,
+                max_cached=config.MYSQL_POOL_MAX_CACHED,
+                timeout=config.MYSQL_POOL_TIMEOUT,
+                ping=config.MYSQL_POOL_PING,
+                max_usage=config.MYSQL_POOL_MAX_USAGE,
+                limiter=db_limiter if config.DB_LIMIT_ENABLED or config.TASK_LANES else None,
+                gate=lane_gate if config.TASK_LANES else None,
                 host=config.MYSQL_HOST,
+                port=config.MYSQL_PORT,
                 user=config.MYSQL_USERNAME,
                 password=config.MYSQL_PASSWORD,
                 charset='utf8mb4',
@@ -30,7 +187,7 @@ class DatabaseConnection:
     def close_pool(cls):
         if cls._pool:
             cls._pool.close()
-    
+
     @classmethod
     def get_pool(cls):
         if cls._pool:
@@ -39,4 +196,11 @@ class DatabaseConnection:
             cls.init_pool()
             return cls._pool
 
+    @classmethod
+    def get_stats(cls) -> dict:
+        "连接池的统计数据，连接池未初始化时返回空字典"
+        if cls._pool and hasattr(cls._pool, 'get_stats'):
+            return cls._pool.get_stats()
+        return {}
+
 
@@ -0,0 +1,70 @@
+import os
+import json
+import threading
+
+from app.utils import TimeFormat
+from app.core import EnvConfig
+
+config = EnvConfig.get_config()
+
+
+class DeadLetterStore:
+    '''本地死信存储
+
+    多次重试后仍然写入失败的数据以JSON Lines格式追加到LOG_PATH下的DEAD_LETTER_FILE文件中，
+    每行格式如下：
+    {'type': 'user' | 'clan', 'data': 原始数据, 'error': 错误信息, 'attempts': 尝试次数, 'time': 时间}
+
+    重放时先将文件重命名为.replay文件再读取，重放期间新的死信写入新的文件，
+    重放中断后下一次重放会继续处理遗留的.replay文件
+    '''
+    __lock = threading.Lock()
+    __stats = {
+        'written': 0,
+        'failed': 0
+    }
+
+    @staticmethod
+    def get_path() -> str:
+        return os.path.join(config.LOG_PATH, config.DEAD_LETTER_FILE)
+
+    @classmethod
+    def put(cls, record_type: str, data: dict, error: str, attempts: int):
+        line = json.dumps({
+            'type': record_type,
+            'data': data,
+            'error': error,
+            'attempts': attempts,
+            'time': TimeFormat.get_form_time()
+        }, ensure_ascii=False) + '\n'
+        with cls.__lock:
+            try:
+                with open(cls.get_path(), 'a', encoding='utf-8') as f:
+                    f.write(line)
+                cls.__stats['written'] += 1
+            except Exception as e:
+                cls.__stats['failed'] += 1
+                print(e)
+
+    @classmethod
+    def take(cls) -> list:
+        "取出所有等待重放的死信，处理完成后需要调用finish删除"
+        path = cls.get_path()
+        replay_path = path + '.replay'
+        with cls.__lock:
+            if not os.path.exists(replay_path) and os.path.exists(path):
+                os.replace(path, replay_path)
+        if not os.path.exists(replay_path):
+            return []
+        with open(replay_path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    @classmethod
+    def finish(cls):
+        replay_path = cls.get_path() + '.replay'
+        if os.path.exists(replay_path):
+            os.remove(replay_path)
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        return dict(cls.__stats)
@@ -0,0 +1,109 @@
+import time
+
+import pymysql
+
+from app.response import JSONResponse
+from app.log import ExceptionLogger
+from app.utils import TimeFormat
+from app.utils.common_utils import ACTIVE_LEVEL_LIMITS
+from app.core import EnvConfig
+from app.metrics import WorkerMetrics
+
+from .db import DatabaseConnection
+
+config = EnvConfig.get_config()
+
+MAIN_DB = config.DB_NAME_MAIN
+
+# 与CommonUtils.get_active_level相同的分级，%s为本次任务使用的时间戳
+ACTIVE_LEVEL_CASE = (
+    "CASE " +
+    ' '.join(
+        f"WHEN %s - UNIX_TIMESTAMP(last_battle_at) <= {limit} THEN {index + 2}"
+        for index, limit in enumerate(ACTIVE_LEVEL_LIMITS)
+    ) +
+    " ELSE 9 END"
+)
+
+
+def _get_chunk_end(cur, start_id: int, chunk_size: int) -> int | None:
+    "按主键顺序获取从start_id之后chunk_size行的最后一个account_id，没有更多数据时返回None"
+    cur.execute(
+        f"SELECT MAX(account_id) AS end_id FROM ("
+        f"SELECT account_id FROM {MAIN_DB}.user_info WHERE account_id > %s "
+        f"ORDER BY account_id LIMIT %s"
+        f") AS t;",
+        [start_id, chunk_size]
+    )
+    return cur.fetchone()['end_id']
+
+def _decay_chunk(cur, start_id: int, end_id: int, current_timestamp: int) -> int:
+    '''在数据库中重新计算(start_id, end_id]范围内用户的active_level
+
+    只处理由时间决定的等级(2-8)，并且只会升高等级，避免覆盖同时写入的更新的数据
+    '''
+    cur.execute(
+        f"UPDATE {MAIN_DB}.user_info "
+        f"SET active_level = {ACTIVE_LEVEL_CASE} "
+        f"WHERE account_id > %s AND account_id <= %s "
+        f"AND is_active = 1 AND active_level BETWEEN 2 AND 8 AND last_battle_at IS NOT NULL "
+        f"AND active_level < {ACTIVE_LEVEL_CASE};",
+        [current_timestamp] * len(ACTIVE_LEVEL_LIMITS) + [start_id, end_id] +
+        [current_timestamp] * len(ACTIVE_LEVEL_LIMITS)
+    )
+    return cur.rowcount
+
+@ExceptionLogger.handle_database_exception_sync
+def decay_active_level(chunk_size: int = None, sleep: float = None, start_id: int = 0):
+    '''按时间重新计算user_info中的active_level
+
+    按主键分块遍历user_info，每块在数据库中执行一条UPDATE并单独提交，数据不会读取到worker中，
+    每块之间释放连接并等待sleep秒，避免影响正常的数据写入
+
+    参数:
+        chunk_size: 每块的行数，默认为ACTIVE_LEVEL_DECAY_CHUNK_SIZE
+        sleep: 每块之间的等待时间(秒)，默认为ACTIVE_LEVEL_DECAY_SLEEP
+        start_id: 从大于该值的account_id开始
+
+    返回:
+        {'chunks': 处理的块数, 'updated': 更新的行数, 'end_id': 最后处理的account_id}
+    '''
+    chunk_size = chunk_size or config.ACTIVE_LEVEL_DECAY_CHUNK_SIZE
+    sleep = config.ACTIVE_LEVEL_DECAY_SLEEP if sleep is None else sleep
+    # 所有分块使用同一个时间戳
+    current_timestamp = TimeFormat.get_current_timestamp()
+    pool = DatabaseConnection.get_pool()
+    chunks = 0
+    updated = 0
+    while True:
+        conn = pool.connection()
+        cur = None
+        try:
+            conn.begin()
+            cur = conn.cursor(pymysql.cursors.DictCursor)
+
+            end_id = _get_chunk_end(cur, start_id, chunk_size)
+            if end_id is None:
+                conn.commit()
+                break
+            count = _decay_chunk(cur, start_id, end_id, current_timestamp)
+
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            if cur:
+                cur.close()
+            conn.close()
+        chunks += 1
+        updated += count
+        start_id = end_id
+        WorkerMetrics.count_rows([('user_info', 'decay', count)])
+        if sleep > 0:
+            time.sleep(sleep)
+    return JSONResponse.get_success_response({
+        'chunks': chunks,
+        'updated': updated,
+        'end_id': start_id
+    })
@@ -0,0 +1,69 @@
+class FreshnessGuard:
+    '''丢弃比数据库中的数据更旧的用户和工会数据
+
+    任务重试或者乱序执行时，较早抓取的数据可能在较新的数据之后到达，直接写入会使last_battle_at和total_battles倒退
+
+    以last_battle_time/last_battle_at作为数据的版本：
+        用户: 活跃用户的last_battle_time(不为0)早于数据库中的值，或者相同但公开数据的total_battles小于数据库中的值
+        工会: 活跃工会的last_battle_at早于数据库中的值，且season_number没有比数据库中的season大
+    满足条件的数据整条跳过(包括名称和工会)，时间为0或者数据库中还没有时间的数据不受影响
+
+    写入clan_info和user_info的语句中同样带有last_battle_at不倒退的条件，
+    用于处理读取现有数据之后其他事务写入了更新的数据的情况，被过滤的数据写入后重新查询得到，
+    同样计入统计，不写入缓存也不发送变更事件
+    '''
+    __stats = {
+        'stale_users': 0,
+        'stale_clans': 0
+    }
+
+    @staticmethod
+    def is_stale_user(info: dict | None, user: dict) -> bool:
+        '''判断用户数据是否比现有数据旧
+
+        参数:
+            info: 用户数据中的info部分
+            user: 现有数据，包含last_battle_time, total_battles
+        '''
+        if info == None or info == {} or not info.get('is_active'):
+            return False
+        new_time = info.get('last_battle_time')
+        old_time = user.get('last_battle_time')
+        if not new_time or old_time is None:
+            return False
+        if new_time != old_time:
+            return new_time < old_time
+        new_battles = info.get('total_battles')
+        old_battles = user.get('total_battles')
+        return bool(info.get('is_public')) and new_battles is not None and old_battles is not None and new_battles < old_battles
+
+    @staticmethod
+    def is_stale_clan(info: dict | None, last_battle_at: int | None, season: int | None) -> bool:
+        '''判断工会数据是否比现有数据旧
+
+        新赛季的数据总是比上赛季的数据新，即使last_battle_at更早
+
+        参数:
+            info: 工会数据中的info部分
+            last_battle_at: 数据库中的last_battle_at时间戳
+            season: 数据库中的season
+        '''
+        if info == None or info == {} or not info.get('is_active'):
+            return False
+        new_time = info.get('last_battle_at')
+        if not new_time or not last_battle_at:
+            return False
+        new_season = info.get('season_number')
+        if new_season is not None and season is not None and new_season > season:
+            return False
+        return new_time < last_battle_at
+
+    @classmethod
+    def count(cls, users: int = 0, clans: int = 0):
+        "记录跳过的数据条数，需要在事务提交后调用"
+        cls.__stats['stale_users'] += users
+        cls.__stats['stale_clans'] += clans
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        return dict(cls.__stats)
@@ -0,0 +1,65 @@
+import threading
+from contextlib import contextmanager
+
+from app.core import EnvConfig
+
+config = EnvConfig.get_config()
+
+LANES = ['high', 'low']
+
+
+class LaneGate:
+    '''按优先级通道(high/low)限制任务并发数量，并记录当前协程所在的通道
+
+    任务通过use(lane)进入通道，同一个通道内同时执行的任务数量不超过concurrency[lane]，
+    任务内取出连接时，ConnectionPool按get_lane()的通道向AdaptiveLimiter占用名额，
+    每个通道保留的名额见AdaptiveLimiter
+
+    eventlet会将threading替换为协程实现，threading.local为每个协程单独保存
+    '''
+    def __init__(self, concurrency: dict):
+        self.__local = threading.local()
+        self.__tasks = {}
+        self.__stats = {}
+        for lane in LANES:
+            self.__tasks[lane] = threading.BoundedSemaphore(concurrency[lane]) if concurrency.get(lane, 0) > 0 else None
+            self.__stats[lane] = {
+                'in_flight': 0,
+                'task_waits': 0
+            }
+
+    def get_lane(self) -> str | None:
+        return getattr(self.__local, 'lane', None)
+
+    @contextmanager
+    def use(self, lane: str | None):
+        "在通道内执行，lane为None时不限制"
+        if lane not in self.__tasks:
+            yield
+            return
+        semaphore = self.__tasks[lane]
+        if semaphore and not semaphore.acquire(blocking=False):
+            self.__stats[lane]['task_waits'] += 1
+            semaphore.acquire()
+        previous = self.get_lane()
+        self.__local.lane = lane
+        self.__stats[lane]['in_flight'] += 1
+        try:
+            yield
+        finally:
+            self.__stats[lane]['in_flight'] -= 1
+            self.__local.lane = previous
+            if semaphore:
+                semaphore.release()
+
+    def get_stats(self) -> dict:
+        return {
+            f'{lane}_{key}': value
+            for lane in LANES
+            for key, value in self.__stats[lane].items()
+        }
+
+
+lane_gate = LaneGate(
+    {'high': config.HIGH_LANE_CONCURRENCY, 'low': config.LOW_LANE_CONCURRENCY}
+)
@@ -0,0 +1,153 @@
+import math
+import threading
+
+from app.core import EnvConfig
+
+config = EnvConfig.get_config()
+
+
+class AdaptiveLimiter:
+    '''按数据库延迟和错误率自适应调整同时进行的事务数量(AIMD)
+
+    每个事务从取出连接时占用一个名额，归还连接时释放，并记录从取出连接到提交的耗时以及是否因OperationalError回滚
+
+    每window个事务计算一次平均耗时和错误率：
+        平均耗时超过target_latency或错误率超过error_rate时，上限乘以decrease(不低于min_limit)
+        否则上限加1(不超过max_limit)
+    窗口内的错误数已经超过window * error_rate时立即下调，不等待窗口结束
+
+    reserved为每个优先级通道保留的名额(按max_limit计算)，上限下调时按比例缩小(至少为1)，
+    每个通道最多占用 当前上限 - 其他通道保留的名额，因此上限降到很低时高优先级通道仍然有名额可用，
+    acquire时lane为None(不在通道内，例如命令行工具)时只受总的上限限制
+
+    adaptive为False时上限固定为max_limit，只用于按通道保留名额
+
+    eventlet会将threading替换为协程实现，等待名额时只会挂起当前协程
+    '''
+    def __init__(
+        self,
+        min_limit: int,
+        max_limit: int,
+        target_latency: float,
+        error_rate: float,
+        window: int,
+        decrease: float,
+        reserved: dict = None,
+        adaptive: bool = True
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.target_latency = target_latency
+        self.error_rate = error_rate
+        self.window = max(1, window)
+        self.decrease = decrease
+        self.reserved = {lane: count for lane, count in (reserved or {}).items() if count > 0}
+        self.adaptive = adaptive
+        self.__limit = float(self.max_limit)
+        self.__in_flight = 0
+        self.__lanes = {lane: 0 for lane in self.reserved}
+        self.__lane_waits = {lane: 0 for lane in self.reserved}
+        self.__condition = threading.Condition()
+        self.__samples = 0
+        self.__errors = 0
+        self.__latency_total = 0.0
+        self.__stats = {
+            'throttles': 0,
+            'increases': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'transactions': 0,
+            'errors': 0
+        }
+
+    def acquire(self, timeout: float = None, lane: str = None) -> bool:
+        "为lane通道占用一个名额，超过timeout秒仍然没有空闲的名额时返回False"
+        if lane not in self.__lanes:
+            lane = None
+        with self.__condition:
+            if not self.__available(lane):
+                self.__stats['waits'] += 1
+                if lane:
+                    self.__lane_waits[lane] += 1
+                if not self.__condition.wait_for(lambda: self.__available(lane), timeout):
+                    self.__stats['timeouts'] += 1
+                    return False
+            self.__in_flight += 1
+            if lane:
+                self.__lanes[lane] += 1
+            return True
+
+    def get_lane_limit(self, lane: str, limit: int = None) -> int:
+        "通道当前最多可以占用的名额，其他通道保留的名额按当前上限与max_limit的比例缩小"
+        limit = int(self.__limit) if limit is None else limit
+        others = sum(
+            math.ceil(count * limit / self.max_limit)
+            for other, count in self.reserved.items() if other != lane
+        )
+        return max(1, limit - others)
+
+    def release(self, latency: float = None, error: bool = False, lane: str = None):
+        '''释放名额并记录本次事务的结果
+
+        latency为None(没有提交也没有出错，例如只读的连接)时只释放名额，lane需要与acquire时相同
+        '''
+        with self.__condition:
+            self.__in_flight -= 1
+            if lane in self.__lanes:
+                self.__lanes[lane] -= 1
+            if self.adaptive and (latency is not None or error):
+                self.__stats['transactions'] += 1
+                self.__samples += 1
+                self.__latency_total += latency or 0.0
+                if error:
+                    self.__stats['errors'] += 1
+                    self.__errors += 1
+                if self.__samples >= self.window or self.__errors > self.window * self.error_rate:
+                    self.__adjust()
+            self.__condition.notify_all()
+
+    def __available(self, lane: str | None) -> bool:
+        limit = int(self.__limit)
+        if self.__in_flight >= limit:
+            return False
+        if lane is None:
+            return True
+        return self.__lanes[lane] < self.get_lane_limit(lane, limit)
+
+    def __adjust(self):
+        average = self.__latency_total / self.__samples
+        if self.__errors > self.__samples * self.error_rate or average > self.target_latency:
+            limit = max(float(self.min_limit), self.__limit * self.decrease)
+            if int(limit) < int(self.__limit):
+                self.__stats['throttles'] += 1
+            self.__limit = limit
+        elif self.__limit < self.max_limit:
+            self.__limit = min(float(self.max_limit), self.__limit + 1)
+            self.__stats['increases'] += 1
+        self.__samples = 0
+        self.__errors = 0
+        self.__latency_total = 0.0
+
+    def get_limit(self) -> int:
+        return int(self.__limit)
+
+    def get_stats(self) -> dict:
+        stats = dict(self.__stats)
+        stats['limit'] = int(self.__limit)
+        stats['in_flight'] = self.__in_flight
+        for lane in self.__lanes:
+            stats[f'{lane}_connections'] = self.__lanes[lane]
+            stats[f'{lane}_connection_waits'] = self.__lane_waits[lane]
+        return stats
+
+
+db_limiter = AdaptiveLimiter(
+    config.DB_LIMIT_MIN,
+    config.DB_LIMIT_MAX or config.MYSQL_POOL_SIZE,
+    config.DB_LIMIT_TARGET_LATENCY,
+    config.DB_LIMIT_ERROR_RATE,
+    config.DB_LIMIT_WINDOW,
+    config.DB_LIMIT_DECREASE,
+    {'high': config.HIGH_LANE_RESERVED_CONNECTIONS, 'low': config.LOW_LANE_RESERVED_CONNECTIONS} if config.TASK_LANES else None,
+    config.DB_LIMIT_ENABLED
+)
@@ -0,0 +1,282 @@
+import json
+import hashlib
+
+import pymysql
+
+from app.response import JSONResponse
+from app.log import ExceptionLogger
+from app.utils import TimeFormat
+from app.core import EnvConfig
+from app.metrics import WorkerMetrics
+
+from .db import DatabaseConnection
+from .retry import DeadlockRetry
+from .changes import ChangeStream
+from .bulk import fetch_values, execute_values, update_values, sort_rows
+
+config = EnvConfig.get_config()
+
+MAIN_DB = config.DB_NAME_MAIN
+
+
+def get_member_hash(members: set) -> str:
+    "成员列表的哈希，与成员顺序无关"
+    return hashlib.sha256(','.join(str(account_id) for account_id in sorted(members)).encode()).hexdigest()
+
+def _get_rosters(clan_members: dict | list) -> dict:
+    '''整理参数，同一个工会出现多次时以最后一次为准
+
+    返回值格式如下：
+    {
+        (region_id, clan_id): {account_id, ...}
+    }
+    '''
+    if type(clan_members) == dict:
+        clan_members = [clan_members]
+    rosters = {}
+    for clan in clan_members:
+        rosters[(clan['region_id'], clan['clan_id'])] = set(int(account_id) for account_id in clan['members'])
+    return rosters
+
+def _fetch_stored(cur, clan_ids: list) -> dict:
+    "查询clan_users中保存的成员列表，返回{clan_id: row}"
+    rows = fetch_values(
+        cur,
+        f"SELECT clan_id, hash_value, user_data FROM {MAIN_DB}.clan_users WHERE clan_id IN (",
+        '%s',
+        [[clan_id] for clan_id in clan_ids],
+        ')'
+    )
+    return {row['clan_id']: row for row in rows}
+
+def _fetch_existing_clans(cur, keys: list) -> set:
+    "clan_basic中存在的工会，返回{(region_id, clan_id), ...}"
+    rows = fetch_values(
+        cur,
+        f"SELECT region_id, clan_id FROM {MAIN_DB}.clan_basic WHERE (region_id, clan_id) IN (",
+        '(%s, %s)',
+        list(keys),
+        ')'
+    )
+    return set((row['region_id'], row['clan_id']) for row in rows)
+
+def _fetch_user_clan(cur, clan_ids: list) -> dict:
+    "clan_users中没有成员列表时，从user_clan中查询当前记录在这些工会中的用户，返回{clan_id: {account_id, ...}}"
+    result = {clan_id: set() for clan_id in clan_ids}
+    rows = fetch_values(
+        cur,
+        f"SELECT account_id, clan_id FROM {MAIN_DB}.user_clan WHERE clan_id IN (",
+        '%s',
+        [[clan_id] for clan_id in clan_ids],
+        ')'
+    )
+    for row in rows:
+        result[row['clan_id']].add(row['account_id'])
+    return result
+
+def _fetch_member_clans(cur, account_ids: list) -> dict:
+    "user_clan中记录的用户当前所在的工会，返回{account_id: clan_id}，不包括user_clan中还没有的用户"
+    rows = fetch_values(
+        cur,
+        f"SELECT account_id, clan_id FROM {MAIN_DB}.user_clan WHERE account_id IN (",
+        '%s',
+        [[account_id] for account_id in account_ids],
+        ')'
+    )
+    return {row['account_id']: row['clan_id'] for row in rows}
+
+def plan_member_writes(cur, rosters: dict) -> dict:
+    '''对比新的成员列表和数据库中保存的成员列表，计算加入和离开的用户
+
+    clan_users中还没有成员列表的工会以user_clan中的记录作为原有成员
+
+    成员的user_clan与工会不一致的用户作为加入处理(包括新加入的用户，以及user_clan被update_user_data清空或改为其他工会的用户)，
+    哈希值与clan_users中的hash_value一致、并且所有成员的user_clan都与工会一致的工会跳过，
+    原有成员中不在新成员列表中、user_clan仍然是该工会的用户作为离开处理
+
+    clan_basic中还没有的工会整个跳过，user_clan中还没有的用户不会加入，也不会保存到clan_users的成员列表和哈希中，
+    这样的工会每次同步都会重新比较，直到这些用户通过update_user_data创建
+    '''
+    plan = {
+        'unchanged': 0,
+        'clan_users': [],    # [clan_id, hash_value, user_data]
+        'clan_users_missing': [],    # 不存在clan_users记录的工会，[clan_id, hash_value, user_data]
+        'joins': [],    # [account_id, clan_id]
+        'leaves': [],    # [account_id, clan_id]
+        'previous': {},    # 加入的用户原来的工会，{account_id: clan_id}
+        'unknown': 0,    # 成员列表中数据库里还没有的用户
+        'unknown_clans': 0,    # 数据库里还没有的工会
+        'regions': {}    # {clan_id: region_id}
+    }
+    # clan_basic中还没有的工会跳过，由update_clan_data创建工会时一起插入clan_users，
+    # 在这里插入clan_users会导致之后创建工会时主键冲突
+    existing_clans = _fetch_existing_clans(cur, rosters)
+    plan['unknown_clans'] = len(rosters) - len(existing_clans)
+    rosters = {key: members for key, members in rosters.items() if key in existing_clans}
+    if rosters == {}:
+        return plan
+    clan_ids = [clan_id for _, clan_id in rosters]
+    stored = _fetch_stored(cur, clan_ids)
+    scanned = _fetch_user_clan(
+        cur, [clan_id for clan_id in clan_ids if stored.get(clan_id, {}).get('user_data') is None]
+    )
+    old_rosters = {}
+    for key in rosters:
+        clan_id = key[1]
+        old_rosters[key] = scanned[clan_id] if clan_id in scanned else set(json.loads(stored[clan_id]['user_data']))
+    account_ids = set()
+    for key, members in rosters.items():
+        account_ids |= members | old_rosters[key]
+    current = _fetch_member_clans(cur, sorted(account_ids))
+
+    changed = {}
+    joins = {}
+    leaves = {}
+    for key, members in rosters.items():
+        clan_id = key[1]
+        row = stored.get(clan_id)
+        moved = [account_id for account_id in members if account_id in current and current[account_id] != clan_id]
+        if row and row['hash_value'] == get_member_hash(members) and moved == []:
+            plan['unchanged'] += 1
+            continue
+        changed[key] = members
+        for account_id in moved:
+            joins[account_id] = clan_id
+        for account_id in old_rosters[key] - members:
+            leaves[account_id] = clan_id
+    # 离开的用户只在user_clan仍然是该工会时写入，同一批次中从一个工会离开并加入另一个工会的用户只保留加入
+    leaves = {
+        account_id: clan_id for account_id, clan_id in leaves.items()
+        if account_id not in joins and current.get(account_id) == clan_id
+    }
+    unknown = set()
+    for key, members in changed.items():
+        unknown |= set(account_id for account_id in members if account_id not in current)
+    for key, members in changed.items():
+        clan_id = key[1]
+        row = stored.get(clan_id)
+        # 不存在的用户不保存到成员列表中，用户创建后的下一次同步仍然会作为加入处理
+        saved = members - unknown
+        hash_value = get_member_hash(saved)
+        if row and row['hash_value'] == hash_value:
+            continue
+        item = [clan_id, hash_value, json.dumps(sorted(saved))]
+        if row:
+            plan['clan_users'].append(item)
+        else:
+            plan['clan_users_missing'].append(item)
+    plan['unknown'] = len(unknown)
+    plan['joins'] = sort_rows([account_id, clan_id] for account_id, clan_id in joins.items())
+    plan['leaves'] = sort_rows([account_id, clan_id] for account_id, clan_id in leaves.items())
+    plan['previous'] = {account_id: current[account_id] for account_id in joins}
+    plan['regions'] = {clan_id: region_id for region_id, clan_id in changed}
+    return plan
+
+def write_member_plan(cur, plan: dict):
+    '''按user_clan, clan_users的顺序写入，行按主键排序
+
+    表顺序与update_user_data一致(user_clan在clan_users之前)，加入和离开的用户合并为一条语句，
+    保证user_clan中的行按account_id的顺序加锁，见sort_rows
+    '''
+    # [account_id, clan_id, joined]，离开的用户只在仍然属于该工会时清空，避免覆盖其他途径写入的新工会
+    rows = sort_rows(
+        [[account_id, clan_id, 1] for account_id, clan_id in plan['joins']] +
+        [[account_id, clan_id, 0] for account_id, clan_id in plan['leaves']]
+    )
+    if rows != []:
+        update_values(
+            cur, f'{MAIN_DB}.user_clan', 'account_id', ['clan_id', 'joined'], rows,
+            "t.updated_at = CASE WHEN v.joined = 1 OR t.clan_id = v.clan_id THEN CURRENT_TIMESTAMP ELSE t.updated_at END, "
+            "t.clan_id = CASE WHEN v.joined = 1 THEN v.clan_id WHEN t.clan_id = v.clan_id THEN NULL ELSE t.clan_id END"
+        )
+    if plan['clan_users'] != []:
+        update_values(
+            cur, f'{MAIN_DB}.clan_users', 'clan_id', ['hash_value', 'user_data'], sort_rows(plan['clan_users']),
+            "t.hash_value = v.hash_value, t.user_data = v.user_data, t.updated_at = CURRENT_TIMESTAMP"
+        )
+    if plan['clan_users_missing'] != []:
+        execute_values(
+            cur,
+            f"INSERT INTO {MAIN_DB}.clan_users (clan_id, hash_value, user_data) VALUES ",
+            '(%s, %s, %s)',
+            sort_rows(plan['clan_users_missing'])
+        )
+
+def summarize_member_plan(plan: dict) -> list:
+    "计算各表写入的行数，用于WorkerMetrics.count_rows"
+    return [
+        ('clan_users', 'updated', len(plan['clan_users'])),
+        ('clan_users', 'inserted', len(plan['clan_users_missing'])),
+        ('user_clan', 'updated', len(plan['joins']) + len(plan['leaves']))
+    ]
+
+def get_member_events(plan: dict) -> list:
+    "加入和离开的用户的user_clan变更事件，离开的用户旧值为原工会，加入的用户旧值为user_clan中原来的工会"
+    current_timestamp = TimeFormat.get_current_timestamp()
+    events = []
+    for rows, to_change in [
+        (plan['leaves'], lambda account_id, clan_id: [clan_id, None]),
+        (plan['joins'], lambda account_id, clan_id: [plan['previous'][account_id], clan_id])
+    ]:
+        for account_id, clan_id in rows:
+            events.append({
+                'entity': 'user',
+                'key': [plan['regions'][clan_id], account_id],
+                'changes': {'user_clan': {'clan_id': to_change(account_id, clan_id)}},
+                'time': current_timestamp
+            })
+    return events
+
+@ExceptionLogger.handle_database_exception_sync
+@DeadlockRetry.retry
+def sync_clan_members(clan_members: dict | list):
+    '''根据工会当前的成员列表同步clan_users和user_clan
+
+    成员列表的哈希与clan_users中保存的一致、并且所有成员的user_clan都是该工会时不写入，
+    否则与保存的成员列表做集合差集得到离开的用户，user_clan与工会不一致的成员作为加入的用户，
+    在同一个事务中更新clan_users的成员列表以及这些用户的user_clan
+
+    数据库中还不存在的用户不会写入，用户通过update_user_data创建后，下一次同步时作为加入处理，
+    数据库中还不存在的工会整个跳过
+
+    参数:
+        clan_members [dict]，格式为{'region_id': region_id, 'clan_id': clan_id, 'members': [account_id, ...]}
+
+    返回:
+        {'clans': 工会数, 'unchanged': 成员未变化的工会数, 'joined': 加入的用户数, 'left': 离开的用户数, 'unknown': 不存在的用户数, 'unknown_clans': 不存在的工会数}
+    '''
+    rosters = _get_rosters(clan_members)
+    if rosters == {}:
+        return JSONResponse.get_success_response(
+            {'clans': 0, 'unchanged': 0, 'joined': 0, 'left': 0, 'unknown': 0, 'unknown_clans': 0}
+        )
+    pool = DatabaseConnection.get_pool()
+    conn = pool.connection()
+    cur = None
+    plan = None
+    try:
+        conn.begin()
+        cur = conn.cursor(pymysql.cursors.DictCursor)
+
+        plan = plan_member_writes(cur, rosters)
+        write_member_plan(cur, plan)
+
+        conn.commit()
+        WorkerMetrics.count_rows(summarize_member_plan(plan))
+        if ChangeStream.enabled():
+            ChangeStream.publish(get_member_events(plan))
+        return JSONResponse.get_success_response({
+            'clans': len(rosters),
+            'unchanged': plan['unchanged'],
+            'joined': len(plan['joins']),
+            'left': len(plan['leaves']),
+            'unknown': plan['unknown'],
+            'unknown_clans': plan['unknown_clans']
+        })
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
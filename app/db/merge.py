@@ -0,0 +1,108 @@
+class UpdateMerger:
+    '''在执行SQL之前合并同一批次内重复的用户和工会数据
+
+    同一个用户(region_id, account_id)或工会(region_id, clan_id)出现多次时只保留一条：
+    按照last_battle_time/last_battle_at从旧到新依次合并，时间相同时以后出现的为准，
+    没有时间(None或0，例如不活跃的用户)的数据按到达顺序排在之前出现过的最新时间之后，
+    不会因为没有时间而被之前到达的旧数据覆盖，较新数据中不为None的字段覆盖较旧的数据
+
+    用户的clan字段整体替换，因为clan.id为None表示用户没有工会
+
+    变为不活跃的数据只写入is_active，与之前的活跃数据合并后会丢失活跃数据中的其他字段，
+    因此活跃数据之后出现不活跃数据时不合并，按排序后的顺序保留所有数据，由写入计划依次处理
+    '''
+    __stats = {
+        'users': 0,
+        'clans': 0
+    }
+
+    @staticmethod
+    def __freshness(data: dict, field: str) -> int | None:
+        if data['info'] != None and data['info'] != {} and data['info'].get(field):
+            return data['info'][field]
+        return None
+
+    @classmethod
+    def __sort_items(cls, items: list, field: str) -> list:
+        "items为按到达顺序排列的[(index, data)]，没有时间的数据使用之前出现过的最新时间"
+        keys = []
+        latest = -1
+        for index, data in items:
+            freshness = cls.__freshness(data, field)
+            if freshness is not None:
+                latest = max(latest, freshness)
+            keys.append((freshness if freshness is not None else latest, index))
+        return [item for _, item in sorted(zip(keys, items), key=lambda pair: pair[0])]
+
+    @staticmethod
+    def __is_inactive(data: dict) -> bool:
+        return data['info'] != None and data['info'] != {} and not data['info'].get('is_active')
+
+    @classmethod
+    def __has_deactivation(cls, items: list) -> bool:
+        "排序后的items中是否有活跃数据之后出现的不活跃数据"
+        active = False
+        for _, data in items:
+            if cls.__is_inactive(data):
+                if active:
+                    return True
+            elif data['info'] != None and data['info'] != {}:
+                active = True
+        return False
+
+    @staticmethod
+    def __merge_section(old: dict | None, new: dict | None) -> dict | None:
+        if new == None or new == {}:
+            return old
+        if old == None or old == {}:
+            return dict(new)
+        result = dict(old)
+        for key, value in new.items():
+            if value != None:
+                result[key] = value
+        return result
+
+    @classmethod
+    def __merge(cls, datas: list, key_field: str, time_field: str, sections: list, replace_sections: list) -> list:
+        groups = {}
+        for index, data in enumerate(datas):
+            groups.setdefault((data['region_id'], data[key_field]), []).append((index, data))
+        result = []
+        for items in groups.values():
+            if len(items) == 1:
+                result.append(items[0][1])
+                continue
+            items = cls.__sort_items(items, time_field)
+            if cls.__has_deactivation(items):
+                result.extend(data for _, data in items)
+                continue
+            merged = {'region_id': items[0][1]['region_id'], key_field: items[0][1][key_field]}
+            for section in sections + replace_sections:
+                merged[section] = None
+            for _, data in items:
+                for section in sections:
+                    merged[section] = cls.__merge_section(merged[section], data.get(section))
+                for section in replace_sections:
+                    if data.get(section) != None and data.get(section) != {}:
+                        merged[section] = data[section]
+            result.append(merged)
+        return result
+
+    @classmethod
+    def merge_user_datas(cls, user_datas: list) -> list:
+        "按(region_id, account_id)合并用户数据"
+        result = cls.__merge(user_datas, 'account_id', 'last_battle_time', ['basic', 'info'], ['clan'])
+        cls.__stats['users'] += len(user_datas) - len(result)
+        return result
+
+    @classmethod
+    def merge_clan_datas(cls, clan_datas: list) -> list:
+        "按(region_id, clan_id)合并工会数据"
+        result = cls.__merge(clan_datas, 'clan_id', 'last_battle_at', ['basic', 'info'], [])
+        cls.__stats['clans'] += len(clan_datas) - len(result)
+        return result
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        "被合并掉的写入数量"
+        return dict(cls.__stats)
@@ -0,0 +1,141 @@
+import re
+import sys
+import time
+import threading
+
+from app.core import EnvConfig
+
+config = EnvConfig.get_config()
+
+# 通用的批量SQL函数，统计时记录调用它们的函数
+HELPER_FUNCTIONS = {'execute_values', 'fetch_values', 'update_values'}
+
+_NORMALIZE_PATTERNS = [
+    (re.compile(r"'(?:[^'\\]|\\.)*'"), '?'),
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\s+'), ' '),
+    # 多行VALUES和IN列表只保留第一组
+    (re.compile(r'(\(\?(?:, ?\?)*\))(?: ?, ?\(\?(?:, ?\?)*\))+'), r'\1, ...'),
+    (re.compile(r'\bIN \(\?(?:, ?\?)+\)', re.IGNORECASE), 'IN (...)'),
+    (re.compile(r'(?: UNION ALL SELECT \?(?:, ?\?)*)+', re.IGNORECASE), ' UNION ALL ...')
+]
+
+
+def normalize_sql(sql: str) -> str:
+    "将SQL中的参数和字面量替换为?，并合并批量语句中重复的部分，得到语句模板"
+    for pattern, repl in _NORMALIZE_PATTERNS:
+        sql = pattern.sub(repl, sql)
+    return sql.strip()
+
+def get_caller() -> str:
+    "获取执行SQL的函数，跳过分析器本身和通用的批量SQL函数"
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename != __file__ and code.co_name not in HELPER_FUNCTIONS:
+            module = frame.f_globals.get('__name__', '?')
+            return f'{module}.{code.co_name}'
+        frame = frame.f_back
+    return '?'
+
+
+class ProfilingCursor:
+    '''记录每条语句耗时的游标
+
+    用法与原游标相同，execute和executemany的耗时按(语句模板, 调用函数)汇总到SQLProfiler
+    '''
+    def __init__(self, cur):
+        self.__cur = cur
+
+    def __getattr__(self, name):
+        return getattr(self.__cur, name)
+
+    def __iter__(self):
+        return iter(self.__cur)
+
+    def execute(self, query, args=None):
+        start_time = time.perf_counter()
+        try:
+            return self.__cur.execute(query, args)
+        finally:
+            SQLProfiler.record(query, get_caller(), time.perf_counter() - start_time)
+
+    def executemany(self, query, args):
+        start_time = time.perf_counter()
+        try:
+            return self.__cur.executemany(query, args)
+        finally:
+            SQLProfiler.record(query, get_caller(), time.perf_counter() - start_time)
+
+
+class SQLProfiler:
+    '''SQL语句耗时统计
+
+    通过SQL_PROFILE开启，开启后连接池取出的连接创建的游标都会被替换为ProfilingCursor
+
+    统计数据保存在worker内存中，每个(语句模板, 调用函数)记录执行次数、总耗时和最大耗时
+    '''
+    enabled = config.SQL_PROFILE
+    __lock = threading.Lock()
+    __stats = {}
+
+    @classmethod
+    def wrap_cursor(cls, cur):
+        if cls.enabled:
+            return ProfilingCursor(cur)
+        return cur
+
+    @classmethod
+    def record(cls, sql: str, caller: str, seconds: float):
+        key = (normalize_sql(sql), caller)
+        with cls.__lock:
+            stats = cls.__stats.get(key)
+            if stats is None:
+                cls.__stats[key] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                if seconds > stats[2]:
+                    stats[2] = seconds
+
+    @classmethod
+    def reset(cls):
+        with cls.__lock:
+            cls.__stats = {}
+
+    @classmethod
+    def get_top(cls, top: int = None, sort_by: str = 'total') -> list:
+        '''按总耗时(total)、执行次数(count)或最大耗时(max)排序的统计数据
+
+        返回值格式如下：
+        [
+            {'sql': ..., 'caller': ..., 'count': ..., 'total_ms': ..., 'avg_ms': ..., 'max_ms': ...}
+        ]
+        '''
+        index = {'count': 0, 'total': 1, 'max': 2}[sort_by]
+        with cls.__lock:
+            items = [(key, list(stats)) for key, stats in cls.__stats.items()]
+        items.sort(key=lambda item: item[1][index], reverse=True)
+        result = []
+        for (sql, caller), (count, total, max_time) in items[:top or config.SQL_PROFILE_TOP]:
+            result.append({
+                'sql': sql,
+                'caller': caller,
+                'count': count,
+                'total_ms': round(total * 1000, 3),
+                'avg_ms': round(total / count * 1000, 3),
+                'max_ms': round(max_time * 1000, 3)
+            })
+        return result
+
+    @classmethod
+    def format_report(cls, top: int = None, sort_by: str = 'total') -> str:
+        "文本格式的统计报告"
+        lines = [f"{'count':>10}{'total ms':>14}{'avg ms':>10}{'max ms':>10}  caller / sql"]
+        for item in cls.get_top(top, sort_by):
+            lines.append(
+                f"{item['count']:>10}{item['total_ms']:>14}{item['avg_ms']:>10}{item['max_ms']:>10}  "
+                f"{item['caller']}\n{'':>46}{item['sql'][:config.SQL_PROFILE_SQL_LENGTH]}"
+            )
+        return '\n'.join(lines)
@@ -0,0 +1,145 @@
+import pymysql
+
+from app.response import JSONResponse
+from app.log import ExceptionLogger
+
+from .db import DatabaseConnection
+from .cache import user_cache, clan_cache
+from .bulk import _fetch_users, _fetch_clans, fetch_values, cache_users, MAIN_DB
+
+# 返回的字段，与_fetch_users和_fetch_clans的查询结果一致，league1为clan_basic中的league
+USER_READ_FIELDS = [
+    'region_id', 'account_id', 'username', 'is_active', 'active_level', 'is_public',
+    'total_battles', 'last_battle_time', 'clan_id', 'tag', 'league1'
+]
+CLAN_READ_FIELDS = [
+    'region_id', 'clan_id', 'tag', 'league1', 'is_active', 'season', 'public_rating',
+    'league', 'division', 'division_rating', 'last_battle_at'
+]
+
+
+def to_compact(fields: list, rows: list, missing: list) -> dict:
+    '''将查询结果转换为紧凑格式，减少结果存储中的数据量
+
+    返回值格式如下：
+    {
+        'fields': [字段名, ...],
+        'rows': [[与fields对应的值, ...], ...],
+        'missing': [[region_id, id], ...]    # 数据库中不存在的数据
+    }
+    '''
+    return {
+        'fields': fields,
+        'rows': [[row.get(field) for field in fields] for row in rows],
+        'missing': [list(key) for key in missing]
+    }
+
+def _get_keys(keys: list) -> list:
+    return list(dict.fromkeys((key[0], key[1]) for key in keys))
+
+def _get_clan_keys(users: list) -> list:
+    return list(dict.fromkeys((user['region_id'], user['clan_id']) for user in users if user['clan_id']))
+
+def _get_cached_clans(clan_keys: list) -> dict:
+    "从缓存中读取工会数据，用户更新时新增的工会只有clan_basic中的数据，视为未命中"
+    return {key: clan for key, clan in clan_cache.get_many(clan_keys).items() if 'public_rating' in clan}
+
+def _fetch_user_clans(cur, account_ids: list) -> dict:
+    "查询用户当前所在的工会，返回{account_id: clan_id}"
+    if account_ids == []:
+        return {}
+    rows = fetch_values(
+        cur,
+        f"SELECT account_id, clan_id FROM {MAIN_DB}.user_clan WHERE account_id IN (",
+        '%s',
+        [[account_id] for account_id in account_ids],
+        ')'
+    )
+    return {row['account_id']: row['clan_id'] for row in rows}
+
+def _fetch_missing(users: dict, user_keys: list, clans: dict, clan_keys: list, with_users: bool):
+    '''查询缓存中没有的用户和工会，并写入缓存
+
+    with_users为True时，缓存中没有clan_id(见USER_UNCACHED_FIELDS)，命中缓存的用户同样需要查询user_clan，
+    之后按用户所在的工会读取工会数据
+    '''
+    pool = DatabaseConnection.get_pool()
+    conn = pool.connection()
+    cur = None
+    try:
+        conn.begin()
+        cur = conn.cursor(pymysql.cursors.DictCursor)
+
+        if with_users:
+            user_clans = _fetch_user_clans(cur, [key[1] for key in user_keys if key in users])
+            for key, user in users.items():
+                user['clan_id'] = user_clans.get(key[1])
+            fetched = _fetch_users(cur, [key for key in user_keys if key not in users])
+            cache_users(fetched)
+            users.update(fetched)
+            clan_keys = _get_clan_keys(users.values())
+            clans.update(_get_cached_clans(clan_keys))
+        fetched = _fetch_clans(cur, [key for key in clan_keys if key not in clans])
+        clan_cache.set_many(fetched)
+        clans.update(fetched)
+
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        raise e
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+@ExceptionLogger.handle_database_exception_sync
+def read_user_datas(keys: list):
+    '''批量读取用户数据，包括user_basic, user_info, user_clan以及所在工会的tag和league
+
+    与写入共用worker内的缓存，只查询未命中的部分，
+    用户所在的工会可能由其他worker的sync_clan_members修改，每次都从user_clan中查询
+
+    参数:
+        keys: [[region_id, account_id], ...]
+
+    返回:
+        to_compact的格式，字段见USER_READ_FIELDS
+    '''
+    user_keys = _get_keys(keys)
+    users = {key: dict(user) for key, user in user_cache.get_many(user_keys).items()}
+    clans = {}
+    _fetch_missing(users, user_keys, clans, [], True)
+    rows = []
+    for key in user_keys:
+        if key not in users:
+            continue
+        row = users[key]
+        clan = clans.get((row['region_id'], row['clan_id']), {})
+        row['tag'] = clan.get('tag')
+        row['league1'] = clan.get('league1')
+        rows.append(row)
+    return JSONResponse.get_success_response(
+        to_compact(USER_READ_FIELDS, rows, [key for key in user_keys if key not in users])
+    )
+
+@ExceptionLogger.handle_database_exception_sync
+def read_clan_datas(keys: list):
+    '''批量读取工会数据，包括clan_basic和clan_info
+
+    参数:
+        keys: [[region_id, clan_id], ...]
+
+    返回:
+        to_compact的格式，字段见CLAN_READ_FIELDS
+    '''
+    clan_keys = _get_keys(keys)
+    clans = _get_cached_clans(clan_keys)
+    if len(clans) < len(clan_keys):
+        _fetch_missing({}, [], clans, clan_keys, False)
+    return JSONResponse.get_success_response(
+        to_compact(
+            CLAN_READ_FIELDS,
+            [clans[key] for key in clan_keys if key in clans],
+            [key for key in clan_keys if key not in clans]
+        )
+    )
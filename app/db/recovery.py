@@ -0,0 +1,205 @@
+import time
+import uuid
+import sqlite3
+
+import pymysql
+
+from app.response import JSONResponse
+from app.log import ExceptionLogger, write_error_info
+from app.core import EnvConfig
+
+from .db import DatabaseConnection
+from .cache import user_cache, clan_cache
+from .dead_letter import DeadLetterStore
+from .changes import ChangeStream
+from .freshness import FreshnessGuard
+from .bulk import (
+    write_user_datas,
+    write_clan_datas,
+    get_user_keys,
+    get_clan_keys,
+    get_clan_data_keys
+)
+
+config = EnvConfig.get_config()
+
+# 可以重试的错误，包括死锁(1213)、锁等待超时(1205)、连接断开以及等待连接池超时，
+# 出现这些错误时MySQL可能已经回滚了整个事务，因此需要整个事务重试
+TRANSIENT_ERRORS = (pymysql.err.OperationalError, sqlite3.OperationalError)
+
+
+def format_record_error(e: Exception) -> str:
+    if isinstance(e, pymysql.err.MySQLError) and len(e.args) >= 2:
+        return f'{type(e).__name__}: ERROR_{e.args[0]} {e.args[1]}'
+    return f'{type(e).__name__}: {e}'
+
+def get_error_code(e: Exception) -> int:
+    "与ExceptionLogger.handle_database_exception_sync相同的错误码"
+    if isinstance(e, (pymysql.err.ProgrammingError, sqlite3.ProgrammingError)):
+        return 3001
+    if isinstance(e, (pymysql.err.OperationalError, sqlite3.OperationalError)):
+        return 3002
+    if isinstance(e, (pymysql.err.IntegrityError, sqlite3.IntegrityError)):
+        return 3003
+    if isinstance(e, (pymysql.err.DatabaseError, sqlite3.DatabaseError)):
+        return 3000
+    return 5000
+
+
+class RecordIsolator:
+    '''批次写入失败后，逐条隔离写入
+
+    在同一个事务中为每条数据设置保存点，某条数据写入失败时只回滚到该数据的保存点，其余数据正常提交，
+    失败的数据写入DeadLetterStore
+
+    出现TRANSIENT_ERRORS时回滚整个事务，按指数退避等待后重试，
+    重试RECORD_MAX_RETRIES次后仍然失败时整个批次写入失败(返回3002)，不写入死信，由任务重试
+    '''
+    __stats = {
+        'batches': 0,
+        'records': 0,
+        'retries': 0,
+        'dead_letters': 0,
+        'failed_batches': 0
+    }
+
+    @classmethod
+    @ExceptionLogger.handle_database_exception_sync
+    def write(cls, user_datas: list, clan_datas: list, attempts: int = 0, failed_records: list = None):
+        '''逐条写入数据，写入失败的数据转入死信存储，返回写入结果
+
+        参数:
+            user_datas [dict]
+            clan_datas [dict]
+            attempts: 这些数据之前已经尝试的次数，用于记录到死信中
+            failed_records: 传入列表时，转入死信的数据以(record_type, data, exception)加入该列表，
+                WriteBatcher用于区分批次内每个任务的数据
+
+        返回:
+            全部写入成功时为成功的返回值，data为{'records': 数据条数, 'dead_letters': 0}
+            部分数据转入死信时为第一条失败数据的错误码，data中同样包含records和dead_letters，见is_partial
+            临时错误重试后仍然失败时为ExceptionLogger的返回值，没有数据写入
+        '''
+        cls.__stats['batches'] += 1
+        pending = [('user', data) for data in user_datas] + [('clan', data) for data in clan_datas]
+        cls.__stats['records'] += len(pending)
+        retries = 0
+        while True:
+            try:
+                failed = cls.__write_once(pending)
+                break
+            except TRANSIENT_ERRORS:
+                if retries >= config.RECORD_MAX_RETRIES:
+                    cls.__stats['failed_batches'] += 1
+                    raise
+                time.sleep(config.RECORD_RETRY_DELAY * 2 ** retries)
+                retries += 1
+                cls.__stats['retries'] += 1
+        for record_type, data, e in failed:
+            DeadLetterStore.put(record_type, data, format_record_error(e), attempts + retries + 1)
+        cls.__stats['dead_letters'] += len(failed)
+        if failed_records is not None:
+            failed_records.extend(failed)
+        if failed == []:
+            return JSONResponse.get_success_response({
+                'records': len(pending),
+                'dead_letters': 0
+            })
+        code = get_error_code(failed[0][2])
+        error_id = str(uuid.uuid4())
+        write_error_info(
+            error_id = error_id,
+            error_type = 'MySQL' if code != 5000 else 'program',
+            error_name = type(failed[0][2]).__name__,
+            error_info = '\n'.join(format_record_error(e) for _, _, e in failed)
+        )
+        result = JSONResponse.get_error_response(code, 'DeadLetter', error_id)
+        result['data'].update({
+            'records': len(pending),
+            'dead_letters': len(failed)
+        })
+        return result
+
+    @staticmethod
+    def is_partial(result: dict) -> bool:
+        "是否为部分数据转入死信的返回值，其余数据已经提交，不需要重试"
+        return result.get('code', None) != 1000 and 'dead_letters' in (result.get('data', None) or {})
+
+    @staticmethod
+    def __write_once(pending: list) -> list:
+        "在一个事务中逐条写入，返回因非临时错误写入失败的数据"
+        pool = DatabaseConnection.get_pool()
+        conn = pool.connection()
+        cur = None
+        failed = []
+        changes = []
+        stale = {'user': 0, 'clan': 0}
+        try:
+            conn.begin()
+            cur = conn.cursor(pymysql.cursors.DictCursor)
+
+            for record_type, data in pending:
+                cur.execute("SAVEPOINT record;")
+                try:
+                    if record_type == 'user':
+                        plan = write_user_datas(cur, [data])
+                    else:
+                        plan = write_clan_datas(cur, [data])
+                except TRANSIENT_ERRORS:
+                    raise
+                except Exception as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT record;")
+                    failed.append((record_type, data, e))
+                    continue
+                cur.execute("RELEASE SAVEPOINT record;")
+                changes.extend(plan['changes'])
+                stale[record_type] += len(plan['stale'])
+
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            if cur:
+                cur.close()
+            conn.close()
+            # 逐条写入时不维护缓存，之后重新查询
+            user_datas = [data for record_type, data in pending if record_type == 'user']
+            clan_datas = [data for record_type, data in pending if record_type == 'clan']
+            user_cache.invalidate(get_user_keys(user_datas))
+            clan_cache.invalidate(get_clan_keys(user_datas) + get_clan_data_keys(clan_datas))
+        FreshnessGuard.count(users=stale['user'], clans=stale['clan'])
+        ChangeStream.publish(changes)
+        return failed
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        return dict(cls.__stats)
+
+
+def replay_dead_letters(batch_size: int = 1000) -> dict:
+    '''重新写入死信存储中的数据
+
+    再次失败的数据会重新写入死信存储
+
+    返回:
+        {'records': 重放的数据条数, 'dead_letters': 再次失败的数据条数}
+    '''
+    entries = DeadLetterStore.take()
+    dead_letters = 0
+    for i in range(0, len(entries), batch_size):
+        chunk = entries[i:i + batch_size]
+        # 保持原有顺序，同一批次内用户数据先于工会数据写入
+        result = RecordIsolator.write(
+            [entry['data'] for entry in chunk if entry['type'] == 'user'],
+            [entry['data'] for entry in chunk if entry['type'] == 'clan'],
+            max(entry['attempts'] for entry in chunk)
+        )
+        if result.get('code', None) != 1000 and not RecordIsolator.is_partial(result):
+            raise RuntimeError(f'Replay failed: {result}')
+        dead_letters += result['data']['dead_letters']
+    DeadLetterStore.finish()
+    return {
+        'records': len(entries),
+        'dead_letters': dead_letters
+    }
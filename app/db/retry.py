@@ -0,0 +1,55 @@
+import time
+import random
+import functools
+
+import pymysql
+
+from app.core import EnvConfig
+
+config = EnvConfig.get_config()
+
+# MySQL错误码
+ER_LOCK_DEADLOCK = 1213
+ER_LOCK_WAIT_TIMEOUT = 1205
+
+
+class DeadlockRetry:
+    '''事务因死锁(1213)或锁等待超时(1205)失败时自动重试
+
+    被装饰的函数需要在内部完成整个事务(取出连接、提交或回滚)，重试时重新执行整个函数，
+    第n次重试前随机等待0到DEADLOCK_RETRY_DELAY * 2^n秒，超过DEADLOCK_MAX_RETRIES次后抛出原异常
+
+    需要放在ExceptionLogger的装饰器内层
+    '''
+    __stats = {
+        'deadlock_retries': 0,
+        'lock_wait_retries': 0,
+        'exhausted': 0
+    }
+
+    @classmethod
+    def retry(cls, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            retries = 0
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except pymysql.err.OperationalError as e:
+                    code = e.args[0] if e.args else None
+                    if code not in (ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT):
+                        raise e
+                    if retries >= config.DEADLOCK_MAX_RETRIES:
+                        cls.__stats['exhausted'] += 1
+                        raise e
+                    if code == ER_LOCK_DEADLOCK:
+                        cls.__stats['deadlock_retries'] += 1
+                    else:
+                        cls.__stats['lock_wait_retries'] += 1
+                    time.sleep(random.uniform(0, config.DEADLOCK_RETRY_DELAY * 2 ** retries))
+                    retries += 1
+        return wrapper
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        return dict(cls.__stats)
@@ -7,6 +7,7 @@ from app.utils import CommonUtils, TimeFormat
 from app.core import EnvConfig
 
 from .db import DatabaseConnection
+from .freshness import FreshnessGuard
 
 config = EnvConfig.get_config()
 
@@ -60,6 +61,7 @@ def update_user_data(user_datas: dict | list):
 
         if type(user_datas) == dict:
             user_datas = [user_datas]
+        stale = 0
         for user_data in user_datas:
             account_id = user_data['account_id']
             region_id = user_data['region_id']
@@ -73,6 +75,10 @@ def update_user_data(user_datas: dict | list):
                 [region_id, account_id]
             )
             user = cur.fetchone()
+            # 比数据库中的数据旧，整条跳过
+            if user and FreshnessGuard.is_stale_user(user_data['info'], user):
+                stale += 1
+                continue
             if not user:
                 cur.execute(
                     f"INSERT INTO {MAIN_DB}.user_basic (account_id, region_id, username) VALUES (%s, %s, %s);",
@@ -208,6 +214,7 @@ def update_user_data(user_datas: dict | list):
                         )
 
         conn.commit()
+        FreshnessGuard.count(users=stale)
         return JSONResponse.API_1000_Success
     except Exception as e:
         conn.rollback()
@@ -238,6 +245,7 @@ def update_clan_data(clan_datas: dict | list):
 
         if type(clan_datas) == dict:
             clan_datas = [clan_datas]
+        stale = 0
         for clan_data in clan_datas:
             clan_id = clan_data['clan_id']
             region_id = clan_data['region_id']
@@ -251,6 +259,10 @@ def update_clan_data(clan_datas: dict | list):
                 [region_id, clan_id]
             )
             clan = cur.fetchone()
+            # 比数据库中的数据旧，整条跳过
+            if clan and FreshnessGuard.is_stale_clan(clan_data['info'], clan['info_last_battle_time'], clan['season']):
+                stale += 1
+                continue
             if clan is None:
                 # 工会不存在，插入新数据
                 cur.execute(
@@ -328,6 +340,7 @@ def update_clan_data(clan_datas: dict | list):
                         )
 
         conn.commit()
+        FreshnessGuard.count(clans=stale)
         return JSONResponse.API_1000_Success
     except Exception as e:
         conn.rollback()
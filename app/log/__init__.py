@@ -1,7 +1,8 @@
-from .error_log import write_error_info
+from .error_log import write_error_info, ErrorLogWriter
 from .exception_log import ExceptionLogger
 
 __all__ = [
     'write_error_info',
+    'ErrorLogWriter',
     'ExceptionLogger'
 ]
\ No newline at end of file
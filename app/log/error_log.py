@@ -1,4 +1,7 @@
 import os
+import json
+import queue
+import threading
 
 from app.utils import TimeFormat
 from app.core import EnvConfig
@@ -6,6 +9,113 @@ from app.core import EnvConfig
 config = EnvConfig.get_config()
 log_path = config.LOG_PATH
 
+
+class ErrorLogWriter:
+    '''后台批量写入错误日志
+
+    write_error_info只将日志放入有界队列，由后台线程按批次写入文件，队列已满时丢弃日志并计数
+
+    日志文件为JSON Lines格式，按日期命名，单个文件超过LOG_FILE_MAX_BYTES后写入同一天的下一个文件，
+    例如 2025-01-01.jsonl, 2025-01-01.1.jsonl
+
+    eventlet会将threading和queue替换为协程实现
+    '''
+    __queue = None
+    __thread = None
+    __lock = threading.Lock()
+    __stop = object()
+    __stats = {
+        'written': 0,
+        'dropped': 0,
+        'failed': 0
+    }
+
+    @classmethod
+    def start(cls):
+        with cls.__lock:
+            if cls.__thread is None or not cls.__thread.is_alive():
+                cls.__queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+                cls.__thread = threading.Thread(target=cls.__run, name='error-log-writer', daemon=True)
+                cls.__thread.start()
+
+    @classmethod
+    def put(cls, record: dict):
+        "放入队列，不会阻塞"
+        if cls.__thread is None:
+            cls.start()
+        try:
+            cls.__queue.put_nowait(record)
+        except queue.Full:
+            cls.__stats['dropped'] += 1
+
+    @classmethod
+    def close(cls, timeout: float = 5):
+        "写入队列中剩余的日志并停止后台线程"
+        with cls.__lock:
+            thread = cls.__thread
+            cls.__thread = None
+        if thread is None:
+            return
+        try:
+            cls.__queue.put(cls.__stop, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        return dict(cls.__stats)
+
+    @classmethod
+    def __run(cls):
+        log_queue = cls.__queue
+        while True:
+            try:
+                records = [log_queue.get(timeout=config.LOG_FLUSH_INTERVAL)]
+            except queue.Empty:
+                continue
+            while len(records) < config.LOG_BATCH_SIZE:
+                try:
+                    records.append(log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = cls.__stop in records
+            records = [record for record in records if record is not cls.__stop]
+            if records != []:
+                cls.__write(records)
+            if stop:
+                return
+
+    @classmethod
+    def __write(cls, records: list):
+        lines = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+        try:
+            with open(cls.__get_file_path(), 'a', encoding='utf-8') as f:
+                f.write(lines)
+            cls.__stats['written'] += len(records)
+        except Exception as e:
+            cls.__stats['failed'] += len(records)
+            print(e)
+
+    @staticmethod
+    def __get_file_path() -> str:
+        "按日期和大小轮转日志文件"
+        now_day = TimeFormat.get_today()
+        index = 0
+        while True:
+            file_name = f'{now_day}.jsonl' if index == 0 else f'{now_day}.{index}.jsonl'
+            file_path = os.path.join(log_path, file_name)
+            if not os.path.exists(file_path) or os.path.getsize(file_path) < config.LOG_FILE_MAX_BYTES:
+                return file_path
+            index += 1
+
+
+def truncate_text(text: str | None, max_length: int) -> str | None:
+    "截断过长的文本，并注明原始长度"
+    if text is None or len(text) <= max_length:
+        return text
+    return text[:max_length] + f'...(truncated, {len(text)} chars)'
+
 def write_error_info(
     error_id: str,
     error_type: str,
@@ -13,15 +123,13 @@ def write_error_info(
     error_args: str = None,
     error_info: str = None
 ):
-    now_day = TimeFormat.get_today()
-    form_time = TimeFormat.get_form_time()
-    with open(os.path.join(log_path, f'{now_day}.txt'), "a", encoding="utf-8") as f:
-        f.write('-------------------------------------------------------------------------------------------------------------\n')
-        f.write(f">Platform:     API\n")
-        f.write(f">Error ID:     {error_id}\n")
-        f.write(f">Error Type:   {error_type}\n")
-        f.write(f">Error Name:   {error_name}\n")
-        f.write(f">Error Time:   {form_time}\n")
-        f.write(f">Error Info:   \n{error_args}\n{error_info}\n")
-        f.write('-------------------------------------------------------------------------------------------------------------\n')
-    f.close()
\ No newline at end of file
+    "记录错误日志，实际写入由ErrorLogWriter在后台完成"
+    ErrorLogWriter.put({
+        'platform': 'API',
+        'error_id': error_id,
+        'error_type': error_type,
+        'error_name': error_name,
+        'error_time': TimeFormat.get_form_time(),
+        'error_args': truncate_text(error_args, config.LOG_ARGS_MAX_LENGTH),
+        'error_info': truncate_text(error_info, config.LOG_INFO_MAX_LENGTH)
+    })
@@ -1,4 +1,5 @@
 import uuid
+import reprlib
 import traceback
 
 import pymysql
@@ -20,6 +21,25 @@ class DatabaseExceptionName:
 def generate_error_id():
     return str(uuid.uuid4())
 
+# 限制参数的输出长度，避免为了记录日志序列化整个批次的数据
+_args_repr = reprlib.Repr()
+_args_repr.maxlevel = 4
+_args_repr.maxlist = 5
+_args_repr.maxtuple = 5
+_args_repr.maxdict = 10
+_args_repr.maxstring = 100
+_args_repr.maxother = 100
+
+def format_args(args: tuple, kwargs: dict) -> str:
+    "获取函数参数的摘要"
+    return _args_repr.repr(args) + _args_repr.repr(kwargs)
+
+def format_database_error(e: Exception) -> str:
+    "获取数据库异常的错误码和错误信息，sqlite3的异常只有错误信息"
+    if len(e.args) >= 2:
+        return f'ERROR_{e.args[0]}\n' + str(e.args[1]) + f'\n{traceback.format_exc()}'
+    return f'ERROR_{type(e).__name__}\n' + str(e) + f'\n{traceback.format_exc()}'
+
 class ExceptionLogger:
     @staticmethod
     def handle_program_exception_async(func):
@@ -34,7 +54,7 @@ class ExceptionLogger:
                     error_id = error_id,
                     error_type = ExceptionType.program,
                     error_name = str(type(e).__name__),
-                    error_args = str(args) + str(kwargs),
+                    error_args = format_args(args, kwargs),
                     error_info = traceback.format_exc()
                 )
                 return JSONResponse.get_error_response(5000,'ProgramError',error_id)
@@ -53,7 +73,7 @@ class ExceptionLogger:
                     error_id = error_id,
                     error_type = ExceptionType.program,
                     error_name = str(type(e).__name__),
-                    error_args = str(args) + str(kwargs),
+                    error_args = format_args(args, kwargs),
                     error_info = traceback.format_exc()
                 )
                 return JSONResponse.get_error_response(5000,'ProgramError',error_id)
@@ -72,8 +92,8 @@ class ExceptionLogger:
                     error_id = error_id,
                     error_type = ExceptionType.mysql,
                     error_name = DatabaseExceptionName.programming_error,
-                    error_args = str(args) + str(kwargs),
-                    error_info = f'ERROR_{e.args[0]}\n' + str(e.args[1]) + f'\n{traceback.format_exc()}'
+                    error_args = format_args(args, kwargs),
+                    error_info = format_database_error(e)
                 )
                 return JSONResponse.get_error_response(3001,'DatabaseError',error_id)
             except pymysql.err.OperationalError as e:
@@ -82,8 +102,8 @@ class ExceptionLogger:
                     error_id = error_id,
                     error_type = ExceptionType.mysql,
                     error_name = DatabaseExceptionName.operational_error,
-                    error_args = str(args) + str(kwargs),
-                    error_info = f'ERROR_{e.args[0]}\n' + str(e.args[1]) + f'\n{traceback.format_exc()}'
+                    error_args = format_args(args, kwargs),
+                    error_info = format_database_error(e)
                 )
                 return JSONResponse.get_error_response(3002,'DatabaseError',error_id)
             except pymysql.err.IntegrityError as e:
@@ -92,8 +112,8 @@ class ExceptionLogger:
                     error_id = error_id,
                     error_type = ExceptionType.mysql,
                     error_name = DatabaseExceptionName.integrity_error,
-                    error_args = str(args) + str(kwargs),
-                    error_info = f'ERROR_{e.args[0]}\n' + str(e.args[1]) + f'\n{traceback.format_exc()}'
+                    error_args = format_args(args, kwargs),
+                    error_info = format_database_error(e)
                 )
                 return JSONResponse.get_error_response(3003,'DatabaseError',error_id)
             except pymysql.err.DatabaseError as e:
@@ -102,8 +122,8 @@ class ExceptionLogger:
                     error_id = error_id,
                     error_type = ExceptionType.mysql,
                     error_name = DatabaseExceptionName.database_error,
-                    error_args = str(args) + str(kwargs),
-                    error_info = f'ERROR_{e.args[0]}\n' + str(e.args[1]) + f'\n{traceback.format_exc()}'
+                    error_args = format_args(args, kwargs),
+                    error_info = format_database_error(e)
                 )
                 return JSONResponse.get_error_response(3000,'DatabaseError',error_id)
             except sqlite3.ProgrammingError as e:
@@ -112,8 +132,8 @@ class ExceptionLogger:
                     error_id = error_id,
                     error_type = ExceptionType.mysql,
                     error_name = DatabaseExceptionName.programming_error,
-                    error_args = str(args) + str(kwargs),
-                    error_info = f'ERROR_{e.args[0]}\n' + str(e.args[1]) + f'\n{traceback.format_exc()}'
+                    error_args = format_args(args, kwargs),
+                    error_info = format_database_error(e)
                 )
                 return JSONResponse.get_error_response(3001,'DatabaseError',error_id)
             except sqlite3.OperationalError as e:
@@ -122,8 +142,8 @@ class ExceptionLogger:
                     error_id = error_id,
                     error_type = ExceptionType.mysql,
                     error_name = DatabaseExceptionName.operational_error,
-                    error_args = str(args) + str(kwargs),
-                    error_info = f'ERROR_{e.args[0]}\n' + str(e.args[1]) + f'\n{traceback.format_exc()}'
+                    error_args = format_args(args, kwargs),
+                    error_info = format_database_error(e)
                 )
                 return JSONResponse.get_error_response(3002,'DatabaseError',error_id)
             except sqlite3.IntegrityError as e:
@@ -132,8 +152,8 @@ class ExceptionLogger:
                     error_id = error_id,
                     error_type = ExceptionType.mysql,
                     error_name = DatabaseExceptionName.integrity_error,
-                    error_args = str(args) + str(kwargs),
-                    error_info = f'ERROR_{e.args[0]}\n' + str(e.args[1]) + f'\n{traceback.format_exc()}'
+                    error_args = format_args(args, kwargs),
+                    error_info = format_database_error(e)
                 )
                 return JSONResponse.get_error_response(3003,'DatabaseError',error_id)
             except sqlite3.DatabaseError as e:
@@ -142,8 +162,8 @@ class ExceptionLogger:
                     error_id = error_id,
                     error_type = ExceptionType.mysql,
                     error_name = DatabaseExceptionName.database_error,
-                    error_args = str(args) + str(kwargs),
-                    error_info = f'ERROR_{e.args[0]}\n' + str(e.args[1]) + f'\n{traceback.format_exc()}'
+                    error_args = format_args(args, kwargs),
+                    error_info = format_database_error(e)
                 )
                 return JSONResponse.get_error_response(3000,'DatabaseError',error_id)
             except Exception as e:
@@ -4,7 +4,24 @@ from celery import Celery, signals
 from celery.app.base import logger
 
 from app.core import EnvConfig
-from app.db import DatabaseConnection
+from app.db import (
+    ChangeStream,
+    DatabaseConnection,
+    DeadlockRetry,
+    DeadLetterStore,
+    FreshnessGuard,
+    RecordIsolator,
+    SQLProfiler,
+    UpdateMerger,
+    write_batcher,
+    high_lane_batcher,
+    db_limiter,
+    lane_gate
+)
+from app.db.cache import user_cache, clan_cache
+from app.log import ErrorLogWriter
+from app.metrics import WorkerMetrics
+from app.utils import ShardRouter
 
 config = EnvConfig.get_config()
 
@@ -19,21 +36,67 @@ celery_app = Celery(
 
 # 配置 Celery
 celery_app.conf.update(
-    task_routes={
-        "tasks.add": {"queue": "task_queue"}
-    }
+    task_routes=(ShardRouter.route_task,)
 )
 
 celery_app.conf.result_expires = 86400  # 设置任务结果过期时间为 24 小时（86400 秒）
 
+# 只订阅一个通道的worker使用该通道的预取数量
+if config.TASK_LANES and config.WORKER_LANE == 'high':
+    celery_app.conf.worker_prefetch_multiplier = config.HIGH_LANE_PREFETCH
+elif config.TASK_LANES and config.WORKER_LANE == 'low':
+    celery_app.conf.worker_prefetch_multiplier = config.LOW_LANE_PREFETCH
+
+# 定时任务，需要同时运行 celery beat
+if config.ACTIVE_LEVEL_DECAY_INTERVAL > 0:
+    celery_app.conf.beat_schedule = {
+        'decay_active_level': {
+            'task': 'decay_active_level',
+            'schedule': config.ACTIVE_LEVEL_DECAY_INTERVAL,
+            'options': {'queue': config.TASK_QUEUE}
+        }
+    }
+
+# 订阅分片和通道队列
+@signals.celeryd_after_setup.connect
+def setup_queues(sender, instance, **kwargs):
+    if config.TASK_SHARDS > 0 or config.TASK_LANES:
+        for queue in ShardRouter.get_queues(config.WORKER_SHARDS, config.WORKER_LANE):
+            instance.app.amqp.queues.select_add(queue)
+
 # 初始化
 @signals.worker_ready.connect
 def init_app(**kwargs):
     DatabaseConnection.init_pool()
     logger.info('MySQL initialized')
+    ErrorLogWriter.start()
+    logger.info('Error log writer started')
+    WorkerMetrics.add_stats('pool', DatabaseConnection.get_stats)
+    WorkerMetrics.add_stats('user_cache', user_cache.get_stats)
+    WorkerMetrics.add_stats('clan_cache', clan_cache.get_stats)
+    WorkerMetrics.add_stats('batcher', write_batcher.get_stats)
+    WorkerMetrics.add_stats('high_lane_batcher', high_lane_batcher.get_stats)
+    WorkerMetrics.add_stats('merged', UpdateMerger.get_stats)
+    WorkerMetrics.add_stats('error_log', ErrorLogWriter.get_stats)
+    WorkerMetrics.add_stats('isolation', RecordIsolator.get_stats)
+    WorkerMetrics.add_stats('deadlock', DeadlockRetry.get_stats)
+    WorkerMetrics.add_stats('cdc', ChangeStream.get_stats)
+    WorkerMetrics.add_stats('dead_letter', DeadLetterStore.get_stats)
+    WorkerMetrics.add_stats('freshness', FreshnessGuard.get_stats)
+    if config.DB_LIMIT_ENABLED or config.TASK_LANES:
+        WorkerMetrics.add_stats('db_limiter', db_limiter.get_stats)
+    if config.TASK_LANES:
+        WorkerMetrics.add_stats('lanes', lane_gate.get_stats)
+    metrics_port = WorkerMetrics.start_server()
+    if metrics_port:
+        logger.info(f'Metrics server started on {config.METRICS_HOST}:{metrics_port}')
 
 # 释放资源
 @signals.worker_shutdown.connect
 def close_app(**kwargs):
+    if SQLProfiler.enabled:
+        logger.info('SQL profile:\n' + SQLProfiler.format_report())
     DatabaseConnection.close_pool()
     logger.info('MySQL closed')
+    ErrorLogWriter.close()
+    logger.info('Error log writer closed')
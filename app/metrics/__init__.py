@@ -0,0 +1,5 @@
+from .metrics import WorkerMetrics
+
+__all__ = [
+    'WorkerMetrics'
+]
\ No newline at end of file
@@ -0,0 +1,115 @@
+from prometheus_client import Counter, Histogram, REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from app.core import EnvConfig
+
+config = EnvConfig.get_config()
+
+TASK_LATENCY = Histogram(
+    'kokomi_task_duration_seconds',
+    'Task execution time',
+    ['task'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+TASK_ERRORS = Counter(
+    'kokomi_task_errors',
+    'Task results with an error code',
+    ['task', 'code']
+)
+RECORDS = Counter(
+    'kokomi_records_processed',
+    'User and clan records received by tasks',
+    ['task', 'entity']
+)
+POOL_WAIT = Histogram(
+    'kokomi_db_pool_wait_seconds',
+    'Time spent waiting for a pooled connection, including the concurrency limiter',
+    ['lane'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+ROWS = Counter(
+    'kokomi_db_rows',
+    'Rows inserted, updated or skipped per table',
+    ['table', 'action']
+)
+
+
+class StatsCollector:
+    '''将各模块get_stats()返回的统计数据导出为prometheus指标
+
+    指标名称为kokomi_{name}_{key}，GAUGE_KEYS中的key导出为gauge，其余导出为counter
+    '''
+    GAUGE_KEYS = {
+        'size', 'active', 'idle', 'max_connections', 'wait_seconds_max', 'limit', 'in_flight',
+        'high_in_flight', 'low_in_flight', 'high_connections', 'low_connections'
+    }
+
+    def __init__(self):
+        self.__sources = {}
+
+    def add(self, name: str, get_stats):
+        self.__sources[name] = get_stats
+
+    def collect(self):
+        for name, get_stats in self.__sources.items():
+            for key, value in get_stats().items():
+                metric_name = f'kokomi_{name}_{key}'
+                if key in self.GAUGE_KEYS:
+                    yield GaugeMetricFamily(metric_name, f'{name} {key}', value=value)
+                else:
+                    yield CounterMetricFamily(metric_name, f'{name} {key}', value=value)
+
+
+class WorkerMetrics:
+    '''worker的prometheus指标'''
+    __collector = None
+
+    @staticmethod
+    def observe_task(task: str, seconds: float, result: dict):
+        "记录任务耗时以及失败的错误码"
+        TASK_LATENCY.labels(task).observe(seconds)
+        code = result.get('code', None) if isinstance(result, dict) else None
+        if code != 1000:
+            TASK_ERRORS.labels(task, str(code)).inc()
+
+    @staticmethod
+    def count_records(task: str, entity: str, count: int):
+        RECORDS.labels(task, entity).inc(count)
+
+    @staticmethod
+    def count_rows(rows: list):
+        "rows为[(table, action, count)]"
+        for table, action, count in rows:
+            if count > 0:
+                ROWS.labels(table, action).inc(count)
+
+    @staticmethod
+    def observe_pool_wait(seconds: float, lane: str = None):
+        "记录获取连接的等待时间，没有使用通道时lane为default"
+        POOL_WAIT.labels(lane or 'default').observe(seconds)
+
+    @classmethod
+    def add_stats(cls, name: str, get_stats):
+        "导出模块的统计数据"
+        if cls.__collector is None:
+            cls.__collector = StatsCollector()
+            REGISTRY.register(cls.__collector)
+        cls.__collector.add(name, get_stats)
+
+    @staticmethod
+    def start_server() -> int | None:
+        '''在METRICS_PORT上提供/metrics接口，端口为0时不启动
+
+        端口被占用时依次尝试之后的METRICS_PORT_RANGE - 1个端口，返回实际使用的端口，没有启动时返回None
+        '''
+        if not config.METRICS_PORT:
+            return None
+        for port in range(config.METRICS_PORT, config.METRICS_PORT + max(config.METRICS_PORT_RANGE, 1)):
+            try:
+                start_http_server(port, addr=config.METRICS_HOST)
+            except OSError:
+                continue
+            return port
+        raise OSError(
+            f'No free metrics port in {config.METRICS_PORT}-{config.METRICS_PORT + max(config.METRICS_PORT_RANGE, 1) - 1}'
+        )
@@ -0,0 +1,25 @@
+'''重新写入死信存储中的数据
+
+需要在worker所在的机器上运行(死信存储在本地的LOG_PATH下)，在项目根目录运行:
+    python -m app.replay --batch-size 1000
+'''
+import argparse
+
+from app.db import DatabaseConnection, DeadLetterStore, replay_dead_letters
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay dead-lettered user and clan records')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    DatabaseConnection.init_pool()
+    try:
+        result = replay_dead_letters(args.batch_size)
+    finally:
+        DatabaseConnection.close_pool()
+    print(f"replayed: {result['records']}  dead letters: {result['dead_letters']}  file: {DeadLetterStore.get_path()}")
+
+
+if __name__ == '__main__':
+    main()
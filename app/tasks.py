@@ -1,5 +1,12 @@
+import time
+
 from .main import celery_app
+from .core import EnvConfig
 from .db import *
+from .metrics import WorkerMetrics
+from .utils import CompactPayload, ShardRouter
+
+config = EnvConfig.get_config()
 
 @celery_app.task(name="test")
 def task_test():
@@ -11,8 +18,35 @@ def task_test():
         print('MySQL Version: ' + str(result['data']['version']))
     return 'ok'
 
-@celery_app.task(name="update_user_data")
-def task_update_user_data(user_datas: dict | list):
+@celery_app.task(name="sql_profile")
+def task_sql_profile(top: int = None, sort_by: str = 'total', reset: bool = False):
+    """获取执行该任务的worker中SQL语句的耗时统计
+
+    需要开启SQL_PROFILE，sort_by可选total, count, max，reset为True时返回后清空统计数据
+    """
+    result = SQLProfiler.get_top(top, sort_by)
+    if reset:
+        SQLProfiler.reset()
+    return result
+
+@celery_app.task(name="decay_active_level")
+def task_decay_active_level(chunk_size: int = None, sleep: float = None):
+    """按时间重新计算所有用户的active_level
+
+    由celery beat定时执行，长时间没有新数据的用户的active_level也会随时间变化
+
+    在low通道内执行，开启TASK_LANES时不会占用high通道保留的数据库连接
+    """
+    start_time = time.perf_counter()
+    with lane_gate.use('low'):
+        result = decay_active_level(chunk_size, sleep)
+    WorkerMetrics.observe_task('decay_active_level', time.perf_counter() - start_time, result)
+    if result.get('code', None) != 1000:
+        print(result)
+    return result
+
+@celery_app.task(name="update_user_data", bind=True, acks_late=True, max_retries=config.TASK_MAX_RETRIES)
+def task_update_user_data(self, user_datas: dict | list, start_chunk: int = 0):
     """更新用户数据库的数据
 
     更新包括user_basic, user_info, user_clan数据表
@@ -37,15 +71,37 @@ def task_update_user_data(user_datas: dict | list):
         }
     }
     如果某个数据没有，则value设置为None或者{}，建议统一使用None
+
+    数据会和同一个worker内其他任务的数据合并后，在同一个事务中按表批量写入
+
+    也可以传入CompactPayload.encode(user_datas, 'user')编码后的紧凑格式
+
+    数据按TASK_CHUNK_SIZE条分块提交，某一块写入失败时任务会从该块开始重试，已经提交的块不会重复写入，
+    部分数据转入死信时不会重试，任务返回该错误
+
+    写入进度只保存在重试消息的start_chunk中，worker崩溃或消息因acks_late重新投递时，
+    会从该消息的start_chunk(首次执行为0)重新开始，已经提交的块会再写入一次，写入是幂等的，结果不变
+
+    开启TASK_LANES时，high通道的任务使用单独的合并批次，并受通道的并发数量和连接数量限制
     """
-    result = update_user_data(user_datas)
+    start_time = time.perf_counter()
+    datas = CompactPayload.decode(user_datas) if CompactPayload.is_compact(user_datas) else user_datas
+    lane = ShardRouter.get_task_lane(self.request)
+    batcher = high_lane_batcher if lane == 'high' else write_batcher
+    with lane_gate.use(lane):
+        result, failed_chunk = batcher.submit_chunks(user_datas=datas, start_chunk=start_chunk)
+    WorkerMetrics.observe_task('update_user_data', time.perf_counter() - start_time, result)
+    if self.request.retries == 0:
+        WorkerMetrics.count_records('update_user_data', 'user', 1 if type(datas) == dict else len(datas))
     if result.get('code', None) != 1000:
         print(result)
-    return 'ok'
+    if failed_chunk is not None and self.request.retries < self.max_retries:
+        raise self.retry(args=[user_datas], kwargs={'start_chunk': failed_chunk}, countdown=config.TASK_RETRY_DELAY)
+    return 'ok' if result.get('code', None) == 1000 else result
 
 
-@celery_app.task(name="update_clan_data")
-def task_update_clan_data(clan_data: dict):
+@celery_app.task(name="update_clan_data", bind=True, acks_late=True, max_retries=config.TASK_MAX_RETRIES)
+def task_update_clan_data(self, clan_data: dict | list, start_chunk: int = 0):
     """更新工会数据库的数据
 
     更新包括clan_basic, clan_info数据表
@@ -69,9 +125,91 @@ def task_update_clan_data(clan_data: dict):
         }
     }
     如果某个数据没有，则value设置为None或者{}，建议统一使用None
+
+    数据会和同一个worker内其他任务的数据合并后，在同一个事务中按表批量写入
+
+    也可以传入CompactPayload.encode(clan_datas, 'clan')编码后的紧凑格式
+
+    数据按TASK_CHUNK_SIZE条分块提交，某一块写入失败时任务会从该块开始重试，已经提交的块不会重复写入，
+    部分数据转入死信时不会重试，任务返回该错误
+
+    写入进度只保存在重试消息的start_chunk中，worker崩溃或消息因acks_late重新投递时，
+    会从该消息的start_chunk(首次执行为0)重新开始，已经提交的块会再写入一次，写入是幂等的，结果不变
+
+    开启TASK_LANES时，high通道的任务使用单独的合并批次，并受通道的并发数量和连接数量限制
     """
-    result = update_clan_data(clan_data)
+    start_time = time.perf_counter()
+    datas = CompactPayload.decode(clan_data) if CompactPayload.is_compact(clan_data) else clan_data
+    lane = ShardRouter.get_task_lane(self.request)
+    batcher = high_lane_batcher if lane == 'high' else write_batcher
+    with lane_gate.use(lane):
+        result, failed_chunk = batcher.submit_chunks(clan_datas=datas, start_chunk=start_chunk)
+    WorkerMetrics.observe_task('update_clan_data', time.perf_counter() - start_time, result)
+    if self.request.retries == 0:
+        WorkerMetrics.count_records('update_clan_data', 'clan', 1 if type(datas) == dict else len(datas))
     if result.get('code', None) != 1000:
         print(result)
-    return 'ok'
-    
\ No newline at end of file
+    if failed_chunk is not None and self.request.retries < self.max_retries:
+        raise self.retry(args=[clan_data], kwargs={'start_chunk': failed_chunk}, countdown=config.TASK_RETRY_DELAY)
+    return 'ok' if result.get('code', None) == 1000 else result
+
+
+@celery_app.task(name="read_user_data")
+def task_read_user_data(keys: list):
+    """批量读取用户数据
+
+    参数为[[region_id, account_id], ...]，优先使用worker内的缓存，在high通道内执行
+
+    返回值格式如下：
+    {
+        'status': 'ok',
+        'code': 1000,
+        'message': 'Success',
+        'data': {
+            'fields': ['region_id', 'account_id', 'username', ...],
+            'rows': [[...], ...],
+            'missing': [[region_id, account_id], ...]
+        }
+    }
+    """
+    start_time = time.perf_counter()
+    with lane_gate.use('high'):
+        result = read_user_datas(keys)
+    WorkerMetrics.observe_task('read_user_data', time.perf_counter() - start_time, result)
+    return result
+
+
+@celery_app.task(name="read_clan_data")
+def task_read_clan_data(keys: list):
+    """批量读取工会数据
+
+    参数为[[region_id, clan_id], ...]，返回值格式与read_user_data相同，在high通道内执行
+    """
+    start_time = time.perf_counter()
+    with lane_gate.use('high'):
+        result = read_clan_datas(keys)
+    WorkerMetrics.observe_task('read_clan_data', time.perf_counter() - start_time, result)
+    return result
+
+
+@celery_app.task(name="sync_clan_members", acks_late=True)
+def task_sync_clan_members(clan_members: dict | list):
+    """根据工会当前的成员列表同步clan_users和user_clan
+
+    参数格式如下：
+    clan_members = {
+        'region_id': None,
+        'clan_id': None,
+        'members': [account_id, ...]
+    }
+    可以传入多个工会的列表，所有工会在同一个事务中写入
+
+    成员列表和成员的user_clan都没有变化的工会不会写入，只更新加入和离开的用户的user_clan，在low通道内执行
+    """
+    start_time = time.perf_counter()
+    with lane_gate.use('low'):
+        result = sync_clan_members(clan_members)
+    WorkerMetrics.observe_task('sync_clan_members', time.perf_counter() - start_time, result)
+    if result.get('code', None) != 1000:
+        print(result)
+    return result
@@ -1,7 +1,13 @@
 from .time_utils import TimeFormat
 from .common_utils import CommonUtils
+from .cache_utils import TTLCache
+from .payload_utils import CompactPayload
+from .shard_utils import ShardRouter
 
 __all__ = [
     'TimeFormat',
-    'CommonUtils'
+    'CommonUtils',
+    'TTLCache',
+    'CompactPayload',
+    'ShardRouter'
 ]
\ No newline at end of file
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    '''带有过期时间的LRU缓存
+
+    超过max_size时淘汰最久未使用的数据，超过ttl秒的数据视为不存在
+
+    get也会修改内部的OrderedDict，backfill在操作系统线程中调用写入函数，因此所有操作都在锁内进行
+    eventlet会将threading替换为协程实现，锁内没有会让出执行权的操作，不会挂起其他协程
+    '''
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.__data = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+
+    def __len__(self):
+        return len(self.__data)
+
+    def get(self, key, default=None):
+        "获取缓存，返回值为缓存数据的浅拷贝"
+        with self.__lock:
+            return self.__get(key, default)
+
+    def __get(self, key, default):
+        item = self.__data.get(key)
+        if item is None:
+            self.__stats['misses'] += 1
+            return default
+        expire_time, value = item
+        if expire_time < time.monotonic():
+            del self.__data[key]
+            self.__stats['expirations'] += 1
+            self.__stats['misses'] += 1
+            return default
+        self.__data.move_to_end(key)
+        self.__stats['hits'] += 1
+        return value.copy() if hasattr(value, 'copy') else value
+
+    def get_many(self, keys: list) -> dict:
+        "批量获取缓存，只返回命中的数据"
+        result = {}
+        with self.__lock:
+            for key in keys:
+                value = self.__get(key, None)
+                if value is not None:
+                    result[key] = value
+        return result
+
+    def set(self, key, value):
+        with self.__lock:
+            self.__set(key, value)
+
+    def __set(self, key, value):
+        self.__data[key] = (time.monotonic() + self.ttl, value)
+        self.__data.move_to_end(key)
+        while len(self.__data) > self.max_size:
+            self.__data.popitem(last=False)
+            self.__stats['evictions'] += 1
+
+    def set_many(self, items: dict):
+        with self.__lock:
+            for key, value in items.items():
+                self.__set(key, value)
+
+    def invalidate(self, keys: list):
+        "删除缓存，用于写入失败后缓存与数据库可能不一致的情况"
+        with self.__lock:
+            for key in keys:
+                if self.__data.pop(key, None) is not None:
+                    self.__stats['invalidations'] += 1
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+
+    def get_stats(self) -> dict:
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats['size'] = len(self.__data)
+        return stats
@@ -1,5 +1,18 @@
+from bisect import bisect_left
+
 from .time_utils import TimeFormat
 
+# 距离上次战斗的时间上限，不超过第i个上限时active_level为i+2，超过最后一个上限时为9
+ACTIVE_LEVEL_LIMITS = [
+    1 * 24 * 60 * 60,
+    3 * 24 * 60 * 60,
+    7 * 24 * 60 * 60,
+    30 * 24 * 60 * 60,
+    90 * 24 * 60 * 60,
+    180 * 24 * 60 * 60,
+    360 * 24 * 60 * 60,
+]
+
 
 class CommonUtils:
     def get_active_level(is_public, total_battles, last_battle_time):
@@ -22,17 +35,30 @@ class CommonUtils:
         if total_battles == 0 or last_battle_time == 0:
             return 1
         current_timestamp = TimeFormat.get_current_timestamp()
-        time_differences = [
-            (1 * 24 * 60 * 60, 2),
-            (3 * 24 * 60 * 60, 3),
-            (7 * 24 * 60 * 60, 4),
-            (30 * 24 * 60 * 60, 5),
-            (90 * 24 * 60 * 60, 6),
-            (180 * 24 * 60 * 60, 7),
-            (360 * 24 * 60 * 60, 8),
-        ]
         time_since_last_battle = current_timestamp - last_battle_time
-        for time_limit, return_value in time_differences:
+        for index, time_limit in enumerate(ACTIVE_LEVEL_LIMITS):
             if time_since_last_battle <= time_limit:
-                return return_value
-        return 9
\ No newline at end of file
+                return index + 2
+        return 9
+
+    def get_active_levels(users: list, current_timestamp: int = None) -> list:
+        '''批量获取active_level，结果与get_active_level一致
+
+        所有用户使用同一个时间戳，按时间上限二分查找
+
+        参数:
+            users: [(is_public, total_battles, last_battle_time)]
+            current_timestamp: 计算使用的时间戳，默认为当前时间
+        '''
+        if current_timestamp is None:
+            current_timestamp = TimeFormat.get_current_timestamp()
+        limits = ACTIVE_LEVEL_LIMITS
+        levels = []
+        for is_public, total_battles, last_battle_time in users:
+            if not is_public:
+                levels.append(0)
+            elif total_battles == 0 or last_battle_time == 0:
+                levels.append(1)
+            else:
+                levels.append(bisect_left(limits, current_timestamp - last_battle_time) + 2)
+        return levels
\ No newline at end of file
@@ -0,0 +1,117 @@
+import json
+import zlib
+import base64
+
+# 每个版本的列定义，新增或调整字段时增加版本号，旧版本保留以兼容还未升级的生产者
+# 列为字段在数据中的路径，路径长度为2时第一项为所属的部分(basic/info/clan)
+COLUMNS = {
+    1: {
+        'user': [
+            ('region_id',),
+            ('account_id',),
+            ('basic', 'nickname'),
+            ('info', 'is_active'),
+            ('info', 'is_public'),
+            ('info', 'total_battles'),
+            ('info', 'last_battle_time'),
+            ('clan', 'id'),
+            ('clan', 'tag'),
+            ('clan', 'league')
+        ],
+        'clan': [
+            ('region_id',),
+            ('clan_id',),
+            ('basic', 'tag'),
+            ('basic', 'league'),
+            ('info', 'is_active'),
+            ('info', 'season_number'),
+            ('info', 'public_rating'),
+            ('info', 'league'),
+            ('info', 'division'),
+            ('info', 'division_rating'),
+            ('info', 'last_battle_at')
+        ]
+    }
+}
+SECTIONS = {
+    'user': ['basic', 'info', 'clan'],
+    'clan': ['basic', 'info']
+}
+FORMAT_NAME = 'kokomi-columnar'
+CURRENT_VERSION = 1
+
+
+class CompactPayload:
+    '''update_user_data和update_clan_data的紧凑格式
+
+    将数据按字段转换为列，通过zlib压缩后使用base64编码，可以直接作为celery任务的参数发送
+
+    格式如下：
+    {
+        'format': 'kokomi-columnar',
+        'version': 1,
+        'type': 'user' | 'clan',
+        'count': 数据条数,
+        'data': base64(zlib(json({'sections': [...], 'columns': [[...], ...]})))
+    }
+    sections中每一项为该条数据中存在的部分的位掩码，不存在的部分(None或{})解码后为None，
+    存在的部分中缺少的字段解码后为None
+    '''
+    @staticmethod
+    def is_compact(payload) -> bool:
+        return isinstance(payload, dict) and payload.get('format') == FORMAT_NAME
+
+    @staticmethod
+    def encode(datas: list, data_type: str, level: int = 6) -> dict:
+        "将数据列表编码为紧凑格式，data_type为user或clan"
+        columns = COLUMNS[CURRENT_VERSION][data_type]
+        sections = SECTIONS[data_type]
+        masks = []
+        values = [[] for _ in columns]
+        for data in datas:
+            mask = 0
+            for index, section in enumerate(sections):
+                if data.get(section) != None and data.get(section) != {}:
+                    mask |= 1 << index
+            masks.append(mask)
+            for column, path in zip(values, columns):
+                if len(path) == 1:
+                    column.append(data[path[0]])
+                else:
+                    section = data.get(path[0]) or {}
+                    column.append(section.get(path[1]))
+        body = json.dumps({'sections': masks, 'columns': values}, separators=(',', ':'))
+        return {
+            'format': FORMAT_NAME,
+            'version': CURRENT_VERSION,
+            'type': data_type,
+            'count': len(datas),
+            'data': base64.b64encode(zlib.compress(body.encode('utf-8'), level)).decode('ascii')
+        }
+
+    @staticmethod
+    def decode(payload: dict) -> list:
+        "将紧凑格式解码为原有的数据列表"
+        version = payload.get('version')
+        if version not in COLUMNS:
+            raise ValueError(f'Unsupported payload version: {version}')
+        data_type = payload['type']
+        columns = COLUMNS[version][data_type]
+        sections = SECTIONS[data_type]
+        body = json.loads(zlib.decompress(base64.b64decode(payload['data'])))
+        masks = body['sections']
+        values = body['columns']
+        if len(masks) != payload['count'] or len(values) != len(columns):
+            raise ValueError('Malformed payload')
+        datas = []
+        for row_index, mask in enumerate(masks):
+            data = {}
+            for index, section in enumerate(sections):
+                data[section] = {} if mask & (1 << index) else None
+            for path, column in zip(columns, values):
+                if len(path) == 1:
+                    data[path[0]] = column[row_index]
+                elif data[path[0]] is not None:
+                    data[path[0]][path[1]] = column[row_index]
+            datas.append(data)
+        return datas
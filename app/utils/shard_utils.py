@@ -0,0 +1,177 @@
+import zlib
+
+from app.core import EnvConfig
+
+from .payload_utils import CompactPayload
+
+config = EnvConfig.get_config()
+
+# 按分片路由的任务以及数据中用于计算分片的字段
+SHARD_TASKS = {
+    'update_user_data': 'account_id',
+    'update_clan_data': 'clan_id',
+    'sync_clan_members': 'clan_id'
+}
+# 按数据条数区分优先级通道的任务
+LANE_TASKS = {'update_user_data', 'update_clan_data'}
+# 固定在一个通道内的分片任务，开启TASK_LANES时worker只订阅分片的通道队列，分片任务必须带有通道
+FIXED_LANE_TASKS = {'sync_clan_members': 'low'}
+LANES = ['high', 'low']
+
+
+class ShardRouter:
+    '''按(region_id, account_id)或(region_id, clan_id)的哈希将更新任务路由到TASK_SHARDS个分片队列
+
+    同一个用户或工会的数据总是发送到同一个队列，worker只订阅部分分片时，
+    worker内的缓存只需要保存这些分片的数据，不同worker之间也不会同时写入同一行
+
+    队列名称为 {TASK_QUEUE}.{shard}，TASK_SHARDS为0时不分片，所有任务发送到TASK_QUEUE
+
+    开启TASK_LANES时，update_user_data和update_clan_data再按数据条数分为high和low两个通道，
+    队列名称为 {分片队列}.high 和 {分片队列}.low，单个用户的刷新不会排在大批量的抓取任务之后，
+    sync_clan_members固定发送到 {分片队列}.low
+    '''
+    @staticmethod
+    def get_shard(region_id: int, key_id: int, shards: int = None) -> int:
+        "计算分片，不使用hash()以保证不同进程的结果一致"
+        shards = shards or config.TASK_SHARDS
+        return zlib.crc32(f'{region_id}:{key_id}'.encode()) % shards
+
+    @staticmethod
+    def get_queue(shard: int = None) -> str:
+        if shard is None or config.TASK_SHARDS <= 0:
+            return config.TASK_QUEUE
+        return f'{config.TASK_QUEUE}.{shard}'
+
+    @staticmethod
+    def get_lane_queue(queue: str, lane: str = None) -> str:
+        if not config.TASK_LANES or lane is None:
+            return queue
+        return f'{queue}.{lane}'
+
+    @staticmethod
+    def get_lane(datas) -> str:
+        "数据条数不超过HIGH_LANE_MAX_RECORDS时为high，datas可以是单条数据、列表或紧凑格式"
+        if isinstance(datas, dict):
+            count = datas['count'] if CompactPayload.is_compact(datas) else 1
+        else:
+            count = len(datas)
+        return 'high' if count <= config.HIGH_LANE_MAX_RECORDS else 'low'
+
+    @staticmethod
+    def get_task_lane(request) -> str | None:
+        "根据任务所在的队列判断通道，没有开启TASK_LANES时返回None"
+        if not config.TASK_LANES:
+            return None
+        queue = (request.delivery_info or {}).get('routing_key') or ''
+        for lane in LANES:
+            if queue.endswith(f'.{lane}'):
+                return lane
+        return None
+
+    @staticmethod
+    def get_queues(shards: str | list = None, lanes: str | list = None) -> list:
+        '''分片和通道对应的队列名称
+
+        shards为逗号分隔的分片编号，为空时返回所有分片，lanes为逗号分隔的通道，为空时返回两个通道
+        '''
+        if config.TASK_SHARDS <= 0:
+            queues = [config.TASK_QUEUE]
+        else:
+            if shards is None or shards == '':
+                shards = range(config.TASK_SHARDS)
+            elif isinstance(shards, str):
+                shards = [int(shard) for shard in shards.split(',')]
+            queues = [ShardRouter.get_queue(shard) for shard in shards]
+        if not config.TASK_LANES:
+            return queues
+        if lanes is None or lanes == '':
+            lanes = LANES
+        elif isinstance(lanes, str):
+            lanes = lanes.split(',')
+        return [ShardRouter.get_lane_queue(queue, lane) for queue in queues for lane in lanes]
+
+    @classmethod
+    def get_data_queue(cls, data: dict, key: str) -> str:
+        if config.TASK_SHARDS <= 0:
+            return config.TASK_QUEUE
+        return cls.get_queue(cls.get_shard(data['region_id'], data[key]))
+
+    @classmethod
+    def split(cls, datas: list, key: str) -> dict:
+        '''将数据按分片拆分，key为account_id或clan_id
+
+        返回值格式如下：
+        {
+            queue: [data, ...]
+        }
+        '''
+        result = {}
+        for data in datas:
+            result.setdefault(cls.get_data_queue(data, key), []).append(data)
+        return result
+
+    @classmethod
+    def split_user_datas(cls, user_datas: list) -> dict:
+        return cls.split(user_datas, 'account_id')
+
+    @classmethod
+    def split_clan_datas(cls, clan_datas: list) -> dict:
+        return cls.split(clan_datas, 'clan_id')
+
+    @classmethod
+    def send(
+        cls,
+        celery_app,
+        user_datas: list = None,
+        clan_datas: list = None,
+        compact: bool = False,
+        lane: str = None
+    ) -> list:
+        '''供生产者使用，将用户和工会数据按分片拆分后分别发送update_user_data和update_clan_data任务
+
+        compact为True时使用CompactPayload编码，返回发送的AsyncResult列表
+
+        开启TASK_LANES时，lane为None则按拆分后每个任务的数据条数选择通道，也可以指定为high或low
+        '''
+        results = []
+        for task_name, data_type, split_datas in [
+            ('update_user_data', 'user', cls.split_user_datas(user_datas or [])),
+            ('update_clan_data', 'clan', cls.split_clan_datas(clan_datas or []))
+        ]:
+            for queue, datas in split_datas.items():
+                payload = CompactPayload.encode(datas, data_type) if compact else datas
+                queue = cls.get_lane_queue(queue, lane or cls.get_lane(datas))
+                results.append(celery_app.send_task(name=task_name, args=[payload], queue=queue))
+        return results
+
+    @classmethod
+    def route_task(cls, name, args, kwargs, options, task=None, **kw):
+        '''celery的task_routes路由函数
+
+        update_user_data和update_clan_data按第一条数据的分片路由，其余任务以及紧凑格式的数据发送到TASK_QUEUE，
+        发送时指定queue则以指定的为准，使用send拆分后发送可以保证同一个任务内的数据属于同一个分片
+
+        开启TASK_LANES时，update_user_data和update_clan_data再按数据条数发送到对应通道的队列，
+        sync_clan_members发送到low通道的队列；分片时无法计算分片的任务发送到TASK_QUEUE，不区分通道
+        '''
+        queue = cls.__route_shard(name, args)
+        if config.TASK_SHARDS > 0 and queue == config.TASK_QUEUE:
+            return {'queue': queue}
+        if name in LANE_TASKS and args:
+            queue = cls.get_lane_queue(queue, cls.get_lane(args[0]))
+        elif name in FIXED_LANE_TASKS:
+            queue = cls.get_lane_queue(queue, FIXED_LANE_TASKS[name])
+        return {'queue': queue}
+
+    @classmethod
+    def __route_shard(cls, name, args) -> str:
+        key = SHARD_TASKS.get(name)
+        if key is None or config.TASK_SHARDS <= 0 or not args:
+            return config.TASK_QUEUE
+        datas = args[0]
+        if isinstance(datas, list):
+            datas = datas[0] if datas != [] else None
+        if not isinstance(datas, dict) or key not in datas:
+            return config.TASK_QUEUE
+        return cls.get_data_queue(datas, key)
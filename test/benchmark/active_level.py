@@ -0,0 +1,76 @@
+'''CommonUtils.get_active_level 与 get_active_levels 的对比
+
+先检查批量版本与逐条版本的结果一致(包括各个时间上限的边界)，再比较两者的耗时
+
+使用方法(在项目根目录运行):
+    python test/benchmark/active_level.py --rows 100000
+'''
+import time
+import random
+import argparse
+
+from common import setup_env
+setup_env()
+
+from app.utils import CommonUtils, TimeFormat
+from app.utils.common_utils import ACTIVE_LEVEL_LIMITS
+
+
+def build_rows(count: int, now: int, seed: int) -> list:
+    rnd = random.Random(seed)
+    rows = []
+    # 边界值
+    for limit in [0] + ACTIVE_LEVEL_LIMITS:
+        for offset in (-1, 0, 1):
+            rows.append((1, 100, now - limit + offset))
+    rows += [(0, 100, now), (1, 0, now), (1, 100, 0), (1, 0, 0), (None, None, None), (1, 100, now + 3600)]
+    for _ in range(count - len(rows)):
+        rows.append((
+            int(rnd.random() < 0.9),
+            0 if rnd.random() < 0.02 else rnd.randint(1, 50000),
+            0 if rnd.random() < 0.02 else now - rnd.randint(0, 2 * 365 * 24 * 60 * 60)
+        ))
+    return rows
+
+def check(rows: list, now: int):
+    "固定当前时间后对比两个版本的结果"
+    get_current_timestamp = TimeFormat.get_current_timestamp
+    TimeFormat.get_current_timestamp = lambda: now
+    try:
+        expected = [CommonUtils.get_active_level(*row) for row in rows]
+    finally:
+        TimeFormat.get_current_timestamp = get_current_timestamp
+    result = CommonUtils.get_active_levels(rows, now)
+    for row, level, expected_level in zip(rows, result, expected):
+        assert level == expected_level, (row, level, expected_level)
+
+def timeit(func, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    now = TimeFormat.get_current_timestamp()
+    rows = build_rows(args.rows, now, args.seed)
+    check(rows, now)
+    scalar = timeit(lambda: [CommonUtils.get_active_level(*row) for row in rows], args.repeat)
+    batch = timeit(lambda: CommonUtils.get_active_levels(rows, now), args.repeat)
+    print(f'rows: {len(rows)}  results match')
+    print(f"{'':8}{'seconds':>10}{'rows/s':>14}")
+    for name, seconds in [('scalar', scalar), ('batch', batch)]:
+        print(f"{name:8}{seconds:>10.4f}{round(len(rows) / seconds):>14}")
+    print(f'speedup: x{scalar / batch:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+'''update_clan_data 与 bulk_update_clan_data 的语句数对比
+
+使用方法(在项目根目录运行):
+    python test/benchmark/clan_statements.py --clans 10000 --new 0.2 --changed 0.3
+'''
+import time
+import argparse
+
+from common import setup_env
+setup_env()
+
+from app.core import EnvConfig
+from app.db import DatabaseConnection, update_clan_data, bulk_update_clan_data
+from app.db.cache import clan_cache
+
+from standin import StandinPool
+from payloads import PayloadGenerator
+
+
+def run(func, seed_batch: list, batch: list) -> dict:
+    pool = StandinPool(EnvConfig.get_config().DB_NAME_MAIN)
+    DatabaseConnection._pool = pool
+    clan_cache.clear()
+    bulk_update_clan_data(seed_batch)
+    # 与run.py相同，预置数据写入的缓存不计入测试
+    clan_cache.clear()
+    pool.statements = 0
+    start = time.perf_counter()
+    result = func(batch)
+    elapsed = time.perf_counter() - start
+    assert result['code'] == 1000, result
+    pool.close()
+    DatabaseConnection._pool = None
+    return {
+        'statements': pool.statements,
+        'statements_per_clan': round(pool.statements / len(batch), 4),
+        'seconds': round(elapsed, 4)
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clans', type=int, default=10000)
+    parser.add_argument('--new', type=float, default=0.2, help='新工会比例')
+    parser.add_argument('--changed', type=float, default=0.3, help='现有工会中数据变化的比例')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    seed_batch, batch = PayloadGenerator(args.seed).clan_datas(
+        args.clans,
+        existing=1 - args.new,
+        changed=args.changed,
+        inactive=0
+    )
+    loop = run(update_clan_data, seed_batch, batch)
+    bulk = run(bulk_update_clan_data, seed_batch, batch)
+    print(f'clans: {len(batch)}  new: {args.new}  changed: {args.changed}')
+    print(f"{'':8}{'statements':>12}{'per clan':>12}{'seconds':>10}")
+    for name, result in [('loop', loop), ('bulk', bulk)]:
+        print(f"{name:8}{result['statements']:>12}{result['statements_per_clan']:>12}{result['seconds']:>10}")
+
+
+if __name__ == '__main__':
+    main()
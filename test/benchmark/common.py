@@ -0,0 +1,36 @@
+'''基准测试脚本的公共部分
+
+在导入app之前调用setup_env，使脚本可以在没有.env的情况下使用替身数据库运行
+'''
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_ENV = {
+    'MYSQL_HOST': '127.0.0.1',
+    'MYSQL_PORT': '3306',
+    'MYSQL_USERNAME': 'root',
+    'MYSQL_PASSWORD': '',
+    'DB_NAME_MAIN': 'kokomi',
+    'DB_NAME_BOT': 'kokomi_bot',
+    'DB_NAME_SHIP': 'kokomi_ship',
+    'RABBITMQ_HOST': '127.0.0.1',
+    'RABBITMQ_USERNAME': 'guest',
+    'RABBITMQ_PASSWORD': 'guest',
+    'METRICS_PORT': '0'
+}
+
+def setup_env():
+    "将项目根目录加入sys.path，并为缺少的配置项设置默认值，已有的环境变量和.env不受影响"
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    env_file = os.path.join(ROOT, '.env')
+    if os.path.exists(env_file):
+        return
+    for key, value in DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+    # 错误日志、死信和变更事件写入临时目录，避免在项目目录中留下文件
+    if 'LOG_PATH' not in os.environ:
+        os.environ['LOG_PATH'] = tempfile.mkdtemp(prefix='kokomi_')
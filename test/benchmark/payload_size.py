@@ -0,0 +1,107 @@
+'''任务参数使用原有格式与CompactPayload紧凑格式的对比
+
+通过kombu的内存transport发送celery格式的任务消息，不需要RabbitMQ，
+统计消息体大小、生产者编码耗时和worker解码耗时，并检查解码后的数据与原数据一致
+
+使用方法(在项目根目录运行):
+    python test/benchmark/payload_size.py --batch-size 1000
+'''
+import time
+import argparse
+
+from common import setup_env
+setup_env()
+
+from kombu import Connection, Exchange, Queue
+from kombu.serialization import loads
+
+from app.utils import CompactPayload
+
+from payloads import PayloadGenerator
+
+
+def normalize(datas: list) -> list:
+    "解码后不存在的部分为None，部分中缺少的字段为None，对比前统一去掉"
+    result = []
+    for data in datas:
+        data = dict(data)
+        for section in ['basic', 'info', 'clan']:
+            if data.get(section):
+                data[section] = {key: value for key, value in data[section].items() if value is not None}
+            elif section in data:
+                data[section] = None
+        result.append(data)
+    return result
+
+def send_and_receive(conn: Connection, queue: Queue, name: str, arg) -> tuple:
+    "以celery任务消息的格式发送并接收，返回(消息体字节数, 发送耗时, 消息体, content_type, content_encoding)"
+    producer = conn.Producer(serializer='json')
+    start = time.perf_counter()
+    producer.publish(
+        [[arg], {}, {'callbacks': None, 'errbacks': None, 'chain': None, 'chord': None}],
+        exchange=queue.exchange,
+        routing_key=queue.routing_key,
+        headers={'task': name, 'lang': 'py'},
+        declare=[queue]
+    )
+    encode_time = time.perf_counter() - start
+    message = conn.SimpleQueue(queue).get(timeout=1)
+    body = message.body
+    message.ack()
+    return len(body), encode_time, body, message.content_type, message.content_encoding
+
+def run(conn: Connection, queue: Queue, name: str, datas: list, data_type: str, compact: bool, repeat: int) -> dict:
+    best_encode = best_decode = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        arg = CompactPayload.encode(datas, data_type) if compact else datas
+        convert_time = time.perf_counter() - start
+        size, publish_time, body, content_type, content_encoding = send_and_receive(conn, queue, name, arg)
+        start = time.perf_counter()
+        received = loads(body, content_type, content_encoding)[0][0]
+        if CompactPayload.is_compact(received):
+            received = CompactPayload.decode(received)
+        decode_time = time.perf_counter() - start
+        encode_time = convert_time + publish_time
+        best_encode = encode_time if best_encode is None else min(best_encode, encode_time)
+        best_decode = decode_time if best_decode is None else min(best_decode, decode_time)
+    assert normalize(received) == normalize(datas)
+    return {
+        'bytes': size,
+        'bytes_per_record': round(size / len(datas), 1),
+        'encode_ms': round(best_encode * 1000, 3),
+        'decode_ms': round(best_decode * 1000, 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generator = PayloadGenerator(args.seed)
+    _, user_datas = generator.user_datas(args.batch_size)
+    _, clan_datas = generator.clan_datas(args.batch_size)
+    queue = Queue('task_queue', Exchange('task_queue'), routing_key='task_queue')
+    print(f'batch size: {args.batch_size}')
+    print(f"{'':20}{'bytes':>10}{'bytes/rec':>11}{'encode ms':>11}{'decode ms':>11}")
+    with Connection('memory://') as conn:
+        for name, data_type, datas in [
+            ('update_user_data', 'user', user_datas),
+            ('update_clan_data', 'clan', clan_datas)
+        ]:
+            results = {}
+            for compact in (False, True):
+                results[compact] = run(conn, queue, name, datas, data_type, compact, args.repeat)
+                result = results[compact]
+                label = f"{data_type} {'compact' if compact else 'dict'}"
+                print(
+                    f"{label:20}{result['bytes']:>10}{result['bytes_per_record']:>11}"
+                    f"{result['encode_ms']:>11}{result['decode_ms']:>11}"
+                )
+            print(f"{data_type} size ratio: x{results[False]['bytes'] / results[True]['bytes']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
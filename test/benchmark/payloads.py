@@ -0,0 +1,155 @@
+'''生成update_user_data和update_clan_data的测试数据
+
+每个生成函数返回(seed_datas, datas)：seed_datas用于预先写入数据库作为现有数据，datas为待测试的数据
+'''
+import time
+import random
+
+DAY = 24 * 60 * 60
+
+
+class PayloadGenerator:
+    def __init__(self, seed: int = 0, region_id: int = 1, now: int = None):
+        self.rnd = random.Random(seed)
+        self.region_id = region_id
+        self.now = now or int(time.time())
+
+    def user(
+        self,
+        account_id: int,
+        nickname: str,
+        is_active: bool = True,
+        total_battles: int = 1000,
+        last_battle_time: int = None,
+        clan: dict = None
+    ) -> dict:
+        if is_active:
+            info = {
+                'is_active': 1,
+                'is_public': 1,
+                'total_battles': total_battles,
+                'last_battle_time': last_battle_time or self.now - DAY
+            }
+        else:
+            info = {'is_active': 0, 'is_public': None, 'total_battles': None, 'last_battle_time': None}
+        return {
+            'region_id': self.region_id,
+            'account_id': account_id,
+            'basic': {'nickname': nickname},
+            'info': info,
+            'clan': clan or {'id': None, 'tag': None, 'league': None}
+        }
+
+    def clan_ref(self, clan_id: int) -> dict:
+        return {'id': clan_id, 'tag': f'C{clan_id % 100000}', 'league': clan_id % 5}
+
+    def user_datas(
+        self,
+        count: int,
+        existing: float = 0.7,
+        renames: float = 0.05,
+        inactive: float = 0.05,
+        played: float = 0.3,
+        clan_changes: float = 0.05,
+        clans: int = 200,
+        start_id: int = 2000000000
+    ) -> tuple:
+        '''生成用户数据
+
+        参数:
+            count: 待测试的用户数量
+            existing: 已经存在于数据库中的用户比例
+            renames: 现有用户中改名的比例
+            inactive: 现有用户中变为不活跃的比例
+            played: 现有用户中有新对局(total_battles和last_battle_time变化)的比例
+            clan_changes: 现有用户中更换或者退出工会的比例
+            clans: 用户所属工会的数量
+        '''
+        seed_datas = []
+        datas = []
+        clan_start = start_id + count
+        for i in range(count):
+            account_id = start_id + i
+            clan_id = clan_start + self.rnd.randrange(clans) if clans else None
+            clan = self.clan_ref(clan_id) if clan_id else None
+            total_battles = self.rnd.randint(100, 20000)
+            last_battle_time = self.now - self.rnd.randint(DAY, 60 * DAY)
+            if self.rnd.random() >= existing:
+                datas.append(self.user(account_id, f'player_{account_id}', True, total_battles, last_battle_time, clan))
+                continue
+            seed_datas.append(self.user(account_id, f'player_{account_id}', True, total_battles, last_battle_time, clan))
+            nickname = f'player_{account_id}'
+            is_active = True
+            if self.rnd.random() < renames:
+                nickname = f'renamed_{account_id}'
+            if self.rnd.random() < inactive:
+                is_active = False
+            if self.rnd.random() < played:
+                total_battles += self.rnd.randint(1, 20)
+                last_battle_time = self.now - self.rnd.randint(60, DAY)
+            if self.rnd.random() < clan_changes:
+                if clans and self.rnd.random() < 0.5:
+                    clan = self.clan_ref(clan_start + self.rnd.randrange(clans))
+                else:
+                    clan = None
+            datas.append(self.user(account_id, nickname, is_active, total_battles, last_battle_time, clan))
+        return seed_datas, datas
+
+    def clan(
+        self,
+        clan_id: int,
+        is_active: bool = True,
+        public_rating: int = 1200,
+        last_battle_at: int = None
+    ) -> dict:
+        if is_active:
+            info = {
+                'is_active': 1,
+                'season_number': 27,
+                'public_rating': public_rating,
+                'league': 1,
+                'division': 2,
+                'division_rating': public_rating % 100,
+                'last_battle_at': last_battle_at or self.now - DAY
+            }
+        else:
+            info = {'is_active': 0}
+        return {
+            'region_id': self.region_id,
+            'clan_id': clan_id,
+            'basic': {'tag': f'C{clan_id % 100000}', 'league': 1},
+            'info': info
+        }
+
+    def clan_datas(
+        self,
+        count: int,
+        existing: float = 0.8,
+        changed: float = 0.3,
+        inactive: float = 0.05,
+        start_id: int = 2100000000
+    ) -> tuple:
+        '''生成工会数据
+
+        参数:
+            count: 待测试的工会数量
+            existing: 已经存在于数据库中的工会比例
+            changed: 现有工会中rating和last_battle_at变化的比例
+            inactive: 现有工会中变为不活跃的比例
+        '''
+        seed_datas = []
+        datas = []
+        for i in range(count):
+            clan_id = start_id + i
+            public_rating = self.rnd.randint(1000, 3000)
+            last_battle_at = self.now - self.rnd.randint(DAY, 30 * DAY)
+            if self.rnd.random() >= existing:
+                datas.append(self.clan(clan_id, True, public_rating, last_battle_at))
+                continue
+            seed_datas.append(self.clan(clan_id, True, public_rating, last_battle_at))
+            is_active = self.rnd.random() >= inactive
+            if self.rnd.random() < changed:
+                public_rating += self.rnd.randint(-50, 50) or 1
+                last_battle_at = self.now - self.rnd.randint(60, DAY)
+            datas.append(self.clan(clan_id, is_active, public_rating, last_battle_at))
+        return seed_datas, datas
@@ -0,0 +1,148 @@
+'''eventlet下连接池大小与吞吐量的关系
+
+每个任务取出连接后执行若干条语句并提交，有两种模式:
+    默认: 合成结果，使用每条语句固定sleep的模拟驱动(LatencyDB)，不连接数据库，
+        只反映连接池和协程调度本身的开销，不包括数据库的锁竞争、CPU和磁盘，不能直接作为生产环境的配置依据
+    --mysql: 使用pymysql连接.env或环境变量中配置的MySQL，每条语句在服务端执行DO SLEEP(latency)，
+        包括真实的网络往返和连接开销
+
+sqlite替身数据库只有一个连接，所有语句串行执行，不适合测试连接池大小
+
+使用方法(在项目根目录运行):
+    python test/benchmark/pool_size.py --tasks 2000 --greenlets 500 --latency 2
+    python test/benchmark/pool_size.py --mysql --tasks 2000 --greenlets 500 --latency 2
+'''
+import eventlet
+eventlet.monkey_patch()
+
+import time
+import argparse
+
+from common import setup_env
+setup_env()
+
+import pymysql
+
+from app.core import EnvConfig
+from app.db.db import ConnectionPool
+
+
+class LatencyDB:
+    '''每条语句固定延迟的DB-API驱动'''
+    threadsafety = 1
+    OperationalError = pymysql.err.OperationalError
+    InterfaceError = pymysql.err.InterfaceError
+    InternalError = pymysql.err.InternalError
+    latency = 0.002
+
+    class Cursor:
+        def execute(self, sql, params=None):
+            # 忽略语句本身，只模拟延迟
+            time.sleep(LatencyDB.latency)
+
+        def fetchall(self):
+            return []
+
+        def close(self):
+            pass
+
+    class Connection:
+        def begin(self):
+            pass
+
+        def cursor(self, *args):
+            return LatencyDB.Cursor()
+
+        def commit(self):
+            time.sleep(LatencyDB.latency)
+
+        def rollback(self):
+            pass
+
+        def ping(self, *args):
+            return True
+
+        def close(self):
+            pass
+
+    @staticmethod
+    def connect(*args, **kwargs):
+        return LatencyDB.Connection()
+
+
+def run_task(pool: ConnectionPool, statements: int, latency: float):
+    conn = pool.connection()
+    try:
+        conn.begin()
+        cur = conn.cursor()
+        for _ in range(statements):
+            cur.execute('DO SLEEP(%s)', [latency])
+        conn.commit()
+    finally:
+        conn.close()
+
+def create_pool(size: int, args) -> ConnectionPool:
+    if not args.mysql:
+        return ConnectionPool(
+            creator=LatencyDB,
+            max_connections=size,
+            min_cached=size,
+            max_cached=size,
+            timeout=600
+        )
+    config = EnvConfig.get_config()
+    return ConnectionPool(
+        creator=pymysql,
+        max_connections=size,
+        min_cached=size,
+        max_cached=size,
+        timeout=600,
+        host=config.MYSQL_HOST,
+        port=config.MYSQL_PORT,
+        user=config.MYSQL_USERNAME,
+        password=config.MYSQL_PASSWORD,
+        charset='utf8mb4',
+        connect_timeout=10
+    )
+
+def run(size: int, args) -> dict:
+    pool = create_pool(size, args)
+    green_pool = eventlet.GreenPool(args.greenlets)
+    start = time.perf_counter()
+    for _ in range(args.tasks):
+        green_pool.spawn_n(run_task, pool, args.statements, args.latency / 1000)
+    green_pool.waitall()
+    elapsed = time.perf_counter() - start
+    stats = pool.get_stats()
+    pool.close()
+    return {
+        'tasks_per_second': round(args.tasks / elapsed, 1),
+        'wait_ms_avg': round(stats['wait_seconds_total'] / stats['checkouts'] * 1000, 2),
+        'wait_ms_max': round(stats['wait_seconds_max'] * 1000, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--greenlets', type=int, default=500, help='并发的协程数量')
+    parser.add_argument('--statements', type=int, default=4, help='每个任务执行的语句数量')
+    parser.add_argument('--latency', type=float, default=2, help='每条语句的延迟(毫秒)')
+    parser.add_argument('--sizes', type=str, default='2,5,10,20,50')
+    parser.add_argument('--mysql', action='store_true', help='连接配置的MySQL，默认使用模拟驱动')
+    args = parser.parse_args()
+    LatencyDB.latency = args.latency / 1000
+
+    if args.mysql:
+        config = EnvConfig.get_config()
+        print(f'mode: MySQL {config.MYSQL_HOST}:{config.MYSQL_PORT}')
+    else:
+        print('mode: synthetic (LatencyDB sleeps instead of querying a database, use --mysql for real numbers)')
+    print(f'tasks: {args.tasks}  greenlets: {args.greenlets}  latency: {args.latency}ms x {args.statements + 1}')
+    print(f"{'pool size':>10}{'tasks/s':>12}{'avg wait ms':>14}{'max wait ms':>14}")
+    for size in [int(size) for size in args.sizes.split(',')]:
+        result = run(size, args)
+        print(f"{size:>10}{result['tasks_per_second']:>12}{result['wait_ms_avg']:>14}{result['wait_ms_max']:>14}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+'''app/db中用户和工会数据更新函数的基准测试
+
+使用PayloadGenerator生成固定种子的测试数据，先写入现有数据，再按批次调用被测函数，
+统计吞吐量、每个批次的p50/p99延迟以及每条记录执行的SQL语句数量
+
+默认使用sqlite替身数据库，--mysql时使用.env中配置的MySQL(会写入测试数据，请勿用于生产库)
+
+使用方法(在项目根目录运行):
+    python test/benchmark/run.py --users 20000 --clans 5000 --output base.json
+    python test/benchmark/run.py --users 20000 --clans 5000 --compare base.json
+'''
+import json
+import time
+import argparse
+import subprocess
+
+from common import ROOT, setup_env
+setup_env()
+
+from app.core import EnvConfig
+from app.db import (
+    DatabaseConnection,
+    update_user_data,
+    update_clan_data,
+    bulk_update_user_data,
+    bulk_update_clan_data
+)
+from app.db.cache import user_cache, clan_cache
+
+from standin import StandinPool
+from payloads import PayloadGenerator
+
+FUNCTIONS = {
+    'update_user_data': ('user', update_user_data),
+    'bulk_update_user_data': ('user', bulk_update_user_data),
+    'update_clan_data': ('clan', update_clan_data),
+    'bulk_update_clan_data': ('clan', bulk_update_clan_data)
+}
+
+
+class CountingCursor:
+    def __init__(self, cur, pool: 'CountingPool'):
+        self.__cur = cur
+        self.__pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self.__cur, name)
+
+    def execute(self, sql, params=None):
+        self.__pool.statements += 1
+        return self.__cur.execute(sql, params)
+
+    def executemany(self, sql, seq_params):
+        self.__pool.statements += 1
+        return self.__cur.executemany(sql, seq_params)
+
+
+class CountingConnection:
+    def __init__(self, conn, pool: 'CountingPool'):
+        self.__conn = conn
+        self.__pool = pool
+
+    def __getattr__(self, name):
+        return getattr(self.__conn, name)
+
+    def cursor(self, *args):
+        return CountingCursor(self.__conn.cursor(*args), self.__pool)
+
+
+class CountingPool:
+    "记录执行的语句数量的连接池"
+    def __init__(self, pool):
+        self.pool = pool
+        self.statements = 0
+
+    def connection(self):
+        return CountingConnection(self.pool.connection(), self)
+
+    def close(self):
+        self.pool.close()
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+def percentile(values: list, percent: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+def open_pool(args) -> CountingPool:
+    if args.mysql:
+        DatabaseConnection.init_pool()
+        pool = DatabaseConnection._pool
+    else:
+        pool = StandinPool(EnvConfig.get_config().DB_NAME_MAIN)
+    pool = CountingPool(pool)
+    DatabaseConnection._pool = pool
+    return pool
+
+def build_payloads(args) -> dict:
+    generator = PayloadGenerator(args.seed)
+    return {
+        'user': generator.user_datas(
+            args.users,
+            existing=args.existing,
+            renames=args.renames,
+            inactive=args.inactive,
+            played=args.played,
+            clan_changes=args.clan_changes
+        ),
+        'clan': generator.clan_datas(
+            args.clans,
+            existing=args.existing,
+            changed=args.played,
+            inactive=args.inactive
+        )
+    }
+
+def run(name: str, payloads: dict, args) -> dict:
+    kind, func = FUNCTIONS[name]
+    seed_datas, datas = payloads[kind]
+    pool = open_pool(args)
+    user_cache.clear()
+    clan_cache.clear()
+    # 现有数据统一通过批量函数写入，保证各个被测函数的初始状态相同
+    seed_func = bulk_update_user_data if kind == 'user' else bulk_update_clan_data
+    for i in range(0, len(seed_datas), args.batch_size):
+        result = seed_func(seed_datas[i:i + args.batch_size])
+        assert result['code'] == 1000, result
+    user_cache.clear()
+    clan_cache.clear()
+    pool.statements = 0
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(datas), args.batch_size):
+        batch_start = time.perf_counter()
+        result = func(datas[i:i + args.batch_size])
+        latencies.append(time.perf_counter() - batch_start)
+        assert result['code'] == 1000, result
+    elapsed = time.perf_counter() - start
+    statements = pool.statements
+    pool.close()
+    DatabaseConnection._pool = None
+    return {
+        'records': len(datas),
+        'batches': len(latencies),
+        'seconds': round(elapsed, 4),
+        'records_per_second': round(len(datas) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'statements': statements,
+        'statements_per_record': round(statements / len(datas), 4)
+    }
+
+def print_results(results: dict, baseline: dict = None):
+    print(f"{'function':24}{'records/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'stmt/rec':>10}")
+    for name, result in results.items():
+        line = (
+            f"{name:24}{result['records_per_second']:>12}{result['p50_ms']:>10}"
+            f"{result['p99_ms']:>10}{result['statements_per_record']:>10}"
+        )
+        if baseline and name in baseline:
+            base = baseline[name]
+            speedup = result['records_per_second'] / base['records_per_second']
+            line += f"  x{speedup:.2f} vs {base['statements_per_record']} stmt/rec"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--clans', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=500, help='每次调用传入的记录数量')
+    parser.add_argument('--existing', type=float, default=0.7, help='已经存在于数据库中的记录比例')
+    parser.add_argument('--renames', type=float, default=0.05, help='现有用户中改名的比例')
+    parser.add_argument('--inactive', type=float, default=0.05, help='现有记录中变为不活跃的比例')
+    parser.add_argument('--played', type=float, default=0.3, help='现有记录中数据变化的比例')
+    parser.add_argument('--clan-changes', type=float, default=0.05, help='现有用户中工会变化的比例')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--functions', type=str, default=','.join(FUNCTIONS))
+    parser.add_argument('--mysql', action='store_true', help='使用.env中配置的MySQL')
+    parser.add_argument('--output', type=str, default=None, help='将结果保存为JSON文件')
+    parser.add_argument('--compare', type=str, default=None, help='与之前保存的JSON结果对比')
+    args = parser.parse_args()
+
+    payloads = build_payloads(args)
+    results = {}
+    for name in args.functions.split(','):
+        results[name] = run(name, payloads, args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print(f'users: {args.users}  clans: {args.clans}  batch size: {args.batch_size}  seed: {args.seed}')
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'commit': get_commit(),
+                'time': int(time.time()),
+                'backend': 'mysql' if args.mysql else 'standin',
+                'args': vars(args),
+                'results': results
+            }, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+'''基于sqlite3的MySQL替身
+
+用于在没有MySQL的环境中运行基准测试，提供与PooledDB相同的connection()接口，
+并将app/db中用到的MySQL语法转换为sqlite语法执行，同时记录执行过的语句
+'''
+import re
+import sqlite3
+import time
+
+SCHEMA = '''
+CREATE TABLE user_basic (
+    account_id INTEGER PRIMARY KEY, region_id INTEGER NOT NULL, username TEXT NOT NULL,
+    updated_at INTEGER NOT NULL DEFAULT (now_ts())
+);
+CREATE TABLE user_info (
+    account_id INTEGER PRIMARY KEY, is_active INTEGER NOT NULL DEFAULT 0, active_level INTEGER NOT NULL DEFAULT 0,
+    is_public INTEGER NOT NULL DEFAULT 0, total_battles INTEGER NOT NULL DEFAULT 0, last_battle_at INTEGER NULL,
+    updated_at INTEGER NOT NULL DEFAULT (now_ts())
+);
+CREATE TABLE user_ships (
+    account_id INTEGER PRIMARY KEY, updated_at INTEGER NOT NULL DEFAULT (now_ts())
+);
+CREATE TABLE user_clan (
+    account_id INTEGER PRIMARY KEY, clan_id INTEGER NULL, updated_at INTEGER NOT NULL DEFAULT (now_ts())
+);
+CREATE TABLE user_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, account_id INTEGER NOT NULL, username TEXT NOT NULL,
+    start_time INTEGER NULL, end_time INTEGER NULL
+);
+CREATE TABLE clan_basic (
+    clan_id INTEGER PRIMARY KEY, region_id INTEGER NOT NULL, tag TEXT NOT NULL, league INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL DEFAULT (now_ts())
+);
+CREATE TABLE clan_info (
+    clan_id INTEGER PRIMARY KEY, is_active INTEGER NOT NULL DEFAULT 0, season INTEGER NOT NULL DEFAULT 0,
+    public_rating INTEGER NOT NULL DEFAULT 1100, league INTEGER NOT NULL DEFAULT 4, division INTEGER NOT NULL DEFAULT 2,
+    division_rating INTEGER NOT NULL DEFAULT 0, last_battle_at INTEGER NULL,
+    updated_at INTEGER NOT NULL DEFAULT (now_ts())
+);
+CREATE TABLE clan_users (
+    clan_id INTEGER PRIMARY KEY, hash_value TEXT NULL, user_data TEXT NULL,
+    updated_at INTEGER NOT NULL DEFAULT (now_ts())
+);
+CREATE TABLE clan_season (
+    clan_id INTEGER PRIMARY KEY, updated_at INTEGER NOT NULL DEFAULT (now_ts())
+);
+'''
+
+# 模拟 ON UPDATE CURRENT_TIMESTAMP
+ON_UPDATE_COLUMNS = {
+    'user_basic': ['region_id', 'username'],
+    'user_info': ['is_active', 'active_level', 'is_public', 'total_battles', 'last_battle_at'],
+    'user_clan': ['clan_id'],
+    'clan_basic': ['region_id', 'tag', 'league'],
+    'clan_info': ['is_active', 'season', 'public_rating', 'league', 'division', 'division_rating', 'last_battle_at'],
+    'clan_users': ['hash_value', 'user_data']
+}
+
+
+def translate(sql: str, db_name: str) -> str:
+    "将MySQL语句转换为sqlite语句"
+    sql = sql.replace(f'{db_name}.', '')
+    sql = sql.replace('%s', '?')
+    # 时间统一以时间戳形式保存
+    sql = sql.replace('FROM_UNIXTIME(', '(').replace('UNIX_TIMESTAMP(', '(')
+    sql = sql.replace('CURRENT_TIMESTAMP', 'now_ts()')
+    sql = re.sub(r'\bIF\(', 'IIF(', sql)
+    sql = sql.replace('<=>', 'IS')
+    sql = sql.replace(') IN ((', ') IN (VALUES (')
+    match = re.search(r'ON DUPLICATE KEY UPDATE (.*?);?\s*$', sql, re.S)
+    if match:
+        sets = re.sub(r'VALUES\((\w+)\)', r'excluded.\1', match.group(1))
+        sql = sql[:match.start()] + 'ON CONFLICT DO UPDATE SET ' + sets + ';'
+    match = re.match(
+        r'UPDATE (\w+) AS t JOIN \((.*)\) AS v ON (t\.\w+ = v\.\w+(?: AND t\.\w+ = v\.\w+)*) SET (.*?)(?: WHERE (.*?))?;?\s*$',
+        sql, re.S
+    )
+    if match:
+        table, derived, on, sets, where = match.groups()
+        # sqlite对UNION ALL的数量有限制，改为VALUES派生表
+        rows = derived.split(' UNION ALL ')
+        columns = re.findall(r'\? AS (\w+)', rows[0])
+        values = ', '.join(['(' + ', '.join(['?'] * len(columns)) + ')'] * len(rows))
+        derived = 'SELECT ' + ', '.join(
+            f'column{i + 1} AS {column}' for i, column in enumerate(columns)
+        ) + f' FROM (VALUES {values})'
+        sets = re.sub(r'(^|, )t\.(\w+) =', r'\1\2 =', sets).replace('t.', f'{table}.')
+        on = on.replace('t.', f'{table}.')
+        if where:
+            on += ' AND (' + where.replace('t.', f'{table}.') + ')'
+        sql = f'UPDATE {table} SET {sets} FROM ({derived}) AS v WHERE {on};'
+    return sql
+
+
+class StandinCursor:
+    def __init__(self, conn: 'StandinConnection'):
+        self.conn = conn
+        self.cur = conn.pool.db.cursor()
+        self.rowcount = 0
+
+    def execute(self, sql: str, params: list = None):
+        self.conn.pool.statements += 1
+        params = [int(p) if isinstance(p, bool) else p for p in (params or [])]
+        self.cur.execute(translate(sql, self.conn.pool.db_name), params)
+        self.rowcount = self.cur.rowcount
+        return self.rowcount
+
+    def executemany(self, sql: str, seq_params: list):
+        for params in seq_params:
+            self.execute(sql, params)
+
+    def _to_dict(self, row):
+        if row is None:
+            return None
+        return {desc[0]: value for desc, value in zip(self.cur.description, row)}
+
+    def fetchone(self):
+        return self._to_dict(self.cur.fetchone())
+
+    def fetchall(self):
+        return [self._to_dict(row) for row in self.cur.fetchall()]
+
+    def close(self):
+        self.cur.close()
+
+
+class StandinConnection:
+    def __init__(self, pool: 'StandinPool'):
+        self.pool = pool
+
+    def begin(self):
+        self.pool.db.execute('BEGIN')
+
+    def commit(self):
+        self.pool.db.execute('COMMIT')
+
+    def rollback(self):
+        if self.pool.db.in_transaction:
+            self.pool.db.execute('ROLLBACK')
+
+    def cursor(self, cursor_class=None):
+        return StandinCursor(self)
+
+    def close(self):
+        pass
+
+
+class StandinPool:
+    '''替代PooledDB的连接池
+
+    statements记录所有连接累计执行的语句数量
+    '''
+    def __init__(self, db_name: str, path: str = ':memory:'):
+        self.db_name = db_name
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.create_function('now_ts', 0, lambda: int(time.time()))
+        self.db.executescript(SCHEMA)
+        for table, columns in ON_UPDATE_COLUMNS.items():
+            condition = ' OR '.join(f'NEW.{column} IS NOT OLD.{column}' for column in columns)
+            self.db.execute(
+                f'CREATE TRIGGER {table}_on_update AFTER UPDATE ON {table} '
+                f'WHEN NEW.updated_at IS OLD.updated_at AND ({condition}) '
+                f'BEGIN UPDATE {table} SET updated_at = now_ts() WHERE rowid = NEW.rowid; END'
+            )
+        self.statements = 0
+
+    def connection(self):
+        return StandinConnection(self)
+
+    def close(self):
+        self.db.close()
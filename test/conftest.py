@@ -0,0 +1,62 @@
+'''pytest的公共配置
+
+测试使用test/benchmark中的sqlite替身数据库和测试数据，不需要MySQL和RabbitMQ，在项目根目录运行:
+    python -m pytest -q test
+'''
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark'))
+
+from common import setup_env
+# 测试中写入的错误日志、死信和变更事件不能进入.env配置的日志目录或项目目录
+os.environ['LOG_PATH'] = tempfile.mkdtemp(prefix='kokomi_test_')
+setup_env()
+# 逐条写入每次都会刷新updated_at，批量写入也需要每次刷新才能对比结果
+os.environ.setdefault('USER_TOUCH_INTERVAL', '0')
+
+import pytest
+
+from app.core import EnvConfig
+from app.db import DatabaseConnection
+from app.db.cache import user_cache, clan_cache
+from app.utils import TimeFormat
+from standin import StandinPool
+
+
+class Clock:
+    "固定的当前时间，同时用于TimeFormat.get_current_timestamp和替身数据库的CURRENT_TIMESTAMP"
+    def __init__(self, now: int = 1700000000):
+        self.now = now
+
+    def advance(self, seconds: int):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(TimeFormat, 'get_current_timestamp', staticmethod(lambda: clock.now))
+    return clock
+
+@pytest.fixture
+def new_pool(monkeypatch, clock):
+    '''返回创建替身连接池的函数，创建的连接池使用clock的时间，测试结束后关闭
+
+    DatabaseConnection使用最后一次创建的连接池，worker缓存在测试开始时清空
+    '''
+    pools = []
+    user_cache.clear()
+    clan_cache.clear()
+
+    def create() -> StandinPool:
+        pool = StandinPool(EnvConfig.get_config().DB_NAME_MAIN)
+        pool.db.create_function('now_ts', 0, lambda: clock.now)
+        monkeypatch.setattr(DatabaseConnection, '_pool', pool)
+        pools.append(pool)
+        return pool
+
+    yield create
+    for pool in pools:
+        pool.close()
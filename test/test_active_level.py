@@ -0,0 +1,48 @@
+'''active_level的计算
+
+批量版本get_active_levels和数据库中的decay_active_level都需要与逐条版本CommonUtils.get_active_level的分级一致
+'''
+import random
+
+import pytest
+
+from app.db.decay import decay_active_level
+from app.utils import CommonUtils
+from active_level import build_rows, check
+
+NOW = 1700000000
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_get_active_levels_match_per_row(seed):
+    check(build_rows(5000, NOW, seed), NOW)
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_decay_matches_per_row(new_pool, clock, chunk_size):
+    "只有活跃且等级由时间决定(2-8)的用户会更新，并且等级只会升高"
+    pool = new_pool()
+    rnd = random.Random(chunk_size)
+    rows = [
+        (account_id, rnd.randint(0, 1), rnd.randint(0, 9), 1, 100, rnd.choice([None, clock.now - rnd.randint(0, 400 * 24 * 60 * 60)]))
+        for account_id in range(1, 301)
+    ]
+    pool.db.executemany(
+        'INSERT INTO user_info (account_id, is_active, active_level, is_public, total_battles, last_battle_at) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        rows
+    )
+    pool.db.commit()
+    clock.advance(30 * 24 * 60 * 60)
+
+    result = decay_active_level(chunk_size, 0)
+    assert result['code'] == 1000, result
+
+    expected = {}
+    for account_id, is_active, active_level, is_public, total_battles, last_battle_at in rows:
+        if is_active and 2 <= active_level <= 8 and last_battle_at is not None:
+            active_level = max(active_level, CommonUtils.get_active_level(is_public, total_battles, last_battle_at))
+        expected[account_id] = active_level
+    actual = dict(pool.db.execute('SELECT account_id, active_level FROM user_info').fetchall())
+    assert actual == expected
+    assert result['data']['updated'] == sum(1 for account_id, *row in rows if expected[account_id] != row[1])
+    assert result['data']['end_id'] == 300
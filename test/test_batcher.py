@@ -0,0 +1,115 @@
+'''WriteBatcher的失败和重试
+
+某一块写入失败后从该块继续，acks_late重新投递时从头重新写入，以及合并的批次中部分数据转入死信
+'''
+import threading
+
+import pytest
+
+from app.db import batcher as batcher_module, recovery as recovery_module
+from app.db.batcher import WriteBatcher
+from app.db.bulk import bulk_update_data, write_user_datas
+from app.db.recovery import RecordIsolator
+from app.response import JSONResponse
+from payloads import PayloadGenerator
+
+NOW = 1700000000
+CHUNK_SIZE = 3
+
+
+class FailingWriter:
+    "记录每次写入的account_id，fail_chunk对应的块批量写入和逐条写入都返回临时错误"
+    def __init__(self, monkeypatch, fail_chunk: int | None):
+        self.fail_chunk = fail_chunk
+        self.writes = []
+
+        def bulk_update(user_datas, clan_datas):
+            if self.__is_failing(user_datas):
+                return JSONResponse.get_error_response(3002, 'OperationalError', 'test')
+            self.writes.append([data['account_id'] for data in user_datas])
+            return bulk_update_data(user_datas, clan_datas)
+
+        def isolated_write(cls, user_datas, clan_datas, attempts=0, failed_records=None):
+            assert self.__is_failing(user_datas)
+            return JSONResponse.get_error_response(3002, 'OperationalError', 'test')
+
+        monkeypatch.setattr(batcher_module, 'bulk_update_data', bulk_update)
+        monkeypatch.setattr(RecordIsolator, 'write', classmethod(isolated_write))
+
+    def __is_failing(self, user_datas: list) -> bool:
+        account_ids = [data['account_id'] for data in user_datas]
+        return self.fail_chunk is not None and account_ids[0] == self.fail_chunk * CHUNK_SIZE + 1
+
+
+def get_users(pool) -> dict:
+    return dict(pool.db.execute('SELECT account_id, username FROM user_basic').fetchall())
+
+@pytest.fixture
+def user_datas():
+    generator = PayloadGenerator(0, now=NOW)
+    return [generator.user(account_id, f'user_{account_id}') for account_id in range(1, 11)]
+
+
+def test_resume_from_failed_chunk(new_pool, monkeypatch, user_datas):
+    pool = new_pool()
+    batcher = WriteBatcher(1000, 0)
+
+    writer = FailingWriter(monkeypatch, 2)
+    result, failed_chunk = batcher.submit_chunks(user_datas=user_datas, chunk_size=CHUNK_SIZE)
+    assert result['code'] == 3002
+    assert failed_chunk == 2
+    assert writer.writes == [[1, 2, 3], [4, 5, 6]]
+    # 失败的块及之后的块都没有写入
+    assert sorted(get_users(pool)) == [1, 2, 3, 4, 5, 6]
+
+    # 任务重试时从失败的块开始，已经提交的块不会重复写入
+    writer = FailingWriter(monkeypatch, None)
+    result, failed_chunk = batcher.submit_chunks(user_datas=user_datas, chunk_size=CHUNK_SIZE, start_chunk=2)
+    assert result['code'] == 1000
+    assert failed_chunk is None
+    assert writer.writes == [[7, 8, 9], [10]]
+    assert get_users(pool) == {account_id: f'user_{account_id}' for account_id in range(1, 11)}
+
+def test_redelivery_rewrites_from_message_start(new_pool, monkeypatch, user_datas):
+    "进度不会持久化，acks_late重新投递的消息从start_chunk重新写入，重复写入的结果不变"
+    pool = new_pool()
+    batcher = WriteBatcher(1000, 0)
+    result, failed_chunk = batcher.submit_chunks(user_datas=user_datas, chunk_size=CHUNK_SIZE)
+    assert (result['code'], failed_chunk) == (1000, None)
+    before = pool.db.execute('SELECT * FROM user_basic ORDER BY account_id').fetchall()
+
+    writer = FailingWriter(monkeypatch, None)
+    result, failed_chunk = batcher.submit_chunks(user_datas=user_datas, chunk_size=CHUNK_SIZE)
+    assert (result['code'], failed_chunk) == (1000, None)
+    assert writer.writes == [[1, 2, 3], [4, 5, 6], [7, 8, 9], [10]]
+    assert pool.db.execute('SELECT * FROM user_basic ORDER BY account_id').fetchall() == before
+
+def test_dead_letters_only_fail_owning_task(new_pool, monkeypatch, user_datas):
+    "两个任务合并到同一批次，逐条写入时只有提交了死信数据的任务收到部分写入的返回值"
+    pool = new_pool()
+    batcher = WriteBatcher(3, 5000)
+
+    def bulk_update(user_datas, clan_datas):
+        return JSONResponse.get_error_response(3002, 'OperationalError', 'test')
+
+    def write_user(cur, user_datas):
+        if user_datas[0]['account_id'] == 3:
+            raise ValueError('bad record')
+        return write_user_datas(cur, user_datas)
+
+    monkeypatch.setattr(batcher_module, 'bulk_update_data', bulk_update)
+    monkeypatch.setattr(recovery_module, 'write_user_datas', write_user)
+
+    results = {}
+    leader = threading.Thread(target=lambda: results.update(leader=batcher.submit(user_datas[:2])))
+    leader.start()
+    # 第二个任务使批次达到3条，由第一个任务写入
+    results['follower'] = batcher.submit(user_datas[2:3])
+    leader.join(5)
+
+    assert batcher.get_stats()['batches'] == 1
+    assert results['leader']['code'] == 1000
+    assert RecordIsolator.is_partial(results['follower'])
+    assert results['follower']['code'] == 5000
+    assert (results['follower']['data']['records'], results['follower']['data']['dead_letters']) == (1, 1)
+    assert sorted(get_users(pool)) == [1, 2]
@@ -0,0 +1,216 @@
+'''逐条写入(update_user_data, update_clan_data)与批量写入(bulk_update_*)的结果对比
+
+两个替身数据库先写入相同的现有数据，再分别用两种方式写入同一批数据，之后所有数据表的内容需要完全一致
+'''
+import re
+import copy
+
+import pymysql
+import pytest
+
+from app.core import EnvConfig
+from app.db import bulk as bulk_module
+from app.db import DatabaseConnection, update_user_data, update_clan_data, bulk_update_user_data, bulk_update_clan_data
+from app.db.bulk import bulk_update_data
+from app.db.cache import user_cache, clan_cache
+from payloads import PayloadGenerator
+from standin import StandinConnection, StandinCursor
+
+# 同时也是批量写入时的表顺序
+TABLES = [
+    'user_basic', 'user_info', 'user_ships', 'user_clan', 'user_history',
+    'clan_basic', 'clan_info', 'clan_users', 'clan_season'
+]
+NOW = 1700000000
+
+
+def dump(pool) -> dict:
+    "所有数据表的内容，user_history的自增id与写入顺序有关，不参与对比"
+    result = {}
+    for table in TABLES:
+        cur = pool.db.execute(f'SELECT * FROM {table}')
+        columns = [desc[0] for desc in cur.description]
+        rows = [tuple(value for column, value in zip(columns, row) if column != 'id') for row in cur.fetchall()]
+        result[table] = sorted(rows, key=repr)
+    return result
+
+def write(pool, func, datas: list):
+    DatabaseConnection._pool = pool
+    for data in datas:
+        result = func(copy.deepcopy(data))
+        assert result['code'] == 1000, result
+
+def assert_same(per_row, bulk):
+    expected = dump(per_row)
+    actual = dump(bulk)
+    for table in TABLES:
+        assert actual[table] == expected[table], table
+
+def run_users(new_pool, clock, rounds: list):
+    "rounds为每一轮写入的用户数据，每轮之间时间前进1000秒"
+    per_row = new_pool()
+    bulk = new_pool()
+    for datas in rounds:
+        clock.advance(1000)
+        write(per_row, update_user_data, datas)
+        write(bulk, bulk_update_user_data, [datas])
+        assert_same(per_row, bulk)
+
+def run_clans(new_pool, clock, rounds: list):
+    per_row = new_pool()
+    bulk = new_pool()
+    for datas in rounds:
+        clock.advance(1000)
+        write(per_row, update_clan_data, datas)
+        write(bulk, bulk_update_clan_data, [datas])
+        assert_same(per_row, bulk)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_user_datas_match_per_row(new_pool, clock, seed):
+    seed_datas, datas = PayloadGenerator(seed, now=NOW).user_datas(300, clans=20)
+    run_users(new_pool, clock, [seed_datas, datas])
+
+@pytest.mark.parametrize('seed', range(4))
+def test_clan_datas_match_per_row(new_pool, clock, seed):
+    seed_datas, datas = PayloadGenerator(seed, now=NOW).clan_datas(300)
+    run_clans(new_pool, clock, [seed_datas, datas])
+
+def test_user_edge_cases_match_per_row(new_pool, clock):
+    "同一批次内重复的用户、改名、退出工会、不活跃以及空的部分"
+    generator = PayloadGenerator(0, now=NOW)
+    clan = generator.clan_ref(10)
+    first = [
+        generator.user(1, 'a', clan=clan),
+        generator.user(2, 'b', clan=clan),
+        generator.user(3, 'c', is_active=False)
+    ]
+    second = [
+        generator.user(1, 'a2', clan=clan),
+        generator.user(1, 'a2', total_battles=1001, last_battle_time=NOW, clan=clan),
+        generator.user(2, 'b', total_battles=1002, last_battle_time=NOW, clan=clan),
+        generator.user(2, 'b', is_active=False),
+        {'region_id': 1, 'account_id': 3, 'basic': None, 'info': {}, 'clan': None},
+        generator.user(4, 'd', clan=generator.clan_ref(11))
+    ]
+    run_users(new_pool, clock, [first, second, second])
+
+def test_clan_edge_cases_match_per_row(new_pool, clock):
+    "同一批次内重复的工会、变为不活跃以及空的部分"
+    generator = PayloadGenerator(0, now=NOW)
+    first = [generator.clan(1), generator.clan(2), generator.clan(3)]
+    second = [
+        generator.clan(1, public_rating=1300, last_battle_at=NOW),
+        generator.clan(1, is_active=False),
+        generator.clan(2, is_active=False),
+        {'region_id': 1, 'clan_id': 3, 'basic': None, 'info': None},
+        generator.clan(4)
+    ]
+    run_clans(new_pool, clock, [first, second, second])
+
+def test_single_clan_begin_error_is_retried(new_pool, clock, monkeypatch):
+    "传入单个工会时，begin抛出的死锁错误需要由DeadlockRetry重试，其他OperationalError返回3002"
+    pool = new_pool()
+    begin = StandinConnection.begin
+    errors = [1213, 2006]
+
+    def failing_begin(self):
+        if errors:
+            raise pymysql.err.OperationalError(errors.pop(0), 'test')
+        begin(self)
+
+    monkeypatch.setattr(StandinConnection, 'begin', failing_begin)
+    monkeypatch.setattr(EnvConfig.get_config(), 'DEADLOCK_RETRY_DELAY', 0)
+    data = PayloadGenerator(0, now=NOW).clan(1)
+    result = bulk_update_clan_data(data)
+    assert result['code'] == 3002, result
+    assert errors == []
+
+    result = bulk_update_clan_data(data)
+    assert result['code'] == 1000, result
+    assert pool.db.execute('SELECT clan_id FROM clan_basic').fetchall() == [(1,)]
+
+def test_cached_clans_are_not_fetched(new_pool, clock, monkeypatch):
+    "已知存在的工会不再查询，其余的用户数据照常在事务内重新查询"
+    new_pool()
+    generator = PayloadGenerator(0, now=NOW)
+    first = [generator.user(1, 'a', clan=generator.clan_ref(10))]
+    assert bulk_update_user_data(first)['code'] == 1000
+
+    fetched = []
+    fetch_clans = bulk_module._fetch_clans
+    monkeypatch.setattr(bulk_module, '_fetch_clans', lambda cur, keys: fetched.extend(keys) or fetch_clans(cur, keys))
+    clock.advance(1000)
+    second = [
+        generator.user(1, 'a2', clan=generator.clan_ref(10)),
+        generator.user(2, 'b', clan=generator.clan_ref(11))
+    ]
+    assert bulk_update_user_data(second)['code'] == 1000
+    assert fetched == [(1, 11)]
+
+def merged_rounds(generator) -> list:
+    "用户和工会数据中包含相同的工会，包括两者都新增的工会、同一批次内更新后变为不活跃的工会，第二轮有用户改名"
+    first = (
+        [generator.user(i, f'u{i}', clan=generator.clan_ref(i % 4 + 1)) for i in range(1, 9)],
+        [generator.clan(1), generator.clan(2)]
+    )
+    second = (
+        [
+            generator.user(i, f'v{i}' if i < 3 else f'u{i}', total_battles=1001, last_battle_time=NOW, clan=generator.clan_ref(i % 6 + 1))
+            for i in range(1, 13)
+        ],
+        [
+            generator.clan(1, public_rating=1300, last_battle_at=NOW),
+            generator.clan(1, is_active=False),
+            generator.clan(2, is_active=False),
+            generator.clan(3, public_rating=1250),
+            generator.clan(6),
+            generator.clan(7)
+        ]
+    )
+    return [first, second, second]
+
+def test_merged_batch_matches_sequential_writes(new_pool, clock):
+    "bulk_update_data的结果与先写入用户数据、再写入工会数据一致"
+    sequential = new_pool()
+    merged = new_pool()
+    for user_datas, clan_datas in merged_rounds(PayloadGenerator(0, now=NOW)):
+        clock.advance(1000)
+        DatabaseConnection._pool = sequential
+        user_cache.clear()
+        clan_cache.clear()
+        assert bulk_update_user_data(copy.deepcopy(user_datas))['code'] == 1000
+        assert bulk_update_clan_data(copy.deepcopy(clan_datas))['code'] == 1000
+        DatabaseConnection._pool = merged
+        user_cache.clear()
+        clan_cache.clear()
+        assert bulk_update_data(copy.deepcopy(user_datas), copy.deepcopy(clan_datas))['code'] == 1000
+        assert_same(sequential, merged)
+
+def test_merged_batch_writes_each_table_once(new_pool, clock, monkeypatch):
+    "所有表按固定顺序写入，每个表的语句连续执行，现有的行只由一条语句更新"
+    new_pool()
+    rounds = merged_rounds(PayloadGenerator(0, now=NOW))
+    assert bulk_update_data(*rounds[0])['code'] == 1000
+    statements = []
+    execute = StandinCursor.execute
+
+    def record(self, sql, params=None):
+        statements.append(sql)
+        return execute(self, sql, params)
+
+    monkeypatch.setattr(StandinCursor, 'execute', record)
+    clock.advance(1000)
+    assert bulk_update_data(*rounds[1])['code'] == 1000
+
+    writes = []
+    for sql in statements:
+        match = re.match(r'(INSERT INTO|UPDATE) \w+\.(\w+)', sql)
+        if match:
+            is_update = match.group(1) == 'UPDATE' or 'ON DUPLICATE KEY UPDATE' in sql
+            writes.append((match.group(2), is_update))
+    tables = [table for table, _ in writes]
+    assert set(tables) == set(TABLES)
+    assert tables == sorted(tables, key=TABLES.index)
+    for table in TABLES:
+        assert sum(1 for name, is_update in writes if name == table and is_update) <= 1, table
@@ -0,0 +1,42 @@
+'''TTLCache在多个操作系统线程中共享
+
+backfill的写入线程共享同一个缓存实例，一个线程读写缓存时其他线程的操作需要等待
+'''
+import threading
+
+from app.utils import TTLCache
+
+
+class BlockingKey:
+    "计算哈希时阻塞，直到released被设置，用于让一个线程停在缓存操作中间"
+    def __init__(self):
+        self.entered = threading.Event()
+        self.released = threading.Event()
+
+    def __hash__(self):
+        self.entered.set()
+        assert self.released.wait(5)
+        return 0
+
+
+def test_operations_wait_for_other_threads():
+    cache = TTLCache(2, 60)
+    key = BlockingKey()
+    reader = threading.Thread(target=cache.get, args=(key,))
+    reader.start()
+    assert key.entered.wait(5)
+
+    writer = threading.Thread(target=cache.set_many, args=({1: {'clan_id': 1}, 2: {'clan_id': 2}, 3: {'clan_id': 3}},))
+    writer.start()
+    writer.join(0.2)
+    # get还没有完成，set_many不会同时修改缓存
+    assert writer.is_alive()
+    assert len(cache) == 0
+
+    key.released.set()
+    reader.join(5)
+    writer.join(5)
+    assert cache.get_many([1, 2, 3]) == {2: {'clan_id': 2}, 3: {'clan_id': 3}}
+    assert cache.get_stats() == {
+        'hits': 2, 'misses': 2, 'evictions': 1, 'expirations': 0, 'invalidations': 0, 'size': 2
+    }
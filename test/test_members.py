@@ -0,0 +1,104 @@
+'''sync_clan_members的成员同步
+
+用户和工会先通过批量写入创建，再同步成员列表，检查clan_users和user_clan的内容
+'''
+import json
+
+import pytest
+
+from app.db import bulk_update_user_data, bulk_update_clan_data, sync_clan_members
+from payloads import PayloadGenerator
+
+NOW = 1700000000
+
+
+@pytest.fixture
+def pool(new_pool):
+    "用户1-6不属于任何工会，工会100和200已经存在"
+    pool = new_pool()
+    generator = PayloadGenerator(0, now=NOW)
+    assert bulk_update_user_data([generator.user(account_id, f'u{account_id}') for account_id in range(1, 7)])['code'] == 1000
+    assert bulk_update_clan_data([generator.clan(100), generator.clan(200)])['code'] == 1000
+    return pool
+
+def sync(*rosters) -> dict:
+    result = sync_clan_members([
+        {'region_id': 1, 'clan_id': clan_id, 'members': members} for clan_id, members in rosters
+    ])
+    assert result['code'] == 1000, result
+    return result['data']
+
+def get_user_clans(pool) -> dict:
+    return dict(pool.db.execute('SELECT account_id, clan_id FROM user_clan').fetchall())
+
+def get_roster(pool, clan_id: int) -> list | None:
+    row = pool.db.execute('SELECT user_data FROM clan_users WHERE clan_id = ?', [clan_id]).fetchone()
+    return json.loads(row[0]) if row and row[0] else None
+
+
+def test_members_join_and_leave(pool, clock):
+    result = sync((100, [1, 2, 3]))
+    assert (result['joined'], result['left'], result['unchanged']) == (3, 0, 0)
+    assert get_roster(pool, 100) == [1, 2, 3]
+
+    clock.advance(1000)
+    result = sync((100, [2, 3, 4]))
+    assert (result['joined'], result['left']) == (1, 1)
+    assert get_user_clans(pool) == {1: None, 2: 100, 3: 100, 4: 100, 5: None, 6: None}
+    assert get_roster(pool, 100) == [2, 3, 4]
+
+def test_member_moves_between_clans_in_one_batch(pool, clock):
+    sync((100, [1, 2]))
+    clock.advance(1000)
+    result = sync((100, [2]), (200, [1]))
+    assert (result['joined'], result['left']) == (1, 0)
+    assert get_user_clans(pool)[1] == 200
+    assert get_roster(pool, 100) == [2]
+    assert get_roster(pool, 200) == [1]
+
+def test_unknown_accounts_are_not_saved(pool, clock):
+    result = sync((100, [1, 99]))
+    assert (result['joined'], result['unknown']) == (1, 1)
+    assert get_roster(pool, 100) == [1]
+    assert 99 not in get_user_clans(pool)
+
+    # 用户创建后，下一次同步时作为加入处理
+    clock.advance(1000)
+    assert bulk_update_user_data([PayloadGenerator(0, now=NOW).user(99, 'u99')])['code'] == 1000
+    result = sync((100, [1, 99]))
+    assert (result['joined'], result['unknown'], result['unchanged']) == (1, 0, 0)
+    assert get_user_clans(pool)[99] == 100
+    assert get_roster(pool, 100) == [1, 99]
+
+def test_unknown_clan_is_skipped(pool, clock):
+    result = sync((300, [1]))
+    assert (result['unknown_clans'], result['joined']) == (1, 0)
+    assert get_user_clans(pool)[1] is None
+    assert pool.db.execute('SELECT COUNT(*) FROM clan_users WHERE clan_id = 300').fetchone()[0] == 0
+
+    # 之后创建工会时不会与同步写入的clan_users冲突
+    assert bulk_update_clan_data(PayloadGenerator(0, now=NOW).clan(300))['code'] == 1000
+    result = sync((300, [1]))
+    assert (result['unknown_clans'], result['joined']) == (0, 1)
+
+def test_unchanged_roster_is_skipped(pool, clock):
+    sync((100, [1, 2]))
+    clock.advance(1000)
+    statements = pool.statements
+    result = sync((100, [2, 1]))
+    assert (result['unchanged'], result['joined'], result['left']) == (1, 0, 0)
+    # 只有工会、成员列表和成员的user_clan各一次查询，没有写入
+    assert pool.statements - statements == 3
+    assert pool.db.execute('SELECT updated_at FROM clan_users WHERE clan_id = 100').fetchone()[0] == NOW
+
+def test_cleared_user_clan_is_reasserted(pool, clock):
+    "哈希一致但成员的user_clan被update_user_data清空时，重新写入user_clan"
+    sync((100, [1, 2]))
+    clock.advance(1000)
+    assert bulk_update_user_data([PayloadGenerator(0, now=NOW).user(2, 'u2')])['code'] == 1000
+    assert get_user_clans(pool)[2] is None
+
+    result = sync((100, [1, 2]))
+    assert (result['unchanged'], result['joined'], result['left']) == (0, 1, 0)
+    assert get_user_clans(pool) == {1: 100, 2: 100, 3: None, 4: None, 5: None, 6: None}
+    assert get_roster(pool, 100) == [1, 2]
@@ -0,0 +1,100 @@
+'''UpdateMerger对同一批次内重复数据的合并'''
+from app.db.merge import UpdateMerger
+
+NOW = 1700000000
+
+
+def user(account_id: int, nickname: str = None, last_battle_time: int = None, is_active: int = 1, total_battles: int = None, clan: dict = None) -> dict:
+    if is_active:
+        info = {'is_active': 1, 'is_public': 1, 'total_battles': total_battles, 'last_battle_time': last_battle_time}
+    else:
+        info = {'is_active': 0, 'is_public': None, 'total_battles': None, 'last_battle_time': None}
+    return {
+        'region_id': 1,
+        'account_id': account_id,
+        'basic': {'nickname': nickname} if nickname else None,
+        'info': info,
+        'clan': clan
+    }
+
+def clan(clan_id: int, last_battle_at: int = None, public_rating: int = None, is_active: int = 1) -> dict:
+    if is_active:
+        info = {
+            'is_active': 1, 'season_number': 27, 'public_rating': public_rating, 'league': 1,
+            'division': 2, 'division_rating': 50, 'last_battle_at': last_battle_at
+        }
+    else:
+        info = {'is_active': 0}
+    return {'region_id': 1, 'clan_id': clan_id, 'basic': None, 'info': info}
+
+
+def test_latest_update_time_wins():
+    "按last_battle_time从旧到新合并，与到达顺序无关"
+    result = UpdateMerger.merge_user_datas([
+        user(1, 'new', NOW, total_battles=20),
+        user(1, 'old', NOW - 100, total_battles=10),
+        user(2, 'b', NOW)
+    ])
+    assert len(result) == 2
+    assert result[0]['basic'] == {'nickname': 'new'}
+    assert result[0]['info']['total_battles'] == 20
+    assert result[0]['info']['last_battle_time'] == NOW
+
+def test_same_time_uses_arrival_order_and_keeps_fields():
+    "时间相同时以后到达的为准，较新数据中为None的字段保留较旧数据的值"
+    result = UpdateMerger.merge_user_datas([
+        user(1, 'a', NOW, total_battles=10, clan={'id': 5, 'tag': 'A', 'league': 1}),
+        user(1, None, NOW, total_battles=None, clan={'id': None, 'tag': None, 'league': None})
+    ])
+    assert len(result) == 1
+    assert result[0]['basic'] == {'nickname': 'a'}
+    assert result[0]['info']['total_battles'] == 10
+    # clan整体替换
+    assert result[0]['clan'] == {'id': None, 'tag': None, 'league': None}
+
+def test_clans_latest_update_time_wins():
+    result = UpdateMerger.merge_clan_datas([
+        clan(1, NOW, 1300),
+        clan(1, NOW - 100, 1200)
+    ])
+    assert len(result) == 1
+    assert result[0]['info']['public_rating'] == 1300
+    assert result[0]['info']['last_battle_at'] == NOW
+
+def test_deactivation_passes_through_unmerged():
+    "活跃数据之后出现的不活跃数据不合并，按排序后的顺序保留"
+    active = clan(1, NOW, 1300)
+    inactive = clan(1, is_active=0)
+    result = UpdateMerger.merge_clan_datas([active, inactive])
+    assert result == [active, inactive]
+
+    active = user(1, 'a', NOW, total_battles=10)
+    inactive = user(1, is_active=0)
+    result = UpdateMerger.merge_user_datas([inactive, active, inactive])
+    # 第一条不活跃数据没有时间，排在最前面
+    assert result == [inactive, active, inactive]
+
+def test_records_without_time_follow_arrival_order():
+    "没有时间的数据排在之前出现过的最新时间之后，不会被之前到达的旧数据覆盖"
+    result = UpdateMerger.merge_user_datas([
+        user(1, 'old', NOW - 100, total_battles=10),
+        {'region_id': 1, 'account_id': 1, 'basic': {'nickname': 'renamed'}, 'info': None, 'clan': None}
+    ])
+    assert len(result) == 1
+    assert result[0]['basic'] == {'nickname': 'renamed'}
+    assert result[0]['info']['total_battles'] == 10
+
+    # 没有时间的数据之后到达的较新数据仍然覆盖它
+    result = UpdateMerger.merge_user_datas([
+        {'region_id': 1, 'account_id': 1, 'basic': {'nickname': 'first'}, 'info': None, 'clan': None},
+        user(1, 'second', NOW)
+    ])
+    assert result[0]['basic'] == {'nickname': 'second'}
+
+    # 时间为0与没有时间相同，排在之前的数据之后
+    result = UpdateMerger.merge_user_datas([
+        user(1, 'late', NOW, total_battles=10),
+        user(1, 'zero', 0, total_battles=None)
+    ])
+    assert result[0]['basic'] == {'nickname': 'zero'}
+    assert result[0]['info']['total_battles'] == 10
@@ -0,0 +1,51 @@
+'''ShardRouter的任务路由
+
+每个任务路由到的队列都需要有worker订阅：worker通过-Q订阅TASK_QUEUE，并订阅get_queues()返回的分片和通道队列
+'''
+import pytest
+
+from app.core import EnvConfig
+from app.main import celery_app
+from app.utils import ShardRouter, CompactPayload
+import app.tasks
+
+config = EnvConfig.get_config()
+
+
+def get_task_args(name: str) -> list:
+    "每个任务的参数，update任务分别使用单条数据、大批量数据和紧凑格式"
+    if name == 'update_user_data':
+        return [[{'region_id': 1, 'account_id': account_id}] for account_id in (1, 2, 3)] + [
+            [[{'region_id': 1, 'account_id': account_id} for account_id in range(1000)]],
+            [CompactPayload.encode([{'region_id': 1, 'account_id': 1, 'basic': None, 'info': None, 'clan': None}], 'user')]
+        ]
+    if name == 'update_clan_data':
+        return [[{'region_id': 1, 'clan_id': clan_id}] for clan_id in (1, 2, 3)] + [
+            [[{'region_id': 1, 'clan_id': clan_id} for clan_id in range(1000)]]
+        ]
+    if name == 'sync_clan_members':
+        return [[{'region_id': 1, 'clan_id': clan_id, 'members': []}] for clan_id in (1, 2, 3)] + [[[]]]
+    return [[]]
+
+
+@pytest.mark.parametrize('shards', [0, 4])
+@pytest.mark.parametrize('lanes', [False, True])
+def test_every_task_is_routed_to_a_subscribed_queue(monkeypatch, shards, lanes):
+    monkeypatch.setattr(config, 'TASK_SHARDS', shards)
+    monkeypatch.setattr(config, 'TASK_LANES', lanes)
+    subscribed = set(ShardRouter.get_queues()) | {config.TASK_QUEUE}
+    names = [name for name in celery_app.tasks if not name.startswith('celery.')]
+    assert 'sync_clan_members' in names
+    for name in names:
+        for args in get_task_args(name):
+            queue = ShardRouter.route_task(name, args, {}, {})['queue']
+            assert queue in subscribed, (name, args, queue)
+
+def test_sync_clan_members_uses_low_lane(monkeypatch):
+    monkeypatch.setattr(config, 'TASK_SHARDS', 4)
+    monkeypatch.setattr(config, 'TASK_LANES', True)
+    data = {'region_id': 1, 'clan_id': 3, 'members': []}
+    shard = ShardRouter.get_shard(1, 3)
+    assert ShardRouter.route_task('sync_clan_members', [data], {}, {}) == {
+        'queue': f'{config.TASK_QUEUE}.{shard}.low'
+    }